@@ -45,6 +45,20 @@ export interface TechDetectionResult {
   gap_analysis: GapAnalysis
   crawl_time: string
   error: string | null
+  elapsed_ms?: number // Set on batch results
+  cache?: 'hit' | 'miss' | 'revalidated' | 'stale' // Set by the httpx fetcher's result cache
+  signature_version?: string | null // Signature set that produced the detection
+  partial?: boolean // Detection budget ran out before every category was matched
+  skipped_categories?: string[] // Set when partial
+  categories?: string[] // Set when detection was limited to these categories
+}
+
+/**
+ * Optional category filter for /detect and /analyze
+ */
+export interface DetectionFilter {
+  categories?: string[] // Only detect these categories
+  gap_only?: boolean // Only detect the categories gap_analysis looks at (lead scoring)
 }
 
 /**
@@ -65,14 +79,17 @@ export async function isTechDetectorHealthy(): Promise<boolean> {
 /**
  * Detect tech stack for a single URL
  */
-export async function detectTechStackLocal(url: string): Promise<TechDetectionResult> {
+export async function detectTechStackLocal(
+  url: string,
+  filter: DetectionFilter = {}
+): Promise<TechDetectionResult> {
   try {
     const response = await fetch(`${TECH_DETECTOR_URL}/detect`, {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
       },
-      body: JSON.stringify({ url }),
+      body: JSON.stringify({ url, ...filter }),
       signal: AbortSignal.timeout(30000), // 30s timeout
     })
 
@@ -108,54 +125,88 @@ export async function detectTechStackLocal(url: string): Promise<TechDetectionRe
   }
 }
 
+function failedBatchResult(url: string, error: string): TechDetectionResult {
+  return {
+    success: false,
+    url,
+    final_url: null,
+    status_code: null,
+    technologies: [],
+    tech_summary: {
+      total_detected: 0,
+      categories_found: 0,
+      by_category: {},
+      high_confidence_count: 0,
+    },
+    gap_analysis: {
+      detected_categories: [],
+      missing_essential: ['CRM', 'Analytics', 'Email Marketing'],
+      missing_growth: ['Marketing Automation', 'Chat', 'A/B Testing'],
+      opportunities: [],
+      gap_score: 0,
+    },
+    crawl_time: new Date().toISOString(),
+    error,
+  }
+}
+
 /**
- * Detect tech stack for multiple URLs in batch
+ * Detect tech stack for multiple URLs in batch.
+ *
+ * Results are streamed as NDJSON from /detect/batch/stream, so `onResult`
+ * is called for each URL as soon as it finishes (in completion order).
+ * The returned array is in input order once every URL is done.
  */
 export async function detectTechStackBatch(
-  urls: string[]
+  urls: string[],
+  onResult?: (result: TechDetectionResult, index: number) => void
 ): Promise<TechDetectionResult[]> {
+  const results: Array<TechDetectionResult | undefined> = new Array(urls.length)
+
   try {
-    const response = await fetch(`${TECH_DETECTOR_URL}/detect/batch`, {
+    const response = await fetch(`${TECH_DETECTOR_URL}/detect/batch/stream`, {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
       },
       body: JSON.stringify({ urls }),
-      signal: AbortSignal.timeout(60000), // 60s timeout for batch
+      signal: AbortSignal.timeout(320000), // Server deadline is 300s
     })
 
-    if (!response.ok) {
+    if (!response.ok || !response.body) {
       throw new Error(`Tech detector returned ${response.status}`)
     }
 
-    const data = await response.json()
-    return data.results
+    const reader = response.body.getReader()
+    const decoder = new TextDecoder()
+    let buffered = ''
+
+    const handleLine = (line: string) => {
+      if (!line.trim()) return
+      const { index, ...result } = JSON.parse(line) as TechDetectionResult & { index: number }
+      results[index] = result
+      onResult?.(result, index)
+    }
+
+    for (;;) {
+      const { done, value } = await reader.read()
+      if (done) break
+      buffered += decoder.decode(value, { stream: true })
+      const lines = buffered.split('\n')
+      buffered = lines.pop() ?? ''
+      lines.forEach(handleLine)
+    }
+    handleLine(buffered + decoder.decode())
   } catch (error) {
     console.error('[TechDetector] Error in batch detection:', error)
-    // Return failed results for all URLs
-    return urls.map((url) => ({
-      success: false,
-      url,
-      final_url: null,
-      status_code: null,
-      technologies: [],
-      tech_summary: {
-        total_detected: 0,
-        categories_found: 0,
-        by_category: {},
-        high_confidence_count: 0,
-      },
-      gap_analysis: {
-        detected_categories: [],
-        missing_essential: ['CRM', 'Analytics', 'Email Marketing'],
-        missing_growth: ['Marketing Automation', 'Chat', 'A/B Testing'],
-        opportunities: [],
-        gap_score: 0,
-      },
-      crawl_time: new Date().toISOString(),
-      error: error instanceof Error ? error.message : 'Unknown error',
-    }))
+    // Keep streamed results; fail the URLs that never arrived
+    const message = error instanceof Error ? error.message : 'Unknown error'
+    return urls.map((url, index) => results[index] ?? failedBatchResult(url, message))
   }
+
+  return urls.map(
+    (url, index) => results[index] ?? failedBatchResult(url, 'No result returned')
+  )
 }
 
 /**
@@ -163,7 +214,8 @@ export async function detectTechStackBatch(
  */
 export async function analyzeTechFromHtml(
   html: string,
-  headers?: Record<string, string>
+  headers?: Record<string, string>,
+  filter: DetectionFilter = {}
 ): Promise<{
   technologies: DetectedTechnology[]
   tech_summary: TechSummary
@@ -175,7 +227,7 @@ export async function analyzeTechFromHtml(
       headers: {
         'Content-Type': 'application/json',
       },
-      body: JSON.stringify({ html, headers }),
+      body: JSON.stringify({ html, headers, ...filter }),
       signal: AbortSignal.timeout(10000),
     })
 
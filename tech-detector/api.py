@@ -2,147 +2,215 @@
 Flask API server for tech stack detection.
 Exposes endpoints that can be called from the Node.js backend.
 """
+import time
+
+_import_started = time.perf_counter()
+
 import os
 import json
 import tempfile
-from datetime import datetime
-from typing import List, Dict, Optional
+import threading
+from datetime import datetime, timezone
+from typing import List, Dict, Optional, Tuple
 from urllib.parse import urlparse
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
 
-from scrapy.crawler import CrawlerRunner
-from scrapy.utils.project import get_project_settings
-from twisted.internet import reactor, defer
-from twisted.internet.threads import deferToThread
-
-# Import our modules
-from detector import detect_technologies, analyze_tech_gaps, get_tech_summary
-from tech_detector.spiders.tech_spider import TechSpider
+# Import our modules (Scrapy and Twisted are only loaded by get_runner)
+from detector import ANALYSIS_CACHE, REGISTRY, analyze_document, get_engine, resolve_categories
+from engine import MODES
+from executor import ExecutorBusy, pool_status, run_detection
+from jobs import JOB_MAX_URLS, JOB_STORE, JobManager, create_store
+from metrics import CONTENT_TYPE, METRICS
+from profiling import PROFILER, SORT_KEYS
+from responses import compress_response, project, render, render_stream, request_fields
+from snapshots import SNAPSHOTS_ENABLED, get_snapshot_store
+from fetcher import (
+    BATCH_CONCURRENCY,
+    BATCH_DEADLINE_SECONDS,
+    BATCH_PER_HOST_CONCURRENCY,
+    BATCH_STREAM_DEADLINE_SECONDS,
+    BATCH_STREAM_MAX_URLS,
+    failed_result,
+    get_fetcher,
+)
 
 app = Flask(__name__)
 CORS(app)
+app.after_request(compress_response)
+# Poll SIGNATURES_PATH for changes (started once per server process)
+app.before_request(REGISTRY.watch)
+
+# Background jobs, started on first use (see get_job_manager)
+_job_manager: Optional[JobManager] = None
+_job_manager_lock = threading.Lock()
+
+REQUEST_SECONDS = METRICS.histogram(
+    "tech_detector_http_request_seconds",
+    "API request latency by endpoint, until the last streamed byte",
+    ("endpoint",),
+)
+REQUESTS = METRICS.counter(
+    "tech_detector_http_requests_total",
+    "API requests by endpoint, method and status",
+    ("endpoint", "method", "status"),
+)
+REQUESTS_IN_FLIGHT = METRICS.gauge("tech_detector_http_requests_in_flight", "API requests running")
+METRICS.collected(
+    "tech_detector_job_queue_depth",
+    "Background jobs waiting for a job worker",
+    "gauge",
+    lambda: _job_manager.queue_depth if _job_manager is not None else None,
+)
+
+# Default batch backend: "httpx" (async fetcher) or "scrapy" (TechSpider)
+BATCH_BACKENDS = ("httpx", "scrapy")
+BATCH_BACKEND = os.environ.get("BATCH_BACKEND", "httpx")
+
+
+def get_runner():
+    """Return the Scrapy batch runner, importing Scrapy and starting its reactor on first use."""
+    from crawler import get_runner as get_crawler_runner
+    return get_crawler_runner()
+
+
+def fetch_and_detect(
+    url: str,
+    mode: Optional[str] = None,
+    stream: Optional[bool] = None,
+    force_refresh: bool = False,
+    categories: Optional[Tuple[str, ...]] = None
+) -> Dict:
+    """Fetch and detect a single URL on the shared async fetcher."""
+    fetcher = get_fetcher()
+    return fetcher.run(fetcher.fetch_and_detect(
+        url, mode=mode, stream=stream, force_refresh=force_refresh, categories=categories
+    ))
+
+
+def run_batch(
+    urls: List[str],
+    concurrency: int = BATCH_CONCURRENCY,
+    per_host: int = BATCH_PER_HOST_CONCURRENCY,
+    deadline: float = BATCH_DEADLINE_SECONDS,
+    force_refresh: bool = False
+) -> List[Dict]:
+    """Fetch and detect many URLs concurrently on the shared async fetcher."""
+    fetcher = get_fetcher()
+    return fetcher.run(fetcher.run_batch(
+        urls,
+        concurrency=concurrency,
+        per_host=per_host,
+        deadline=deadline,
+        force_refresh=force_refresh,
+    ))
+
+
+def record_snapshots(results: List[Dict]) -> List[Dict]:
+    """
+    Store freshly detected results as domain snapshots.
+
+    Cached results are skipped, and so are partial or category-filtered
+    ones, whose unmatched categories would show up as removed technologies.
+    """
+    if SNAPSHOTS_ENABLED:
+        store = get_snapshot_store()
+        for result in results:
+            if result.get("partial") or "categories" in result:
+                continue
+            if result.get("success") and result.get("cache") not in ("hit", "stale"):
+                store.record(result["url"], result, result.get("signature_version"))
+    return results
 
-# Store for results (in production, use Redis or similar)
-results_store: Dict[str, Dict] = {}
 
+def parse_categories(data: Dict) -> Optional[Tuple[str, ...]]:
+    """
+    Read the optional "categories" and "gap_only" filter of a request body.
 
-def normalize_url(url: str) -> str:
-    """Ensure URL has https scheme."""
-    if not url.startswith(("http://", "https://")):
-        url = f"https://{url}"
-    return url
+    Raises:
+        ValueError: with a message for the client if the filter is invalid
+    """
+    categories = data.get("categories")
+    if categories is not None:
+        if not isinstance(categories, list) or not all(isinstance(c, str) for c in categories):
+            raise ValueError("'categories' must be an array of category names")
+        if not categories:
+            raise ValueError("'categories' must not be empty")
+    return resolve_categories(categories, bool(data.get("gap_only")))
 
 
-def fetch_and_detect(url: str) -> Dict:
+def parse_timestamp(value: str) -> float:
+    """Parse an ISO-8601 timestamp or epoch seconds into epoch seconds (UTC)."""
+    try:
+        return float(value)
+    except ValueError:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return parsed.timestamp()
+
+
+def format_snapshot(snapshot: Dict) -> Dict:
+    """Render snapshot timestamps as ISO strings for API responses."""
+    formatted = dict(snapshot)
+    for field in ("created_at", "last_seen_at"):
+        if field in formatted:
+            formatted[field] = datetime.utcfromtimestamp(formatted[field]).isoformat()
+    return formatted
+
+
+def run_job_batch(urls: List[str]) -> List[Dict]:
+    """Process one chunk of a background job with the default batch backend."""
+    if BATCH_BACKEND == "scrapy":
+        return record_snapshots(get_runner().run(urls, timeout=BATCH_DEADLINE_SECONDS))
+    return record_snapshots(run_batch(urls))
+
+
+def get_job_manager() -> JobManager:
+    """Return the process-wide job manager, starting its workers on first use."""
+    global _job_manager
+    if _job_manager is None:
+        with _job_manager_lock:
+            if _job_manager is None:
+                _job_manager = JobManager(create_store(), run_job_batch)
+    return _job_manager
+
+
+@app.before_request
+def start_job_recovery():
     """
-    Simple synchronous fetch and detect for single URLs.
-    Uses requests instead of Scrapy for simplicity in sync context.
+    Start the job manager when jobs are stored persistently.
+
+    Runs in every server process, so jobs abandoned by a stopped process are
+    resumed without waiting for the next POST /jobs.
     """
-    import requests
+    if JOB_STORE != "memory":
+        get_job_manager()
 
-    normalized_url = normalize_url(url)
-    crawl_time = datetime.utcnow().isoformat()
 
-    try:
-        response = requests.get(
-            normalized_url,
-            timeout=15,
-            headers={
-                "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-                "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
-                "Accept-Language": "en-US,en;q=0.5",
-            },
-            allow_redirects=True,
-            verify=True,
-        )
+@app.before_request
+def start_request_metrics():
+    g.metrics_started = time.perf_counter()
+    REQUESTS_IN_FLIGHT.inc()
 
-        html = response.text
-        headers = dict(response.headers)
-
-        # Detect technologies
-        technologies = detect_technologies(html, headers)
-        gap_analysis = analyze_tech_gaps(technologies)
-        tech_summary = get_tech_summary(technologies)
-
-        return {
-            "success": True,
-            "url": url,
-            "final_url": response.url,
-            "status_code": response.status_code,
-            "technologies": technologies,
-            "tech_summary": tech_summary,
-            "gap_analysis": gap_analysis,
-            "crawl_time": crawl_time,
-            "error": None,
-        }
 
-    except requests.exceptions.Timeout:
-        return {
-            "success": False,
-            "url": url,
-            "final_url": None,
-            "status_code": None,
-            "technologies": [],
-            "tech_summary": {"total_detected": 0, "categories_found": 0, "by_category": {}},
-            "gap_analysis": analyze_tech_gaps([]),
-            "crawl_time": crawl_time,
-            "error": "Request timeout",
-        }
-    except requests.exceptions.SSLError:
-        # Retry without SSL verification
-        try:
-            response = requests.get(
-                normalized_url,
-                timeout=15,
-                headers={
-                    "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36",
-                },
-                allow_redirects=True,
-                verify=False,
-            )
-            html = response.text
-            headers = dict(response.headers)
-            technologies = detect_technologies(html, headers)
-            gap_analysis = analyze_tech_gaps(technologies)
-            tech_summary = get_tech_summary(technologies)
-
-            return {
-                "success": True,
-                "url": url,
-                "final_url": response.url,
-                "status_code": response.status_code,
-                "technologies": technologies,
-                "tech_summary": tech_summary,
-                "gap_analysis": gap_analysis,
-                "crawl_time": crawl_time,
-                "error": None,
-            }
-        except Exception as e:
-            return {
-                "success": False,
-                "url": url,
-                "final_url": None,
-                "status_code": None,
-                "technologies": [],
-                "tech_summary": {"total_detected": 0, "categories_found": 0, "by_category": {}},
-                "gap_analysis": analyze_tech_gaps([]),
-                "crawl_time": crawl_time,
-                "error": f"SSL error: {str(e)}",
-            }
-    except Exception as e:
-        return {
-            "success": False,
-            "url": url,
-            "final_url": None,
-            "status_code": None,
-            "technologies": [],
-            "tech_summary": {"total_detected": 0, "categories_found": 0, "by_category": {}},
-            "gap_analysis": analyze_tech_gaps([]),
-            "crawl_time": crawl_time,
-            "error": str(e),
-        }
+@app.after_request
+def record_request_status(response):
+    g.metrics_status = response.status_code
+    return response
+
+
+@app.teardown_request
+def finish_request_metrics(_error=None):
+    """Record latency once the response is done; streamed responses tear down after streaming."""
+    if "metrics_started" not in g:
+        return
+    # Route templates, not paths, so /jobs/<job_id> stays a single series
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    REQUEST_SECONDS.observe(time.perf_counter() - g.metrics_started, endpoint)
+    REQUESTS.inc(endpoint, request.method, str(g.get("metrics_status", 500)))
+    REQUESTS_IN_FLIGHT.dec()
 
 
 @app.route("/health", methods=["GET"])
@@ -152,6 +220,10 @@ def health_check():
         "status": "healthy",
         "service": "tech-detector",
         "timestamp": datetime.utcnow().isoformat(),
+        "startup_ms": round(STARTUP_SECONDS * 1000, 1),
+        "signatures": REGISTRY.status(),
+        "analysis_cache": ANALYSIS_CACHE.stats(),
+        "detection_pool": pool_status(),
     })
 
 
@@ -162,16 +234,34 @@ def detect_single():
 
     Request body:
         {
-            "url": "example.com"
+            "url": "example.com",
+            "mode": "prefilter",    // optional matching mode
+            "force_refresh": false, // optional, skip the result cache
+            "categories": ["CRM"],  // optional, only detect these categories
+            "gap_only": false       // optional, only detect what gap_analysis needs
         }
 
+    gap_only limits detection to the categories analyze_tech_gaps looks at
+    (CRM, Analytics, Email Marketing, Marketing Automation, Chat and
+    A/B Testing), the common lead-scoring case; only those signatures are
+    matched. Filtered results are cached separately from full ones.
+
+    Query params:
+        fields: Optional projection, e.g. "url,technologies.name"
+
+    Responses are JSON, or MessagePack when the Accept header asks for
+    application/msgpack, and are gzip/brotli compressed per Accept-Encoding.
+
     Response:
         {
             "success": true,
             "url": "example.com",
+            "cache": "hit" | "miss" | "revalidated" | "stale",
+            "signature_version": "d0675e4b892a",
             "technologies": [...],
             "tech_summary": {...},
-            "gap_analysis": {...}
+            "gap_analysis": {...},  // only reports gaps in the detected categories
+            "categories": [...]     // set when filtered
         }
     """
     data = request.get_json()
@@ -183,8 +273,89 @@ def detect_single():
     if not url:
         return jsonify({"error": "URL cannot be empty"}), 400
 
-    result = fetch_and_detect(url)
-    return jsonify(result)
+    mode = data.get("mode")
+    if mode is not None and mode not in MODES:
+        return jsonify({"error": f"'mode' must be one of {list(MODES)}"}), 400
+
+    try:
+        categories = parse_categories(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    result = fetch_and_detect(
+        url,
+        mode=mode,
+        force_refresh=bool(data.get("force_refresh")),
+        categories=categories,
+    )
+    record_snapshots([result])
+    return render(project(result, request_fields()))
+
+
+def parse_batch_request(data: Optional[Dict], max_urls: int, max_deadline: float):
+    """
+    Validate a batch detection request body.
+
+    Options hold the valid URLs to fetch, their `positions` in the request's
+    list and `invalid`, the (position, entry) pairs of entries that are not
+    URLs, so results can be reported against the caller's indices.
+
+    Returns:
+        (options, None) on success, or (None, error response) on a bad request
+    """
+    if not data or "urls" not in data:
+        return None, (jsonify({"error": "Missing 'urls' in request body"}), 400)
+
+    urls = data["urls"]
+    if not isinstance(urls, list):
+        return None, (jsonify({"error": "'urls' must be an array"}), 400)
+
+    if len(urls) > max_urls:
+        return None, (jsonify({"error": f"Maximum {max_urls} URLs per request"}), 400)
+
+    try:
+        concurrency = min(int(data.get("concurrency", BATCH_CONCURRENCY)), BATCH_CONCURRENCY)
+        per_host = min(
+            int(data.get("per_host_concurrency", BATCH_PER_HOST_CONCURRENCY)),
+            BATCH_PER_HOST_CONCURRENCY,
+        )
+        deadline = min(float(data.get("deadline", max_deadline)), max_deadline)
+    except (TypeError, ValueError):
+        return None, (jsonify({"error": "Batch limits must be numbers"}), 400)
+
+    if concurrency < 1 or per_host < 1 or deadline <= 0:
+        return None, (jsonify({"error": "Batch limits must be positive"}), 400)
+
+    backend = data.get("backend", BATCH_BACKEND)
+    if backend not in BATCH_BACKENDS:
+        return None, (jsonify({"error": f"'backend' must be one of {list(BATCH_BACKENDS)}"}), 400)
+
+    valid, invalid = [], []
+    for position, url in enumerate(urls):
+        if isinstance(url, str) and url.strip():
+            valid.append((position, url.strip()))
+        else:
+            invalid.append((position, url))
+
+    return {
+        "urls": [url for _, url in valid],
+        "positions": [position for position, _ in valid],
+        "invalid": invalid,
+        "concurrency": concurrency,
+        "per_host": per_host,
+        "deadline": deadline,
+        "backend": backend,
+        "force_refresh": bool(data.get("force_refresh")),
+    }, None
+
+
+def invalid_url_results(options: Dict) -> List[Tuple[int, Dict]]:
+    """Failed results, with their request positions, for batch entries that are not URLs."""
+    crawl_time = datetime.utcnow().isoformat()
+    return [
+        (position, failed_result(url if isinstance(url, str) else "", crawl_time, "Invalid URL"))
+        for position, url in options["invalid"]
+    ]
 
 
 @app.route("/detect/batch", methods=["POST"])
@@ -194,13 +365,118 @@ def detect_batch():
 
     Request body:
         {
-            "urls": ["example1.com", "example2.com"]
+            "urls": ["example1.com", "example2.com"],
+            "concurrency": 10,           // optional, capped at BATCH_CONCURRENCY
+            "per_host_concurrency": 2,   // optional, capped at BATCH_PER_HOST_CONCURRENCY
+            "deadline": 50,              // optional seconds, capped at BATCH_DEADLINE_SECONDS
+            "backend": "scrapy",         // optional, "httpx" or "scrapy"
+            "force_refresh": false       // optional, skip the result cache (httpx only)
         }
 
+    Query params:
+        fields: Optional projection applied to each result (see /detect)
+
     Response:
         {
             "success": true,
-            "results": [...]
+            "results": [...]  // input order, each with "elapsed_ms"
+        }
+    """
+    options, error = parse_batch_request(request.get_json(), 50, BATCH_DEADLINE_SECONDS)
+    if error:
+        return error
+
+    urls = options["urls"]
+    if options["backend"] == "scrapy":
+        # Scrapy applies its own concurrency limits from tech_detector/settings.py
+        results = get_runner().run(urls, timeout=options["deadline"])
+    else:
+        results = run_batch(
+            urls,
+            concurrency=options["concurrency"],
+            per_host=options["per_host"],
+            deadline=options["deadline"],
+            force_refresh=options["force_refresh"],
+        )
+    record_snapshots(results)
+
+    in_order: List[Optional[Dict]] = [None] * (len(urls) + len(options["invalid"]))
+    for position, result in zip(options["positions"], results):
+        in_order[position] = result
+    for position, result in invalid_url_results(options):
+        in_order[position] = result
+    results = in_order
+
+    return render({
+        "success": True,
+        "total": len(results),
+        "results": project(results, request_fields()),
+    })
+
+
+@app.route("/detect/batch/stream", methods=["POST"])
+def detect_batch_stream():
+    """
+    Detect tech stack for multiple URLs, streaming each result as it finishes.
+
+    Takes the same body as /detect/batch, with up to BATCH_STREAM_MAX_URLS
+    URLs and a deadline capped at BATCH_STREAM_DEADLINE_SECONDS.
+
+    Response (application/x-ndjson, or concatenated MessagePack objects when
+    requested), one line per entry of `urls` in completion order, projected
+    by `fields`. `index` is the entry's position in `urls`; entries that are
+    not URLs come first, as failed results:
+        {"index": 1, "success": true, "url": "example2.com", ...}
+        {"index": 0, "success": true, "url": "example1.com", ...}
+    """
+    options, error = parse_batch_request(
+        request.get_json(), BATCH_STREAM_MAX_URLS, BATCH_STREAM_DEADLINE_SECONDS
+    )
+    if error:
+        return error
+
+    urls = options["urls"]
+    if options["backend"] == "scrapy":
+        results = get_runner().iter_results(urls, timeout=options["deadline"])
+    else:
+        fetcher = get_fetcher()
+        results = fetcher.iterate(fetcher.iter_batch(
+            urls,
+            concurrency=options["concurrency"],
+            per_host=options["per_host"],
+            deadline=options["deadline"],
+            force_refresh=options["force_refresh"],
+        ))
+
+    fields = request_fields()
+
+    positions = options["positions"]
+
+    def generate():
+        for position, result in invalid_url_results(options):
+            yield {"index": position, **project(result, fields)}
+        for index, result in results:
+            record_snapshots([result])
+            yield {"index": positions[index], **project(result, fields)}
+
+    return render_stream(stream_with_context(generate()))
+
+
+@app.route("/jobs", methods=["POST"])
+def create_job():
+    """
+    Queue a detection job for a large list of URLs.
+
+    Request body:
+        {
+            "urls": ["example1.com", "example2.com", ...]
+        }
+
+    Response (202):
+        {
+            "job_id": "4f1c...",
+            "status": "queued",
+            "total": 2
         }
     """
     data = request.get_json()
@@ -212,19 +488,132 @@ def detect_batch():
     if not isinstance(urls, list):
         return jsonify({"error": "'urls' must be an array"}), 400
 
-    if len(urls) > 50:
-        return jsonify({"error": "Maximum 50 URLs per request"}), 400
+    urls = [url.strip() for url in urls if url and isinstance(url, str)]
+    if not urls:
+        return jsonify({"error": "'urls' must contain at least one URL"}), 400
 
-    results = []
-    for url in urls:
-        if url and isinstance(url, str):
-            result = fetch_and_detect(url.strip())
-            results.append(result)
+    if len(urls) > JOB_MAX_URLS:
+        return jsonify({"error": f"Maximum {JOB_MAX_URLS} URLs per job"}), 400
 
+    job = get_job_manager().submit(urls)
     return jsonify({
-        "success": True,
-        "total": len(results),
-        "results": results,
+        "job_id": job["id"],
+        "status": job["status"],
+        "total": job["total"],
+    }), 202
+
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def get_job(job_id: str):
+    """
+    Get job progress and a page of results.
+
+    Query params:
+        offset: First input index to return (default 0)
+        limit: Number of input indices to return (default 100, max 500)
+        fields: Optional projection applied to each result (see /detect)
+
+    Response:
+        {
+            "job_id": "4f1c...",
+            "status": "running",
+            "total": 1000,
+            "completed": 250,
+            "failed": 3,
+            "results": [{"index": 0, ...}, ...],
+            "next_offset": 100
+        }
+    """
+    try:
+        offset = max(int(request.args.get("offset", 0)), 0)
+        limit = min(max(int(request.args.get("limit", 100)), 1), 500)
+    except ValueError:
+        return jsonify({"error": "'offset' and 'limit' must be integers"}), 400
+
+    manager = get_job_manager()
+    job = manager.store.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+
+    next_offset = offset + limit
+    return render({
+        "job_id": job["id"],
+        "status": job["status"],
+        "total": job["total"],
+        "completed": job["completed"],
+        "failed": job["failed"],
+        "created_at": datetime.utcfromtimestamp(job["created_at"]).isoformat(),
+        "updated_at": datetime.utcfromtimestamp(job["updated_at"]).isoformat(),
+        "error": job["error"],
+        "results": project(manager.store.get_results(job_id, offset, limit), request_fields()),
+        "next_offset": next_offset if next_offset < job["total"] else None,
+    })
+
+
+@app.route("/snapshots/changes", methods=["GET"])
+def snapshot_changes():
+    """
+    Feed of snapshots that changed a domain's technologies since a point in time.
+
+    Query params:
+        since: ISO-8601 timestamp or epoch seconds (required)
+        limit: Maximum number of changes to return (default 100, max 1000)
+
+    Response:
+        {
+            "changes": [{"domain": "example.com", "added": [...], "removed": [...],
+                         "gap_score_delta": -15, "created_at": "...", ...}],
+            "next_since": "..."  // pass back as since to continue
+        }
+    """
+    if "since" not in request.args:
+        return jsonify({"error": "Missing 'since' query parameter"}), 400
+
+    try:
+        since = parse_timestamp(request.args["since"])
+        limit = min(max(int(request.args.get("limit", 100)), 1), 1000)
+    except ValueError:
+        return jsonify({"error": "'since' must be a timestamp and 'limit' an integer"}), 400
+
+    changes = get_snapshot_store().changes(since, limit)
+    return jsonify({
+        "changes": [format_snapshot(c) for c in changes],
+        "next_since": changes[-1]["created_at"] if changes else since,
+    })
+
+
+@app.route("/snapshots/<path:domain>", methods=["GET"])
+def get_snapshots(domain: str):
+    """
+    Get a domain's detection history and what changed in its latest scan.
+
+    Query params:
+        since: Optional ISO-8601 timestamp or epoch seconds; diff against the
+            snapshot current at that time instead of the previous one
+        limit: Number of history entries to return (default 20, max 100)
+
+    Response:
+        {
+            "domain": "example.com",
+            "diff": {"added": [...], "removed": [...], "gap_score_delta": 5, ...},
+            "history": [...]  // newest first
+        }
+    """
+    try:
+        since = parse_timestamp(request.args["since"]) if "since" in request.args else None
+        limit = min(max(int(request.args.get("limit", 20)), 1), 100)
+    except ValueError:
+        return jsonify({"error": "'since' must be a timestamp and 'limit' an integer"}), 400
+
+    store = get_snapshot_store()
+    diff = store.diff(domain, since=since)
+    if diff is None:
+        return jsonify({"error": "No snapshots for domain"}), 404
+
+    return jsonify({
+        "domain": diff["domain"],
+        "diff": format_snapshot(diff),
+        "history": [format_snapshot(s) for s in store.history(domain, limit)],
     })
 
 
@@ -232,19 +621,28 @@ def detect_batch():
 def analyze_html():
     """
     Analyze raw HTML content for technologies.
-    Useful when you already have the HTML.
+    Useful when you already have the HTML. Repeated documents are served
+    from an in-memory content-hash cache.
 
     Request body:
         {
             "html": "<html>...</html>",
-            "headers": {"optional": "headers"}
+            "headers": {"optional": "headers"},
+            "mode": "prefilter",  // optional matching mode
+            "categories": [...],  // optional, see /detect
+            "gap_only": false     // optional, see /detect
         }
 
+    Query params:
+        fields: Optional projection, e.g. "technologies.name,gap_analysis.gap_score"
+
     Response:
         {
             "technologies": [...],
             "tech_summary": {...},
-            "gap_analysis": {...}
+            "gap_analysis": {...},
+            "signature_version": "d0675e4b892a",
+            "categories": [...]  // set when filtered
         }
     """
     data = request.get_json()
@@ -255,37 +653,48 @@ def analyze_html():
     html = data["html"]
     headers = data.get("headers", {})
 
-    technologies = detect_technologies(html, headers)
-    gap_analysis = analyze_tech_gaps(technologies)
-    tech_summary = get_tech_summary(technologies)
+    mode = data.get("mode")
+    if mode is not None and mode not in MODES:
+        return jsonify({"error": f"'mode' must be one of {list(MODES)}"}), 400
 
-    return jsonify({
+    try:
+        categories = parse_categories(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        analysis = analyze_document(
+            html, headers, mode=mode, detect=run_detection, categories=categories
+        )
+    except ExecutorBusy as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "1"}
+
+    return render({
         "success": True,
-        "technologies": technologies,
-        "tech_summary": tech_summary,
-        "gap_analysis": gap_analysis,
+        **project(analysis, request_fields()),
     })
 
 
 @app.route("/signatures", methods=["GET"])
 def list_signatures():
     """
-    List all supported technology signatures.
+    List the technology signatures of the active signature set.
 
     Response:
         {
-            "total": 100,
-            "by_category": {...}
+            "version": "d0675e4b892a",
+            "total": 97,
+            "by_category": {...},
+            "engine": {"signatures": 97, "patterns": 309, "rejected": [...]},
+            "registry": {"source": "...", "reloads": 0, "last_error": null, ...}
         }
     """
-    from signatures import TECH_SIGNATURES, CATEGORY_PRIORITY
+    from signatures import CATEGORY_PRIORITY
 
+    engine = get_engine()
     by_category = {}
-    for sig in TECH_SIGNATURES:
-        cat = sig["category"]
-        if cat not in by_category:
-            by_category[cat] = []
-        by_category[cat].append(sig["name"])
+    for sig in engine.signatures:
+        by_category.setdefault(sig.category, []).append(sig.name)
 
     # Sort categories by priority
     sorted_categories = dict(
@@ -293,17 +702,125 @@ def list_signatures():
     )
 
     return jsonify({
-        "total": len(TECH_SIGNATURES),
+        "version": engine.version,
+        "total": len(engine.signatures),
         "categories": len(by_category),
         "by_category": sorted_categories,
+        "engine": engine.load_report(),
+        "registry": REGISTRY.status(),
     })
 
 
+@app.route("/signatures/reload", methods=["POST"])
+def reload_signatures():
+    """
+    Reload the signature files under SIGNATURES_PATH now.
+
+    The new set is built while requests keep using the current one, then
+    swapped in. Pool workers follow on their next document.
+
+    Response:
+        {
+            "reloaded": true,  // false if the set is unchanged
+            "registry": {"version": "...", ...}
+        }
+    """
+    reloaded = REGISTRY.reload(force=True)
+    status = REGISTRY.status()
+    if status["last_error"]:
+        return jsonify({"error": status["last_error"], "registry": status}), 422
+    return jsonify({"reloaded": reloaded, "registry": status})
+
+
+@app.route("/debug/signature-stats", methods=["GET"])
+def signature_stats():
+    """
+    Per-pattern or per-signature timings recorded while profiling is enabled.
+
+    Query params:
+        by: "pattern" (default) or "signature"
+        sort: One of seconds (default), mean_us, runs, skips, hits, hit_rate
+        order: "desc" (default) or "asc", e.g. sort=hits&order=asc for
+            patterns that never match
+        limit: Number of rows (default 50, max 1000)
+
+    Response:
+        {
+            "enabled": true,
+            "since": "...",
+            "documents": 1200,
+            "seconds": 3.2,
+            "rows": [{"signature": "WooCommerce", "pattern": "wp-content.*woocommerce",
+                      "runs": 310, "skips": 890, "hits": 12, "hit_rate": 0.0387,
+                      "seconds": 0.41, "mean_us": 1322.6}, ...],
+            "alternations": {"Ecommerce": 0.52, ...}  // alternation mode only
+        }
+    """
+    by = request.args.get("by", "pattern")
+    sort = request.args.get("sort", "seconds")
+    order = request.args.get("order", "desc")
+    if by not in ("pattern", "signature"):
+        return jsonify({"error": "'by' must be 'pattern' or 'signature'"}), 400
+    if sort not in SORT_KEYS:
+        return jsonify({"error": f"'sort' must be one of {list(SORT_KEYS)}"}), 400
+    if order not in ("asc", "desc"):
+        return jsonify({"error": "'order' must be 'asc' or 'desc'"}), 400
+    try:
+        limit = min(max(int(request.args.get("limit", 50)), 1), 1000)
+    except ValueError:
+        return jsonify({"error": "'limit' must be an integer"}), 400
+
+    report = PROFILER.report(by=by, sort=sort, ascending=order == "asc", limit=limit)
+    report["since"] = datetime.utcfromtimestamp(report["since"]).isoformat()
+    return jsonify(report)
+
+
+@app.route("/debug/signature-stats", methods=["POST"])
+def configure_signature_stats():
+    """
+    Turn profiling on or off, or clear what was recorded.
+
+    Profiling is opt-in (SIGNATURE_PROFILING) since timing every pattern
+    adds overhead to each document. It applies to detection in this
+    process and its pool workers; streamed fetches are not profiled.
+
+    Request body:
+        {
+            "enabled": true,  // optional
+            "reset": false    // optional, drop recorded stats
+        }
+    """
+    data = request.get_json(silent=True) or {}
+    if "enabled" in data:
+        PROFILER.enabled = bool(data["enabled"])
+    if data.get("reset"):
+        PROFILER.reset()
+    return jsonify({"enabled": PROFILER.enabled})
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """
+    Prometheus metrics for this server process.
+
+    Covers request latency per endpoint, fetch versus detection time, bytes
+    downloaded, fetch outcomes (timeouts, SSL fallbacks), result and
+    analysis cache hit ratios, detection pool and job queue depth, and
+    requests and fetches in flight.
+    """
+    return Response(METRICS.render(), content_type=CONTENT_TYPE)
+
+
+# Import-to-ready time, including signature compilation; kept well under a second
+# by loading Scrapy only when the scrapy backend is used
+STARTUP_SECONDS = time.perf_counter() - _import_started
+
+
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 5001))
     debug = os.environ.get("DEBUG", "false").lower() == "true"
 
-    print(f"Starting Tech Detector API on port {port}")
+    print(f"Starting Tech Detector API on port {port} (loaded in {STARTUP_SECONDS:.3f}s)")
     print(f"Debug mode: {debug}")
 
     app.run(host="0.0.0.0", port=port, debug=debug)
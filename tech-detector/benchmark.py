@@ -0,0 +1,464 @@
+"""
+Benchmarks for detect_technologies.
+Runs every matching mode over a corpus of generated pages plus, optionally,
+recorded pages from the WARC, tar and JSONL archives bulk.py reads. Reports
+per-page latency percentiles, pages/sec and what each signature's patterns
+cost, and compares a run with a saved baseline so a slow pattern fails
+before it ships.
+
+By default the generated pages are small ones and a 256 KB minified
+single-line page, which run in seconds. --large adds 1 MB pages (plain and
+minified) and a 10 MB page, which regex mode takes minutes over.
+
+Usage:
+    python benchmark.py -o baseline.json
+    python benchmark.py --large -o baseline-large.json
+    python benchmark.py crawl.warc.gz --baseline baseline.json --tolerance 0.25
+    python benchmark.py --pages small,minified --modes prefilter --max-pattern-ms-per-mb 50
+"""
+import argparse
+import json
+import random
+import statistics
+import sys
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from bulk import decode_body, iter_records
+from detector import detect_technologies, get_engine
+from engine import MODES, SignatureEngine
+
+# (kind, name, html, headers)
+Page = Tuple[str, str, str, Dict[str, str]]
+
+# Generated page kinds: (size in characters, single line like minified markup)
+PAGE_KINDS = {
+    "small": (20 * 1024, False),
+    "minified-256kb": (256 * 1024, True),
+    "1mb": (1024 * 1024, False),
+    "10mb": (10 * 1024 * 1024, False),
+    "minified": (1024 * 1024, True),
+}
+# Generated unless --pages is given; --large adds the other PAGE_KINDS
+DEFAULT_PAGE_KINDS = ("small", "minified-256kb")
+# Number of generated small pages; the larger kinds get one page each
+SMALL_PAGES = 20
+# Share of generated fragments taken from MARKERS
+MARKER_RATE = 0.02
+
+# Slowdowns smaller than this are timer noise, whatever the ratio
+MIN_REGRESSION_MS = 0.5
+
+FILLER = (
+    '<div class="product-card">', "<span>", "</span>", "</div>", "$19.99",
+    '<img src="https://cdn.example.com/i/a1b2c3d4e5f6.jpg" alt="">',
+    '<a href="/collections/all">Shop all</a>', "<p>Free shipping on orders over $50</p>",
+    "<script>", "</script>", "function(e){return e&&e.t}", "var a=b||{};",
+    '{"id":123,"title":"Shirt","price":1999}', '<meta property="og:type" content="website">',
+    '<link rel="stylesheet" href="/assets/theme.css">', "<li>", "</li>", "&nbsp;",
+)
+
+# Third-party snippets seen on real pages, plus near misses (a CDN host without
+# the library a signature expects after it). Fixed rather than derived from
+# the signatures, so a baseline stays comparable when signatures change.
+MARKERS = (
+    '<script async src="https://www.googletagmanager.com/gtag/js?id=G-ABCDEF1234"></script>',
+    "gtag('config', 'G-ABCDEF1234');",
+    '<script src="https://static.hotjar.com/c/hotjar-12345.js?sv=6"></script>',
+    '<script src="//js.hs-scripts.com/1234567.js" id="hs-script-loader"></script>',
+    '<script src="https://connect.facebook.net/en_US/fbevents.js"></script>',
+    '<link href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css">',
+    '<script src="https://cdn.jsdelivr.net/npm/swiper@11/swiper-bundle.min.js"></script>',
+    '<script src="https://code.jquery.com/jquery-3.7.1.min.js"></script>',
+    '<link rel="stylesheet" href="/wp-content/themes/astra/style.css">',
+    '<meta name="generator" content="WordPress 6.4.2">',
+    '<script src="https://cdn.shopify.com/s/files/1/0123/4567/t/1/assets/theme.js"></script>',
+    '<script src="https://js.stripe.com/v3/"></script>',
+    '<script src="https://widget.intercom.io/widget/abc123"></script>',
+    '<script src="https://static.klaviyo.com/onsite/js/klaviyo.js"></script>',
+    '<script src="https://www.google.com/recaptcha/api.js"></script>',
+    '<script src="https://cdnjs.cloudflare.com/ajax/libs/lodash.js/4.17.21/lodash.min.js">',
+    '<div id="root" data-reactroot="">', '<div id="__next">',
+    '<img src="https://images.squarespace-cdn.com/content/v1/abc/hero.jpg">',
+    "bootstrap", "hubspot", "shopify", "analytics", "static", "cdn.jsdelivr.net",
+)
+
+HEADER_SETS = (
+    {},
+    {"Content-Type": "text/html; charset=utf-8"},
+    {"Server": "cloudflare", "CF-RAY": "8a1b2c3d4e5f-AMS"},
+    {"Server": "nginx", "X-Powered-By": "PHP/8.2"},
+    {"Via": "1.1 varnish", "X-Served-By": "cache-ams21"},
+)
+
+
+def generate_page(size: int, single_line: bool, rnd: random.Random) -> str:
+    """Assemble a page of about `size` characters from filler markup and MARKERS."""
+    parts = []
+    total = 0
+    while total < size:
+        part = rnd.choice(MARKERS if rnd.random() < MARKER_RATE else FILLER)
+        parts.append(part)
+        total += len(part) + 1
+    return ("" if single_line else "\n").join(parts)
+
+
+def generated_pages(kinds: List[str], seed: int = 1) -> List[Page]:
+    """Deterministic synthetic corpus for the given PAGE_KINDS."""
+    rnd = random.Random(seed)
+    pages = []
+    for kind in kinds:
+        size, single_line = PAGE_KINDS[kind]
+        for i in range(SMALL_PAGES if kind == "small" else 1):
+            html = generate_page(size, single_line, rnd)
+            pages.append((kind, f"{kind}-{i}", html, dict(rnd.choice(HEADER_SETS))))
+    return pages
+
+
+def recorded_pages(paths: List[str], limit: int) -> Iterator[Page]:
+    """Up to `limit` stored pages from WARC, tar or JSONL archives."""
+    count = 0
+    for path in paths:
+        for url, body, headers, _status, _source in iter_records(path):
+            if count >= limit:
+                return
+            count += 1
+            yield "recorded", url, decode_body(body, headers), headers
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """Nearest-rank p50/p90/p99 and max of latency samples in milliseconds."""
+    ordered = sorted(samples)
+    if not ordered:
+        return {"p50": 0.0, "p90": 0.0, "p99": 0.0, "max": 0.0}
+
+    def rank(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 3)
+
+    return {"p50": rank(0.5), "p90": rank(0.9), "p99": rank(0.99), "max": round(ordered[-1], 3)}
+
+
+def spread(samples: List[float]) -> float:
+    """Range of repeated timings, the noise a difference has to stand out from."""
+    return round(max(samples) - min(samples), 3) if samples else 0.0
+
+
+def mode_pass(pages: List[Page], engine: SignatureEngine, mode: str) -> Dict:
+    """
+    One timed pass of detect_technologies over the corpus.
+
+    Runs without the detection budget, so slow pages show their full cost
+    instead of being cut short as partial results.
+    """
+    samples: List[float] = []
+    by_kind: Dict[str, List[float]] = {}
+    started = time.perf_counter()
+    for kind, _name, html, headers in pages:
+        page_started = time.perf_counter()
+        detect_technologies(html, headers, engine=engine, mode=mode, budget=0)
+        elapsed_ms = (time.perf_counter() - page_started) * 1000
+        samples.append(elapsed_ms)
+        by_kind.setdefault(kind, []).append(elapsed_ms)
+    seconds = time.perf_counter() - started
+    return {
+        "seconds": seconds,
+        "pages_per_second": len(samples) / seconds if seconds else 0.0,
+        "latency_ms": percentiles(samples),
+        "by_kind": {kind: percentiles(values) for kind, values in by_kind.items()},
+    }
+
+
+def mode_summary(passes: List[Dict], pages: int) -> Dict:
+    """
+    Latency of one mode per page, overall and per page kind.
+
+    Every statistic is the median over the passes, with the spread of the
+    overall ones kept for compare.
+    """
+
+    def median_of(stats: List[Dict[str, float]]) -> Dict[str, float]:
+        return {stat: round(statistics.median(s[stat] for s in stats), 3) for stat in stats[0]}
+
+    latencies = [p["latency_ms"] for p in passes]
+    rates = [p["pages_per_second"] for p in passes]
+    return {
+        "pages": pages * len(passes),
+        "seconds": round(sum(p["seconds"] for p in passes), 3),
+        "pages_per_second": round(statistics.median(rates), 1),
+        "pages_per_second_spread": spread(rates),
+        "latency_ms": median_of(latencies),
+        "latency_spread_ms": {stat: spread([s[stat] for s in latencies]) for stat in latencies[0]},
+        "by_kind": {
+            kind: median_of([p["by_kind"][kind] for p in passes]) for kind in passes[0]["by_kind"]
+        },
+    }
+
+
+def pattern_pass(pages: List[Page], engine: SignatureEngine) -> Dict[str, float]:
+    """Milliseconds each HTML pattern takes over the whole corpus, as regex mode runs them."""
+    pattern_ms = {}
+    for sig in engine.signatures:
+        for pattern in sig.patterns:
+            regex = pattern.regex
+            started = time.perf_counter()
+            for _, _, html, _ in pages:
+                regex.search(html)
+            pattern_ms[pattern.source] = (time.perf_counter() - started) * 1000
+    return pattern_ms
+
+
+def signature_costs(
+    pages: List[Page],
+    engine: SignatureEngine,
+    passes: List[Dict[str, float]]
+) -> List[Dict]:
+    """
+    What every signature's HTML patterns cost over the whole corpus.
+
+    Prefilter mode skips patterns whose literals are missing, so this is
+    each signature's worst case, which is what a catastrophic pattern
+    shows up in. Costs are medians of the pattern_pass passes, and
+    `spread_ms` is how far the signature's total varied between them.
+
+    Returns:
+        Per-signature cost, most expensive first
+    """
+    megabytes = sum(len(html) for _, _, html, _ in pages) / (1024 * 1024) or 1.0
+    costs = []
+    for sig in engine.signatures:
+        pattern_ms = {
+            pattern.source: statistics.median(p[pattern.source] for p in passes)
+            for pattern in sig.patterns
+        }
+        totals = [sum(p[pattern.source] for pattern in sig.patterns) for p in passes]
+        slowest = max(pattern_ms, key=pattern_ms.get, default=None)
+        costs.append({
+            "name": sig.name,
+            "category": sig.category,
+            "ms": round(statistics.median(totals), 3),
+            "spread_ms": spread(totals),
+            "ms_per_mb": round(statistics.median(totals) / megabytes, 3),
+            "slowest_pattern": slowest,
+            "slowest_pattern_ms_per_mb": round(pattern_ms[slowest] / megabytes, 3)
+            if slowest else 0.0,
+        })
+    costs.sort(key=lambda c: c["ms"], reverse=True)
+    return costs
+
+
+def regressed(new: float, old: float, tolerance: float, noise: float = 0.0) -> bool:
+    """
+    Whether a timing got worse by more than `tolerance` and by more than noise.
+
+    Args:
+        new: Median timing of this run
+        old: Median timing of the baseline
+        tolerance: Allowed slowdown as a fraction
+        noise: Combined spread of both sides' repeated runs; the slowdown
+            must also exceed it, and MIN_REGRESSION_MS
+    """
+    return new > old * (1 + tolerance) and new - old >= max(MIN_REGRESSION_MS, noise)
+
+
+def compare(report: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """
+    List the timings in `report` that regressed against `baseline`.
+
+    Median latency percentiles and pages/sec are compared per mode, and
+    median corpus cost per signature; modes and signatures missing from
+    either side are ignored. A timing only counts as regressed if it also
+    got worse by more than the spread of its repeated runs on both sides.
+
+    Baseline timings are first scaled by how much slower this machine ran
+    the same regex searches: the median ratio of the signature costs both
+    sides share, which a few slower patterns cannot move.
+    """
+    old_costs = {c["name"]: c for c in baseline.get("signatures", [])}
+    ratios = [
+        cost["ms"] / old_costs[cost["name"]]["ms"] for cost in report["signatures"]
+        if old_costs.get(cost["name"], {}).get("ms")
+    ]
+    speed = statistics.median(ratios) if ratios else 1.0
+
+    def scaled(value: float) -> float:
+        return round(value * speed, 3)
+
+    regressions = []
+    for mode, current in report["modes"].items():
+        old = baseline.get("modes", {}).get(mode)
+        if old is None:
+            continue
+        new_spread = current.get("latency_spread_ms", {})
+        old_spread = old.get("latency_spread_ms", {})
+        for stat in ("p50", "p90", "p99"):
+            new_ms, old_ms = current["latency_ms"][stat], scaled(old["latency_ms"][stat])
+            noise = new_spread.get(stat, 0.0) + scaled(old_spread.get(stat, 0.0))
+            if regressed(new_ms, old_ms, tolerance, noise):
+                regressions.append(f"{mode} {stat}: {old_ms} ms -> {new_ms} ms")
+        new_rate, old_rate = current["pages_per_second"], old["pages_per_second"] / speed
+        noise = current.get("pages_per_second_spread", 0.0) + \
+            old.get("pages_per_second_spread", 0.0) / speed
+        if new_rate and old_rate > new_rate * (1 + tolerance) and old_rate - new_rate > noise:
+            regressions.append(f"{mode} throughput: {old_rate:.1f} -> {new_rate} pages/s")
+
+    for cost in report["signatures"]:
+        old = old_costs.get(cost["name"])
+        if old is None:
+            continue
+        noise = cost.get("spread_ms", 0.0) + scaled(old.get("spread_ms", 0.0))
+        if regressed(cost["ms"], scaled(old["ms"]), tolerance, noise):
+            regressions.append(
+                f"signature {cost['name']}: {scaled(old['ms'])} ms -> {cost['ms']} ms "
+                f"(slowest pattern {cost['slowest_pattern']!r})"
+            )
+    return regressions
+
+
+def run(
+    inputs: List[str],
+    kinds: List[str],
+    modes: List[str],
+    repeat: int = 5,
+    limit: int = 200,
+    seed: int = 1
+) -> Dict:
+    """
+    Benchmark the active signature set over generated and recorded pages.
+
+    The passes are interleaved: each round times every mode and every
+    pattern once, so a machine that slows down midway
+    shows up in every timing's spread instead of in one mode's median.
+
+    Args:
+        inputs: WARC, tar or JSONL archives of recorded pages
+        kinds: Generated page kinds, keys of PAGE_KINDS
+        modes: Matching modes to time, from engine.MODES
+        repeat: Rounds of passes over the corpus; medians are reported
+        limit: Maximum number of recorded pages
+        seed: Seed for the generated pages
+
+    Returns:
+        Report with the corpus description, per-mode timings and per-signature costs
+    """
+    engine = get_engine()
+    engine.warm()
+    pages = generated_pages(kinds, seed) + list(recorded_pages(inputs, limit))
+    # Compiles the combined regexes of alternation mode outside the measurement
+    for mode in modes:
+        detect_technologies("<html></html>", {}, engine=engine, mode=mode)
+
+    mode_passes: Dict[str, List[Dict]] = {mode: [] for mode in modes}
+    pattern_passes = []
+    for _ in range(repeat):
+        for mode in modes:
+            mode_passes[mode].append(mode_pass(pages, engine, mode))
+        pattern_passes.append(pattern_pass(pages, engine))
+
+    return {
+        "signature_version": engine.version,
+        "corpus": {
+            "kinds": kinds,
+            "seed": seed,
+            "recorded": inputs,
+            "pages": len(pages),
+            "megabytes": round(sum(len(html) for _, _, html, _ in pages) / (1024 * 1024), 2),
+        },
+        "modes": {mode: mode_summary(passes, len(pages)) for mode, passes in mode_passes.items()},
+        "signatures": signature_costs(pages, engine, pattern_passes),
+    }
+
+
+def print_report(report: Dict, top: int = 10):
+    """Human-readable summary of a report."""
+    corpus = report["corpus"]
+    print(f"Signature set {report['signature_version']}: "
+          f"{corpus['pages']} pages, {corpus['megabytes']} MB")
+    print(f"{'mode':<12} {'pages/s':>9} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for mode, stats in report["modes"].items():
+        latency = stats["latency_ms"]
+        print(f"{mode:<12} {stats['pages_per_second']:>9} {latency['p50']:>9} "
+              f"{latency['p90']:>9} {latency['p99']:>9} {latency['max']:>9}")
+    print("Most expensive signatures (regex mode, ms per MB):")
+    for cost in report["signatures"][:top]:
+        print(f"  {cost['ms_per_mb']:>9}  {cost['name']} ({cost['category']}), "
+              f"slowest pattern {cost['slowest_pattern']!r} at "
+              f"{cost['slowest_pattern_ms_per_mb']} ms/MB")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Benchmark tech detection.")
+    parser.add_argument("inputs", nargs="*", help="Recorded pages: WARC, tar or JSONL files")
+    parser.add_argument(
+        "--pages", default=",".join(DEFAULT_PAGE_KINDS),
+        help=f"Generated page kinds, from {','.join(PAGE_KINDS)} "
+             f"(default: {','.join(DEFAULT_PAGE_KINDS)}; empty for none)",
+    )
+    parser.add_argument(
+        "--large", action="store_true",
+        help="Add the 1 MB and 10 MB page kinds; takes minutes in regex mode",
+    )
+    parser.add_argument("--modes", default=",".join(MODES), help="Matching modes to time")
+    parser.add_argument(
+        "--repeat", type=int, default=5,
+        help="Rounds of passes over the corpus; medians are reported"
+    )
+    parser.add_argument("--limit", type=int, default=200, help="Maximum recorded pages")
+    parser.add_argument("--seed", type=int, default=1, help="Seed for generated pages")
+    parser.add_argument("--top", type=int, default=10, help="Signatures to list by cost")
+    parser.add_argument("-o", "--output", help="Write the JSON report here (usable as a baseline)")
+    parser.add_argument("--baseline", help="JSON report to compare against")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.25,
+        help="Allowed slowdown against the baseline, as a fraction (default: 0.25)",
+    )
+    parser.add_argument(
+        "--max-pattern-ms-per-mb", type=float,
+        help="Fail if any single pattern costs more than this per MB of corpus",
+    )
+    args = parser.parse_args(argv)
+
+    kinds = [k for k in args.pages.split(",") if k]
+    if args.large:
+        kinds += [k for k in PAGE_KINDS if k not in kinds and k not in DEFAULT_PAGE_KINDS]
+    modes = [m for m in args.modes.split(",") if m]
+    for kind in kinds:
+        if kind not in PAGE_KINDS:
+            parser.error(f"Unknown page kind {kind!r}, expected one of {list(PAGE_KINDS)}")
+    for mode in modes:
+        if mode not in MODES:
+            parser.error(f"Unknown mode {mode!r}, expected one of {list(MODES)}")
+    if not kinds and not args.inputs:
+        parser.error("Nothing to benchmark: give recorded inputs or --pages")
+
+    report = run(args.inputs, kinds, modes, args.repeat, args.limit, args.seed)
+    print_report(report, args.top)
+    if args.output:
+        with open(args.output, "w") as handle:
+            json.dump(report, handle, indent=2)
+
+    failures = []
+    if args.max_pattern_ms_per_mb is not None:
+        failures.extend(
+            f"pattern {c['slowest_pattern']!r} ({c['name']}): "
+            f"{c['slowest_pattern_ms_per_mb']} ms/MB"
+            for c in report["signatures"]
+            if c["slowest_pattern_ms_per_mb"] > args.max_pattern_ms_per_mb
+        )
+    if args.baseline:
+        with open(args.baseline) as handle:
+            baseline = json.load(handle)
+        corpus = baseline.get("corpus", {})
+        if (corpus.get("kinds"), corpus.get("seed"), corpus.get("recorded")) != \
+                (kinds, args.seed, args.inputs):
+            print("Warning: the baseline was measured on a different corpus", file=sys.stderr)
+        failures.extend(compare(report, baseline, args.tolerance))
+
+    if failures:
+        print(f"{len(failures)} regression(s):", file=sys.stderr)
+        for failure in failures:
+            print(f"  {failure}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
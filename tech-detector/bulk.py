@@ -0,0 +1,397 @@
+"""
+Offline bulk tech detection over stored pages.
+Streams records from WARC, tar and JSONL archives, runs detection on the
+multi-process detection executor and writes one result per page as JSONL or Parquet, so stored
+crawls can be re-scored after a signature update without fetching anything.
+
+Usage:
+    python bulk.py crawl.warc.gz pages.tar.gz -o results.jsonl
+    python bulk.py pages.jsonl --format parquet -o results.parquet --workers 8
+
+JSONL input lines look like {"url": ..., "html": ..., "headers": {...}}.
+"""
+import argparse
+import gzip
+import io
+import json
+import logging
+import mmap
+import os
+import sys
+import tarfile
+import time
+import zlib
+from collections import deque
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # Optional: only needed for --format parquet
+    pyarrow = None
+
+from detector import (
+    analyze_tech_gaps,
+    detect_technologies,
+    get_engine,
+    get_tech_summary,
+    partial_fields,
+)
+from executor import DetectionExecutor
+
+logger = logging.getLogger(__name__)
+
+# Bodies larger than this are truncated before detection, like MAX_BODY_BYTES for fetches
+BULK_MAX_BODY_BYTES = int(os.environ.get("BULK_MAX_BODY_BYTES", 5 * 1024 * 1024))
+
+HTML_SUFFIXES = (".html", ".htm", ".xhtml", ".shtml", ".php", ".asp", ".aspx", ".jsp")
+
+# (url, body bytes, headers, status code, source)
+Record = Tuple[str, bytes, Dict[str, str], Optional[int], str]
+
+
+def open_mapped(path: str):
+    """Open an uncompressed file as a read-only memory map."""
+    with open(path, "rb") as handle:
+        try:
+            return mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # Empty files cannot be mapped
+            return io.BytesIO(b"")
+
+
+def open_input(path: str):
+    """Open gzipped inputs as streams and plain ones memory-mapped."""
+    if path.lower().endswith(".gz"):
+        return gzip.open(path, "rb")
+    return open_mapped(path)
+
+
+def parse_http_response(block: bytes) -> Tuple[Optional[int], Dict[str, str], bytes]:
+    """
+    Split a raw HTTP response into status, headers and decoded body.
+
+    Chunked transfer encoding and gzip/deflate content encoding are undone.
+    """
+    head, _, body = block.partition(b"\r\n\r\n")
+    lines = head.decode("iso-8859-1").split("\r\n")
+    try:
+        status = int(lines[0].split()[1])
+    except (IndexError, ValueError):
+        status = None
+
+    headers = {}
+    for line in lines[1:]:
+        name, sep, value = line.partition(":")
+        if sep:
+            headers[name.strip()] = value.strip()
+    lowered = {k.lower(): v.lower() for k, v in headers.items()}
+
+    if "chunked" in lowered.get("transfer-encoding", ""):
+        body = dechunk(body)
+    encoding = lowered.get("content-encoding", "")
+    if encoding in ("gzip", "x-gzip", "deflate"):
+        try:
+            body = zlib.decompressobj(zlib.MAX_WBITS | 32).decompress(body, BULK_MAX_BODY_BYTES)
+        except zlib.error:
+            pass
+    return status, headers, body
+
+
+def dechunk(body: bytes) -> bytes:
+    """Undo HTTP chunked transfer encoding, keeping whatever parses."""
+    out = []
+    pos = 0
+    while pos < len(body):
+        line_end = body.find(b"\r\n", pos)
+        if line_end < 0:
+            break
+        try:
+            size = int(body[pos:line_end].split(b";")[0], 16)
+        except ValueError:
+            return body
+        if size == 0:
+            break
+        out.append(body[line_end + 2:line_end + 2 + size])
+        pos = line_end + 2 + size + 2
+    return b"".join(out)
+
+
+def iter_warc(path: str) -> Iterator[Record]:
+    """Yield HTTP response records from a WARC file (plain or gzipped)."""
+    source = open_input(path)
+    try:
+        while True:
+            line = source.readline()
+            if not line:
+                return
+            if not line.startswith(b"WARC/"):
+                continue
+
+            fields = {}
+            while True:
+                line = source.readline()
+                if not line or line in (b"\r\n", b"\n"):
+                    break
+                name, _, value = line.decode("utf-8", "replace").partition(":")
+                fields[name.strip().lower()] = value.strip()
+
+            block = source.read(int(fields.get("content-length", 0)))
+            if fields.get("warc-type") != "response":
+                continue
+            if not fields.get("content-type", "").startswith("application/http"):
+                continue
+
+            status, headers, body = parse_http_response(block)
+            yield fields.get("warc-target-uri", ""), body, headers, status, path
+    finally:
+        source.close()
+
+
+def iter_tar(path: str) -> Iterator[Record]:
+    """Yield HTML files from a tar archive (any compression), named by member path."""
+    with tarfile.open(path, "r:*") as archive:
+        for member in archive:
+            if not member.isfile() or not member.name.lower().endswith(HTML_SUFFIXES):
+                continue
+            handle = archive.extractfile(member)
+            if handle is not None:
+                yield member.name, handle.read(BULK_MAX_BODY_BYTES), {}, None, path
+
+
+def iter_jsonl(path: str, counts: Optional[Dict[str, int]] = None) -> Iterator[Record]:
+    """
+    Yield pages from JSONL lines with url, html and optional headers/status_code.
+
+    Lines that are not JSON objects are logged and skipped, and counted
+    under "malformed" in `counts` if given.
+    """
+    source = open_input(path)
+    try:
+        for number, line in enumerate(iter(source.readline, b""), 1):
+            if not line.strip():
+                continue
+            try:
+                page = json.loads(line)
+            except ValueError:  # JSONDecodeError, or bytes that are not UTF-8
+                page = None
+            if not isinstance(page, dict):
+                logger.warning("Skipping malformed line %d of %s", number, path)
+                if counts is not None:
+                    counts["malformed"] = counts.get("malformed", 0) + 1
+                continue
+            yield (
+                page.get("url", ""),
+                page.get("html", "").encode("utf-8", "surrogatepass"),
+                page.get("headers") or {},
+                page.get("status_code"),
+                path,
+            )
+    finally:
+        source.close()
+
+
+def iter_records(path: str, counts: Optional[Dict[str, int]] = None) -> Iterator[Record]:
+    """Pick a reader from the file extension; `counts` receives skipped input (see iter_jsonl)."""
+    name = path.lower()
+    if ".warc" in name:
+        return iter_warc(path)
+    if name.endswith((".jsonl", ".jsonl.gz", ".ndjson", ".ndjson.gz")):
+        return iter_jsonl(path, counts)
+    if name.endswith((".tar", ".tgz", ".tar.gz", ".tar.bz2", ".tar.xz")):
+        return iter_tar(path)
+    raise ValueError(f"Unsupported input format: {path}")
+
+
+def body_charset(headers: Dict[str, str]) -> str:
+    """Read the charset from a Content-Type header, defaulting to UTF-8."""
+    for name, value in headers.items():
+        if name.lower() == "content-type" and "charset=" in value.lower():
+            return value.lower().split("charset=")[1].split(";")[0].strip().strip('"')
+    return "utf-8"
+
+
+def decode_body(body: bytes, headers: Dict[str, str]) -> str:
+    """Decode a stored body (capped at BULK_MAX_BODY_BYTES) with its declared charset."""
+    try:
+        return body[:BULK_MAX_BODY_BYTES].decode(body_charset(headers), "replace")
+    except LookupError:
+        return body[:BULK_MAX_BODY_BYTES].decode("utf-8", "replace")
+
+
+def analyze_record(record: Record) -> Dict:
+    """Run detection for one stored page (executed in pool workers)."""
+    url, body, headers, status, source = record
+    engine = get_engine()
+    detect_status: Dict = {}
+    try:
+        html = decode_body(body, headers)
+        technologies = detect_technologies(
+            html, headers, engine=engine, status=detect_status
+        )
+        error = None
+    except Exception as e:
+        technologies, error = [], str(e)
+
+    return {
+        "success": error is None,
+        "url": url,
+        "source": source,
+        "status_code": status,
+        "technologies": technologies,
+        "tech_summary": get_tech_summary(technologies),
+        "gap_analysis": analyze_tech_gaps(technologies),
+        "signature_version": engine.version,
+        **partial_fields(detect_status),
+        "error": error,
+    }
+
+
+class JsonlWriter:
+    """Write results as one JSON object per line."""
+
+    def __init__(self, path: str):
+        self._handle: BinaryIO = sys.stdout.buffer if path == "-" else open(path, "wb")
+
+    def write(self, result: Dict):
+        self._handle.write(json.dumps(result).encode("utf-8") + b"\n")
+
+    def close(self):
+        if self._handle is not sys.stdout.buffer:
+            self._handle.close()
+        else:
+            self._handle.flush()
+
+
+class ParquetWriter:
+    """Write results as Parquet row groups; nested fields are stored as JSON strings."""
+
+    ROW_GROUP_SIZE = 10000
+
+    def __init__(self, path: str):
+        if pyarrow is None:
+            raise RuntimeError("--format parquet requires the 'pyarrow' package")
+        self.path = path
+        self.schema = pyarrow.schema([
+            ("url", pyarrow.string()),
+            ("source", pyarrow.string()),
+            ("status_code", pyarrow.int32()),
+            ("success", pyarrow.bool_()),
+            ("technologies", pyarrow.list_(pyarrow.string())),
+            ("categories", pyarrow.list_(pyarrow.string())),
+            ("gap_score", pyarrow.int32()),
+            ("detail", pyarrow.string()),
+            ("signature_version", pyarrow.string()),
+            ("error", pyarrow.string()),
+        ])
+        self._rows: List[Dict] = []
+        self._writer = None
+
+    def write(self, result: Dict):
+        self._rows.append({
+            "url": result["url"],
+            "source": result["source"],
+            "status_code": result["status_code"],
+            "success": result["success"],
+            "technologies": [t["name"] for t in result["technologies"]],
+            "categories": sorted({t["category"] for t in result["technologies"]}),
+            "gap_score": result["gap_analysis"]["gap_score"],
+            "detail": json.dumps(result),
+            "signature_version": result["signature_version"],
+            "error": result["error"],
+        })
+        if len(self._rows) >= self.ROW_GROUP_SIZE:
+            self._flush()
+
+    def _flush(self):
+        if not self._rows:
+            return
+        table = pyarrow.Table.from_pylist(self._rows, schema=self.schema)
+        if self._writer is None:
+            self._writer = pyarrow.parquet.ParquetWriter(self.path, self.schema)
+        self._writer.write_table(table)
+        self._rows = []
+
+    def close(self):
+        self._flush()
+        if self._writer is not None:
+            self._writer.close()
+
+
+def run(
+    inputs: List[str],
+    output: str,
+    output_format: str = "jsonl",
+    workers: Optional[int] = None,
+    max_pending: int = 256
+) -> Dict:
+    """
+    Detect technologies for every page in the input archives.
+
+    Args:
+        inputs: WARC, tar or JSONL paths
+        output: Output path, or "-" for stdout (JSONL only)
+        output_format: "jsonl" or "parquet"
+        workers: Worker processes (defaults to the CPU count)
+        max_pending: Records read ahead of the results being written
+
+    Returns:
+        Counts and throughput for the run
+    """
+    writer = ParquetWriter(output) if output_format == "parquet" else JsonlWriter(output)
+    executor = DetectionExecutor(workers, max_pending=max_pending)
+    pending: deque = deque()
+    counts: Dict[str, int] = {}
+    started = time.monotonic()
+    pages = failed = 0
+
+    def write_done(block: bool):
+        nonlocal pages, failed
+        while pending and (block or pending[0].done()):
+            result = pending.popleft().result()
+            writer.write(result)
+            pages += 1
+            failed += not result["success"]
+
+    try:
+        for path in inputs:
+            for record in iter_records(path, counts):
+                # Blocks while max_pending records are in flight, so reading
+                # the archive never runs far ahead of detection
+                pending.append(executor.submit(analyze_record, record, timeout=None))
+                write_done(block=False)
+        write_done(block=True)
+    finally:
+        executor.shutdown()
+        writer.close()
+
+    elapsed = time.monotonic() - started
+    return {
+        "pages": pages,
+        "failed": failed,
+        "malformed": counts.get("malformed", 0),
+        "seconds": round(elapsed, 2),
+        "pages_per_second": round(pages / elapsed, 1) if elapsed else 0.0,
+        "signature_version": get_engine().version,
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Run tech detection over stored pages.")
+    parser.add_argument("inputs", nargs="+", help="WARC (.warc/.warc.gz), tar or JSONL files")
+    parser.add_argument("-o", "--output", default="-", help="Output file (default: stdout)")
+    parser.add_argument("--format", choices=("jsonl", "parquet"), default="jsonl")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: CPU count)")
+    parser.add_argument(
+        "--max-pending", type=int, default=256, help="Records read ahead of detection"
+    )
+    args = parser.parse_args(argv)
+
+    if args.format == "parquet" and args.output == "-":
+        parser.error("--format parquet needs an --output file")
+
+    stats = run(args.inputs, args.output, args.format, args.workers, args.max_pending)
+    print(json.dumps(stats), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
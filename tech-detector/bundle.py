@@ -0,0 +1,141 @@
+"""
+Precompiled signature bundles.
+Everything SignatureEngine derives from the signatures at build time
+(validation results, backtracking risk, required literals, header rule
+classification) is written to a versioned file stamped with the signature
+set's content hash. Each process reads the bundle at startup instead of
+parsing every pattern, falls back to compiling from signatures.py when it
+is stale, and compiles the regexes before serving.
+
+The decoded data and compiled regexes belong to each process; processes
+only share them when forked after loading (e.g. gunicorn --preload), and
+then only copy-on-write.
+
+Build step:
+    python bundle.py [--output signatures.bundle]
+"""
+import argparse
+import logging
+import marshal
+import os
+import sys
+import tempfile
+from typing import Dict, List, Optional
+
+from engine import SignatureEngine, signature_version
+
+logger = logging.getLogger(__name__)
+
+SIGNATURE_BUNDLE_PATH = os.environ.get(
+    "SIGNATURE_BUNDLE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "signatures.bundle"),
+)
+# Rewrite the bundle after compiling from source, so the next boot can use it
+SIGNATURE_BUNDLE_WRITE = os.environ.get("SIGNATURE_BUNDLE_WRITE", "true").lower() == "true"
+
+BUNDLE_MAGIC = b"TECHSIG"
+# Bump when what a bundle records changes, including how patterns are rated
+BUNDLE_FORMAT = 4
+
+
+def bundle_stamp(version: str) -> bytes:
+    """
+    Header line identifying a bundle's contents.
+
+    marshal output is only guaranteed stable for one marshal format and
+    Python version, so both are part of the stamp along with the
+    signature set hash.
+    """
+    python = f"{sys.version_info[0]}.{sys.version_info[1]}"
+    return b"%s %d %d %s %s\n" % (
+        BUNDLE_MAGIC, BUNDLE_FORMAT, marshal.version, python.encode(), version.encode()
+    )
+
+
+def write_bundle(engine: SignatureEngine, path: str = SIGNATURE_BUNDLE_PATH):
+    """Write an engine's compiled data to `path`, replacing any old bundle atomically."""
+    payload = marshal.dumps(engine.to_bundle())
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".signatures-", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as handle:
+            handle.write(bundle_stamp(engine.version))
+            handle.write(payload)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def read_bundle(version: str, path: str = SIGNATURE_BUNDLE_PATH) -> Optional[Dict]:
+    """
+    Load a bundle's compiled data if it matches `version` and this interpreter.
+
+    Returns:
+        The data written by write_bundle, or None if the bundle is missing,
+        stale or unreadable
+    """
+    try:
+        with open(path, "rb") as handle:
+            if handle.readline() != bundle_stamp(version):
+                return None
+            return marshal.loads(handle.read())
+    except (OSError, ValueError, EOFError, TypeError) as e:
+        logger.debug("Ignoring signature bundle %s: %s", path, e)
+        return None
+
+
+def load_engine(
+    signatures: List[Dict],
+    mode: str = "prefilter",
+    path: str = SIGNATURE_BUNDLE_PATH
+) -> SignatureEngine:
+    """
+    Build the engine for `signatures`, from the bundle when it is current.
+
+    Every regex is compiled before the engine is returned, so the first
+    requests do not pay for compiling them.
+
+    Args:
+        signatures: Signature dicts as in signatures.py
+        mode: Default matching mode
+        path: Bundle file to read (and refresh after a fallback compile)
+    """
+    version = signature_version(signatures)
+    compiled = read_bundle(version, path)
+    if compiled is not None:
+        engine = SignatureEngine(signatures, mode=mode, compiled=compiled)
+        engine.warm()
+        return engine
+
+    engine = SignatureEngine(signatures, mode=mode)
+    if SIGNATURE_BUNDLE_WRITE:
+        try:
+            write_bundle(engine, path)
+        except OSError as e:  # Read-only deployments just compile every boot
+            logger.info("Could not write signature bundle %s: %s", path, e)
+    return engine
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        description="Precompile signatures.py (and SIGNATURES_PATH) into a bundle."
+    )
+    parser.add_argument("-o", "--output", default=SIGNATURE_BUNDLE_PATH, help="Bundle path")
+    args = parser.parse_args(argv)
+
+    from registry import SIGNATURES_PATH, read_signatures
+
+    engine = SignatureEngine(read_signatures(SIGNATURES_PATH))
+    write_bundle(engine, args.output)
+    print(f"Wrote {args.output}: version {engine.version}, "
+          f"{len(engine.signatures)} signatures, {engine.pattern_count} patterns")
+    for entry in engine.rejected:
+        print(f"  rejected {entry['name']}: {entry['pattern']!r} ({entry['error']})")
+    for entry in engine.risky:
+        print(f"  risky {entry['name']}: {entry['pattern']!r} ({entry['reason']})")
+
+
+if __name__ == "__main__":
+    main()
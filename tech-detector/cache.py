@@ -0,0 +1,255 @@
+"""
+In-memory caches for detection results.
+A thread-safe LRU bounded by entry count and approximate size in bytes,
+plus a domain-level result cache with TTL and stale handling on top of it
+and content-hash keys for memoizing analysis of identical documents.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+from urllib.parse import urlparse
+
+from metrics import METRICS
+
+RESULT_CACHE_TTL_SECONDS = float(os.environ.get("RESULT_CACHE_TTL_SECONDS", 6 * 60 * 60))
+RESULT_CACHE_STALE_SECONDS = float(os.environ.get("RESULT_CACHE_STALE_SECONDS", 7 * 24 * 60 * 60))
+RESULT_CACHE_MAX_ENTRIES = int(os.environ.get("RESULT_CACHE_MAX_ENTRIES", 10000))
+RESULT_CACHE_MAX_BYTES = int(os.environ.get("RESULT_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+
+# Memoized /analyze results, keyed by document hash; zero entries disables it
+ANALYSIS_CACHE_MAX_ENTRIES = int(os.environ.get("ANALYSIS_CACHE_MAX_ENTRIES", 4096))
+ANALYSIS_CACHE_MAX_BYTES = int(os.environ.get("ANALYSIS_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+
+# Ports left out of result cache keys
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+class CacheEntry:
+    """A cached value with its approximate size and the time it was stored."""
+
+    __slots__ = ("value", "size", "stored_at")
+
+    def __init__(self, value: Any, size: int, stored_at: float):
+        self.value = value
+        self.size = size
+        self.stored_at = stored_at
+
+    @property
+    def age(self) -> float:
+        """Seconds since the entry was stored."""
+        return time.time() - self.stored_at
+
+
+class LRUCache:
+    """Least-recently-used cache bounded by entry count and total bytes."""
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[Hashable, CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[CacheEntry]:
+        """Return the entry for key and mark it recently used."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def set(self, key: Hashable, value: Any, size: int):
+        """Store a value, evicting least-recently-used entries to fit."""
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.total_bytes -= old.size
+            self._entries[key] = CacheEntry(value, size, time.time())
+            self.total_bytes += size
+            while len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.total_bytes -= evicted.size
+                self.evictions += 1
+
+    def delete(self, key: Hashable):
+        """Drop a key if present."""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.total_bytes -= entry.size
+
+    def clear(self):
+        """Drop every entry."""
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+    def stats(self) -> Dict:
+        """Counters for monitoring."""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.total_bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+def register_cache_metrics(name: str, get_cache: Callable[[], Optional[LRUCache]]):
+    """
+    Expose an LRU cache's stats as tech_detector_<name>_cache_* metrics.
+
+    Args:
+        name: Cache name used in the metric names
+        get_cache: Returns the cache, or None while it does not exist yet
+    """
+    def collect(field: str) -> Callable:
+        def read():
+            cache = get_cache()
+            return cache.stats()[field] if cache is not None else None
+        return read
+
+    prefix = f"tech_detector_{name}_cache"
+    for field, kind, documentation in (
+        ("hits", "counter", "Lookups that found an entry"),
+        ("misses", "counter", "Lookups that found no entry"),
+        ("evictions", "counter", "Entries evicted to stay within the limits"),
+        ("entries", "gauge", "Entries currently cached"),
+        ("bytes", "gauge", "Approximate size of the cached entries"),
+        ("hit_ratio", "gauge", "Hits per lookup since startup"),
+    ):
+        suffix = f"{field}_total" if kind == "counter" else field
+        METRICS.collected(
+            f"{prefix}_{suffix}", f"{documentation} ({name} cache)", kind, collect(field)
+        )
+
+
+def cache_key(url: str, variant: str = "") -> str:
+    """
+    Normalize a URL to a domain-level cache key.
+
+    Scheme, a leading "www.", query, fragment and trailing slashes are
+    ignored, so "example.com" and "https://www.example.com/" share a key.
+    A port other than the scheme's default is kept, since another port is
+    another server. A `variant` (e.g. a category filter) is appended after
+    a "#".
+    """
+    if not url.startswith(("http://", "https://")):
+        url = f"https://{url}"
+    parsed = urlparse(url)
+    host = (parsed.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    try:
+        port = parsed.port
+    except ValueError:  # Not a number; the fetch fails and nothing is cached
+        port = None
+    if port is not None and port != DEFAULT_PORTS.get(parsed.scheme):
+        host = f"{host}:{port}"
+    key = host + parsed.path.rstrip("/")
+    return f"{key}#{variant}" if variant else key
+
+
+class ResultCache:
+    """
+    Detection results keyed by normalized domain.
+
+    Entries younger than `ttl` are served as hits. Older entries are kept
+    for `stale_ttl` more seconds so they can still be served (as "stale")
+    when a refresh fails; after that they are treated as missing.
+
+    Results limited to some categories are stored under a `variant` of the
+    domain key, so they never stand in for full results.
+    """
+
+    def __init__(
+        self,
+        ttl: float = RESULT_CACHE_TTL_SECONDS,
+        stale_ttl: float = RESULT_CACHE_STALE_SECONDS,
+        max_entries: int = RESULT_CACHE_MAX_ENTRIES,
+        max_bytes: int = RESULT_CACHE_MAX_BYTES
+    ):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.lru = LRUCache(max_entries, max_bytes)
+
+    @property
+    def enabled(self) -> bool:
+        """A TTL of zero turns the cache off."""
+        return self.ttl > 0
+
+    def lookup(self, url: str, variant: str = "") -> Optional[CacheEntry]:
+        """Return the cached entry for a URL unless it is past the stale window."""
+        if not self.enabled:
+            return None
+        entry = self.lru.get(cache_key(url, variant))
+        if entry is None or entry.age > self.ttl + self.stale_ttl:
+            return None
+        return entry
+
+    def is_fresh(self, entry: CacheEntry) -> bool:
+        """Whether an entry can be served without refetching."""
+        return entry.age <= self.ttl
+
+    def store(
+        self,
+        url: str,
+        result: Dict,
+        validators: Optional[Dict] = None,
+        variant: str = ""
+    ):
+        """
+        Cache a successful result under its requested and final URLs.
+
+        Partial results (cut short by the detection budget) are not cached,
+        so the next request gets another chance at a complete one.
+
+        Entry values are {"result": ..., "validators": ...}, where validators
+        hold the ETag, Last-Modified and body hash used to revalidate later.
+        """
+        if not self.enabled or not result.get("success") or result.get("partial"):
+            return
+        value = {"result": result, "validators": validators or {}}
+        size = len(json.dumps(value))
+        key = cache_key(url, variant)
+        self.lru.set(key, value, size)
+        if result.get("final_url"):
+            final_key = cache_key(result["final_url"], variant)
+            if final_key != key:
+                self.lru.set(final_key, value, size)
+
+
+def document_key(html: str, headers: Optional[Dict[str, str]], version: str) -> str:
+    """
+    Hash a document, its headers and the signature set version into a cache key.
+
+    Header names and values are lowercased, as detection matches them, and
+    sorted, so responses that differ only in header case or order (e.g. as
+    captured by different clients) produce the same key.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(version.encode("ascii"))
+    for name, value in sorted((k.lower(), str(v).lower()) for k, v in (headers or {}).items()):
+        digest.update(f"\0{name}\0{value}".encode("utf-8", "surrogatepass"))
+    digest.update(b"\1")
+    digest.update(html.encode("utf-8", "surrogatepass"))
+    return digest.hexdigest()
@@ -0,0 +1,8 @@
+"""
+Shared pytest setup for the tech detector tests.
+"""
+import os
+
+# Keep test runs from writing signatures.bundle or snapshots.sqlite3
+os.environ.setdefault("SIGNATURE_BUNDLE_WRITE", "false")
+os.environ.setdefault("SNAPSHOTS_ENABLED", "false")
@@ -0,0 +1,167 @@
+"""
+Long-running Scrapy crawler for bulk tech detection.
+Runs the Twisted reactor on a background thread inside the API process and
+executes TechSpider batches on it with the project's Scrapy settings.
+"""
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+os.environ.setdefault("SCRAPY_SETTINGS_MODULE", "tech_detector.settings")
+
+from scrapy import signals
+from scrapy.crawler import CrawlerRunner
+from scrapy.utils.defer import deferred_from_coro
+from scrapy.utils.project import get_project_settings
+from scrapy.utils.reactor import install_reactor
+
+from detector import partial_fields
+from fetcher import failed_result
+
+SETTINGS = get_project_settings()
+
+# The reactor has to be installed before anything imports twisted.internet.reactor
+install_reactor(SETTINGS["TWISTED_REACTOR"])
+
+from twisted.internet import reactor  # noqa: E402
+
+from tech_detector.spiders.tech_spider import TechSpider  # noqa: E402
+
+
+def stop_crawler(crawler):
+    """Stop a running crawl, using the coroutine API on newer Scrapy."""
+    if hasattr(crawler, "stop_async"):
+        return deferred_from_coro(crawler.stop_async())
+    return crawler.stop()
+
+
+def item_to_result(item: Dict, url: str) -> Dict:
+    """Convert a TechDetectionItem into the API result shape."""
+    return {
+        "success": item.get("error") is None,
+        "url": url,
+        "final_url": item.get("final_url"),
+        "status_code": item.get("status_code"),
+        "technologies": item.get("technologies", []),
+        "tech_summary": item.get("tech_summary"),
+        "gap_analysis": item.get("gap_analysis"),
+        "crawl_time": item.get("crawl_time"),
+        "error": item.get("error"),
+        "signature_version": item.get("signature_version"),
+        **partial_fields(item),
+        "elapsed_ms": item.get("elapsed_ms"),
+    }
+
+
+class ScrapyBatchRunner:
+    """
+    Runs TechSpider batches on a reactor thread that lives as long as the process.
+
+    Concurrency, retries and timeouts come from tech_detector/settings.py
+    (and TechSpider.custom_settings), so bulk jobs get Scrapy's async
+    downloader instead of a blocking fetch loop.
+    """
+
+    def __init__(self):
+        self.runner = CrawlerRunner(SETTINGS)
+        self._thread = threading.Thread(
+            target=reactor.run,
+            kwargs={"installSignalHandlers": False},
+            name="tech-detector-reactor",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def iter_results(
+        self,
+        urls: List[str],
+        timeout: Optional[float] = None
+    ) -> Iterator[Tuple[int, Dict]]:
+        """
+        Crawl a batch of URLs with TechSpider, yielding items as they are scraped.
+
+        Args:
+            urls: URLs to analyze
+            timeout: Seconds to wait before stopping the crawl; URLs without an
+                item by then get a failed result, as do URLs the finished crawl
+                produced no item for (e.g. requests Scrapy filtered out)
+
+        Yields:
+            (input index, result) in completion order
+        """
+        crawl_time = datetime.utcnow().isoformat()
+        ends_at = None if timeout is None else time.monotonic() + timeout
+        indices: Dict[str, List[int]] = {}
+        for index, url in enumerate(urls):
+            indices.setdefault(TechSpider.normalize_url(url.strip()), []).append(index)
+
+        items: "queue.Queue" = queue.Queue()
+        finished = object()
+        crawler_ref = []
+
+        def collect(item, response, spider):
+            items.put(dict(item))
+
+        def start():
+            crawler = self.runner.create_crawler(TechSpider)
+            crawler.signals.connect(collect, signal=signals.item_scraped)
+            crawler_ref.append(crawler)
+            deferred = self.runner.crawl(crawler, urls=urls)
+            deferred.addBoth(lambda _: items.put(finished))
+
+        reactor.callFromThread(start)
+        crawl_finished = False
+        try:
+            while indices:
+                remaining = None if ends_at is None else ends_at - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                try:
+                    item = items.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is finished:
+                    crawl_finished = True
+                    break
+                for index in indices.pop(item["url"], []):
+                    yield index, item_to_result(item, urls[index])
+        finally:
+            # Stop the crawl on timeout, or if the caller stopped listening
+            if indices and crawler_ref and not crawl_finished:
+                reactor.callFromThread(stop_crawler, crawler_ref[0])
+
+        if crawl_finished:
+            error = "Crawl finished without a result for this URL"
+        else:
+            error = "Batch deadline exceeded"
+        for index in sorted(i for group in indices.values() for i in group):
+            yield index, failed_result(urls[index], crawl_time, error)
+
+    def run(self, urls: List[str], timeout: Optional[float] = None) -> List[Dict]:
+        """
+        Crawl a batch of URLs with TechSpider and wait for the items.
+
+        Returns:
+            One result per URL, in input order (see iter_results)
+        """
+        results: List[Optional[Dict]] = [None] * len(urls)
+        for index, result in self.iter_results(urls, timeout):
+            results[index] = result
+        return results
+
+
+_runner: Optional[ScrapyBatchRunner] = None
+_runner_lock = threading.Lock()
+
+
+def get_runner() -> ScrapyBatchRunner:
+    """Return the process-wide Scrapy runner, starting the reactor on first use."""
+    global _runner
+    if _runner is None:
+        with _runner_lock:
+            if _runner is None:
+                _runner = ScrapyBatchRunner()
+    return _runner
@@ -1,14 +1,63 @@
 """
 Tech stack detector using regex pattern matching.
 """
-import re
-from typing import List, Dict, Optional
-from signatures import TECH_SIGNATURES, CATEGORY_PRIORITY
+import json
+import os
+from typing import Callable, Iterable, List, Dict, Optional, Tuple
+from signatures import CATEGORY_PRIORITY
+from cache import (
+    ANALYSIS_CACHE_MAX_BYTES,
+    ANALYSIS_CACHE_MAX_ENTRIES,
+    LRUCache,
+    document_key,
+    register_cache_metrics,
+)
+from engine import CompiledSignature, SignatureEngine
+from metrics import METRICS
+from profiling import PROFILER, new_profile
+from registry import SignatureRegistry
+
+# Active signature set, shared by the API, the spider and direct callers.
+# Built at import (from the precompiled bundle when it is current) and
+# hot-reloaded from SIGNATURES_PATH, see registry.py
+REGISTRY = SignatureRegistry(mode=os.environ.get("DETECTOR_MODE", "prefilter"))
+METRICS.collected(
+    "tech_detector_signature_reloads_total",
+    "Signature sets swapped in since startup",
+    "counter",
+    lambda: REGISTRY.reloads,
+)
+
+# CPU seconds of HTML matching per document; once spent, the remaining
+# lower-priority categories are skipped and the result is marked partial.
+# 0 disables the budget.
+DETECT_BUDGET_SECONDS = float(os.environ.get("DETECT_BUDGET_SECONDS", 2))
+
+# Categories analyze_tech_gaps looks at: essential for most businesses, and
+# signs of a growing marketing stack
+ESSENTIAL_CATEGORIES = frozenset({"CRM", "Analytics", "Email Marketing"})
+GROWTH_CATEGORIES = frozenset({"Marketing Automation", "Chat", "A/B Testing"})
+GAP_CATEGORIES = ESSENTIAL_CATEGORIES | GROWTH_CATEGORIES
+
+# Full analyses of recently seen documents, see analyze_document
+ANALYSIS_CACHE = LRUCache(ANALYSIS_CACHE_MAX_ENTRIES, ANALYSIS_CACHE_MAX_BYTES)
+register_cache_metrics("analysis", lambda: ANALYSIS_CACHE)
+
+
+def get_engine() -> SignatureEngine:
+    """The active engine; read it once per document so a reload cannot mix signature sets."""
+    return REGISTRY.engine
 
 
 def detect_technologies(
     html: str,
-    headers: Optional[Dict[str, str]] = None
+    headers: Optional[Dict[str, str]] = None,
+    engine: Optional[SignatureEngine] = None,
+    mode: Optional[str] = None,
+    profile: Optional[Dict] = None,
+    status: Optional[Dict] = None,
+    budget: float = DETECT_BUDGET_SECONDS,
+    categories: Optional[Iterable[str]] = None
 ) -> List[Dict]:
     """
     Detect technologies from HTML content and response headers.
@@ -16,65 +65,137 @@ def detect_technologies(
     Args:
         html: The HTML content of the page
         headers: Optional dict of HTTP response headers
+        engine: Signature engine to match with (defaults to the active one)
+        mode: Matching mode, one of engine.MODES (defaults to the engine's)
+        profile: Dict from profiling.new_profile() to record pattern timings
+            into; by default they go to PROFILER while profiling is enabled
+        status: Dict to receive "partial" and "skipped_categories", see
+            SignatureEngine.scan
+        budget: CPU seconds for HTML matching (0 for no limit)
+        categories: Only match signatures of these categories, e.g.
+            GAP_CATEGORIES for what analyze_tech_gaps needs
 
     Returns:
         List of detected technologies with name, category, and confidence
     """
+    engine = engine or get_engine()
+    if categories is not None:
+        engine = engine.subset(categories)
+    budget = budget if budget > 0 else None
+    if profile is None and PROFILER.enabled:
+        document_profile = new_profile()
+        hits = engine.scan(
+            html, headers, mode=mode, profile=document_profile, budget=budget, status=status
+        )
+        PROFILER.merge(document_profile)
+        return format_hits(hits)
+    return format_hits(
+        engine.scan(html, headers, mode=mode, profile=profile, budget=budget, status=status)
+    )
+
+
+def detect_technologies_stream(
+    chunks: Iterable[str],
+    headers: Optional[Dict[str, str]] = None,
+    engine: Optional[SignatureEngine] = None,
+    overlap: int = 4096
+) -> List[Dict]:
+    """
+    Detect technologies from HTML that arrives in decoded text chunks.
+
+    Stops pulling from `chunks` as soon as the scan is complete, so callers
+    reading from the network can stop downloading early.
+
+    Args:
+        chunks: Iterable of decoded HTML text chunks
+        headers: Optional dict of HTTP response headers
+        engine: Signature engine to match with (defaults to the active one)
+        overlap: Characters carried between chunks for boundary matches
+
+    Returns:
+        List of detected technologies, same shape as detect_technologies
+    """
+    engine = engine or get_engine()
+    scanner = engine.stream(headers, overlap=overlap)
+
+    for chunk in chunks:
+        if scanner.feed(chunk):
+            break
+
+    return format_hits(scanner.finish())
+
+
+def resolve_categories(
+    categories: Optional[Iterable[str]] = None,
+    gap_only: bool = False,
+    engine: Optional[SignatureEngine] = None
+) -> Optional[Tuple[str, ...]]:
+    """
+    Turn a request's category filter into the categories to match.
+
+    Args:
+        categories: Category names to detect
+        gap_only: Add the categories analyze_tech_gaps needs
+        engine: Engine whose categories are valid (defaults to the active one)
+
+    Returns:
+        Sorted category names, or None to match every category
+
+    Raises:
+        ValueError: for unknown category names
+    """
+    if categories is None and not gap_only:
+        return None
+    selected = set(categories or ())
+    known = {sig.category for sig in (engine or get_engine()).signatures}
+    unknown = selected - known
+    if unknown:
+        raise ValueError(
+            f"Unknown categories {sorted(unknown)}; expected any of {sorted(known)}"
+        )
+    if gap_only:
+        selected |= GAP_CATEGORIES
+    return tuple(sorted(selected))
+
+
+def filter_fields(categories: Optional[Iterable[str]]) -> Dict:
+    """Result field naming the category filter, for filtered results only."""
+    return {"categories": sorted(categories)} if categories is not None else {}
+
+
+def partial_fields(status: Dict) -> Dict:
+    """Result fields for a detection status: partial, plus what was skipped if so."""
+    if status.get("partial"):
+        return {"partial": True, "skipped_categories": status["skipped_categories"]}
+    return {"partial": False}
+
+
+def format_hits(hits: List[Tuple[CompiledSignature, List[str]]]) -> List[Dict]:
+    """Turn SignatureEngine hits into detection dicts sorted by category priority."""
     detected = []
-    seen = set()
-    headers = headers or {}
-
-    # Normalize headers to lowercase for matching
-    headers_lower = {k.lower(): v.lower() for k, v in headers.items()}
-    headers_str = " ".join(f"{k}: {v}" for k, v in headers_lower.items())
-
-    for sig in TECH_SIGNATURES:
-        if sig["name"] in seen:
-            continue
-
-        match_count = 0
-        matched_patterns = []
-
-        # Check HTML patterns
-        for pattern in sig["patterns"]:
-            try:
-                if re.search(pattern, html, re.IGNORECASE):
-                    match_count += 1
-                    matched_patterns.append(pattern)
-            except re.error:
-                continue
-
-        # Check header patterns
-        for header_pattern in sig.get("headers", []):
-            try:
-                if re.search(header_pattern, headers_str, re.IGNORECASE):
-                    match_count += 1
-                    matched_patterns.append(f"header:{header_pattern}")
-            except re.error:
-                continue
-
-        if match_count > 0:
-            seen.add(sig["name"])
-
-            # Calculate confidence based on number of matches
-            if match_count >= 3:
-                confidence = "high"
-                confidence_score = 0.95
-            elif match_count >= 2:
-                confidence = "high"
-                confidence_score = 0.85
-            else:
-                confidence = "medium"
-                confidence_score = 0.70
-
-            detected.append({
-                "name": sig["name"],
-                "category": sig["category"],
-                "confidence": confidence,
-                "confidence_score": confidence_score,
-                "match_count": match_count,
-                "patterns_matched": matched_patterns[:3],  # Limit for brevity
-            })
+
+    for sig, matched_patterns in hits:
+        match_count = len(matched_patterns)
+
+        # Calculate confidence based on number of matches
+        if match_count >= 3:
+            confidence = "high"
+            confidence_score = 0.95
+        elif match_count >= 2:
+            confidence = "high"
+            confidence_score = 0.85
+        else:
+            confidence = "medium"
+            confidence_score = 0.70
+
+        detected.append({
+            "name": sig.name,
+            "category": sig.category,
+            "confidence": confidence,
+            "confidence_score": confidence_score,
+            "match_count": match_count,
+            "patterns_matched": matched_patterns[:3],  # Limit for brevity
+        })
 
     # Sort by category priority, then by confidence
     detected.sort(key=lambda x: (
@@ -85,21 +206,25 @@ def detect_technologies(
     return detected
 
 
-def analyze_tech_gaps(detected: List[Dict]) -> Dict:
+def analyze_tech_gaps(detected: List[Dict], categories: Optional[Iterable[str]] = None) -> Dict:
     """
     Analyze what essential technologies are missing.
 
     Args:
         detected: List of detected technologies
+        categories: The categories detection was limited to, if any; the
+            others were not matched, so they are not reported missing
 
     Returns:
         Analysis dict with missing categories and opportunities
     """
     detected_categories = {tech["category"] for tech in detected}
 
-    # Essential categories for most businesses
-    essential = {"CRM", "Analytics", "Email Marketing"}
-    growth_indicators = {"Marketing Automation", "Chat", "A/B Testing"}
+    essential = set(ESSENTIAL_CATEGORIES)
+    growth_indicators = set(GROWTH_CATEGORIES)
+    if categories is not None:
+        essential &= set(categories)
+        growth_indicators &= set(categories)
 
     missing_essential = essential - detected_categories
     missing_growth = growth_indicators - detected_categories
@@ -195,3 +320,65 @@ def get_tech_summary(detected: List[Dict]) -> Dict:
         "by_category": by_category,
         "high_confidence_count": sum(1 for t in detected if t["confidence"] == "high"),
     }
+
+
+def analyze_document(
+    html: str,
+    headers: Optional[Dict[str, str]] = None,
+    engine: Optional[SignatureEngine] = None,
+    mode: Optional[str] = None,
+    detect: Optional[Callable[..., List[Dict]]] = None,
+    categories: Optional[Iterable[str]] = None
+) -> Dict:
+    """
+    Detect technologies, gaps and summary for a document, memoized by content.
+
+    Identical documents (same HTML, headers, signature set version and
+    category filter) are served from ANALYSIS_CACHE without running any
+    patterns. All matching modes produce the same result, so the mode is
+    not part of the key. Partial results are not cached.
+
+    Args:
+        html: The HTML content of the page
+        headers: Optional dict of HTTP response headers
+        engine: Signature engine to match with (defaults to the active one)
+        mode: Matching mode, one of engine.MODES (defaults to the engine's)
+        detect: Runs detection on a cache miss as
+            detect(html, headers, mode=mode, engine=engine, status=status),
+            e.g. executor.run_detection (defaults to detect_technologies)
+        categories: Only detect these categories; gaps outside them are not
+            reported
+
+    Returns:
+        Dict with technologies, tech_summary, gap_analysis, the
+        signature_version that produced them and whether the detection
+        budget made the result partial
+    """
+    engine = engine or get_engine()
+    if categories is not None:
+        engine = engine.subset(categories)
+    key = None
+    if ANALYSIS_CACHE.max_entries > 0:
+        key = document_key(html, headers, engine.cache_version)
+        entry = ANALYSIS_CACHE.get(key)
+        if entry is not None:
+            return dict(entry.value)
+
+    status: Dict = {}
+    if detect is None:
+        technologies = detect_technologies(html, headers, engine=engine, mode=mode, status=status)
+    else:
+        technologies = detect(html, headers, mode=mode, engine=engine, status=status)
+    analysis = {
+        "technologies": technologies,
+        "tech_summary": get_tech_summary(technologies),
+        "gap_analysis": analyze_tech_gaps(technologies, categories),
+        "signature_version": engine.version,
+        **filter_fields(categories),
+        **partial_fields(status),
+    }
+
+    # A partial result says more about the load than the document
+    if key is not None and not analysis["partial"]:
+        ANALYSIS_CACHE.set(key, analysis, len(json.dumps(analysis)))
+    return dict(analysis)
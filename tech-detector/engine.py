@@ -0,0 +1,1120 @@
+"""
+Compiled signature engine for tech detection.
+Validates and compiles every signature pattern once so callers can share it.
+"""
+import hashlib
+import json
+import logging
+import re
+import string
+import threading
+import time
+from functools import lru_cache
+from typing import Callable, Dict, FrozenSet, Iterable, List, Optional, Pattern, Set, Tuple
+
+try:
+    import re._parser as sre_parse
+    import re._constants as sre_constants
+except ImportError:  # Python < 3.11
+    import sre_constants
+    import sre_parse
+
+try:
+    import ahocorasick
+except ImportError:  # Optional: falls back to one substring scan per literal
+    ahocorasick = None
+
+from profiling import HITS, RUNS, SECONDS, SKIPS
+from signatures import CATEGORY_PRIORITY
+
+logger = logging.getLogger(__name__)
+
+# Matching modes understood by SignatureEngine.scan
+MODES = ("regex", "prefilter", "alternation")
+
+# Shorter literals hit almost every page and make poor prefilters
+MIN_LITERAL_LENGTH = 3
+
+# Backtracking risk levels reported by pattern_risk. Exponential patterns
+# are rejected at load; polynomial ones are kept but run last, so a spent
+# per-document budget skips them first. The budget cannot stop a search
+# that is already running.
+EXPONENTIAL = "exponential"
+POLYNOMIAL = "polynomial"
+
+# Category subsets kept per engine, see SignatureEngine.subset
+MAX_SUBSETS = 32
+
+# Quantifiers that backtrack (possessive ones and atomic groups do not)
+_BACKTRACKING_REPEATS = (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT)
+
+# Flags of a pattern without inline global flags, and group references;
+# patterns with either cannot be joined into an alternation
+_DEFAULT_FLAGS = sre_parse.parse("").state.flags
+_GROUP_REFERENCES = (sre_constants.GROUPREF, sre_constants.GROUPREF_EXISTS)
+
+# An HTML pattern as (signature index, pattern index) into an engine's
+# signatures, and a function returning which pending ones match a window
+PatternKey = Tuple[int, int]
+WindowMatcher = Callable[[str, List[PatternKey]], List[PatternKey]]
+
+# ASCII members of the character classes pattern_risk can compare
+_CATEGORY_CHARS = {
+    sre_constants.CATEGORY_DIGIT: frozenset(string.digits),
+    sre_constants.CATEGORY_WORD: frozenset(string.ascii_lowercase + string.digits + "_"),
+    sre_constants.CATEGORY_SPACE: frozenset(" \t\n\r\f\v"),
+}
+
+
+def extract_literals(pattern: str) -> List[str]:
+    """
+    Extract lowercase literal substrings that any match of a pattern must contain.
+
+    Only runs of plain characters in the top-level sequence are used, so a
+    pattern with alternation, groups or classes at the top level simply
+    yields fewer (or no) literals. A pattern with no literals always runs.
+
+    Args:
+        pattern: Regex source as written in signatures.py
+
+    Returns:
+        Required literals of at least MIN_LITERAL_LENGTH characters
+    """
+    literals = []
+    run = []
+
+    for op, arg in list(sre_parse.parse(pattern)) + [(None, None)]:
+        if op is sre_parse.LITERAL:
+            run.append(chr(arg))
+            continue
+        if len(run) >= MIN_LITERAL_LENGTH:
+            literals.append("".join(run).lower())
+        run = []
+
+    return literals
+
+
+def literal_text(pattern: str) -> Optional[str]:
+    """Return the plain text a pattern matches if it has no regex syntax."""
+    chars = []
+    for op, arg in sre_parse.parse(pattern):
+        if op is not sre_parse.LITERAL:
+            return None
+        chars.append(chr(arg))
+    return "".join(chars).lower()
+
+
+def pattern_risk(pattern: str) -> Optional[Tuple[str, str]]:
+    r"""
+    Statically check a pattern for catastrophic backtracking.
+
+    Only backtracking that is certain is rated exponential; constructs that
+    may backtrack heavily, but could not be shown to, are rated polynomial
+    so they are kept and run last. The detection budget is only checked
+    between patterns, so anything that can blow up must be rated exponential
+    here to be kept out.
+
+    Flags, from worst to mildest:
+        an unbounded quantifier around another that can match the same text
+            on its next repetition, e.g. (a+)+, (?:a*)* or (a*b*)*, or
+            around two adjacent ones over the same characters, e.g. (x+x+)+
+            (exponential)
+        alternatives that match the same text under an unbounded quantifier,
+            e.g. (ab|[a-z]b)* (exponential)
+        other nested unbounded quantifiers and alternatives that may start
+            alike under one (polynomial); they are not flagged when the text
+            between repetitions provably cannot be confused, e.g.
+            ([a-z0-9-]+\.)+ or (?:\d|x)+
+        unbounded wildcards, e.g. cdn\.jsdelivr\.net.*bootstrap, which rescan
+            the rest of the line from every candidate start; a minified
+            bundle is one multi-megabyte line (polynomial)
+
+    Args:
+        pattern: Regex source as written in signatures.py
+
+    Returns:
+        (EXPONENTIAL or POLYNOMIAL, reason), or None if nothing was flagged
+    """
+    findings: List[Tuple[str, str]] = []
+    _find_risks(sre_parse.parse(pattern), False, findings)
+    for level in (EXPONENTIAL, POLYNOMIAL):
+        reasons = [reason for found, reason in findings if found == level]
+        if reasons:
+            if len(reasons) > 1 and set(reasons) == {"unbounded wildcard"}:
+                return level, f"{len(reasons)} unbounded wildcards"
+            return level, reasons[0]
+    return None
+
+
+def _find_risks(items, in_repeat: bool, findings: List[Tuple[str, str]]):
+    """Walk a parsed pattern, noting risky constructs (see pattern_risk)."""
+    for op, arg in items:
+        if op in _BACKTRACKING_REPEATS:
+            _, high, body = arg
+            unbounded = high == sre_constants.MAXREPEAT
+            if unbounded:
+                risk = _nested_repeat_risk(body)
+                if risk is not None:
+                    findings.append(risk)
+                if any(item_op is sre_constants.ANY for item_op, _ in body):
+                    findings.append((POLYNOMIAL, "unbounded wildcard"))
+            _find_risks(body, in_repeat or unbounded, findings)
+        elif op is sre_constants.BRANCH:
+            alternatives = arg[1]
+            if in_repeat:
+                risk = _alternatives_risk(alternatives)
+                if risk is not None:
+                    findings.append(risk)
+            for alternative in alternatives:
+                _find_risks(alternative, in_repeat, findings)
+        elif op is sre_constants.SUBPATTERN:
+            _find_risks(arg[-1], in_repeat, findings)
+        elif op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            _find_risks(arg[1], in_repeat, findings)
+
+
+def _nested_repeat_risk(body) -> Optional[Tuple[str, str]]:
+    r"""
+    Rate unbounded quantifiers inside the body of an unbounded quantifier.
+
+    A run of text can be split between an inner repeat and whatever may
+    follow it in exponentially many ways when that is the same repeat on the
+    next repetition, e.g. (a+)+, (?:a*)* or (\w+\s?)+ whose other items may
+    match nothing, or another repeat over the same characters, e.g. (x+x+)+;
+    items that may match nothing are looked past, so (a*b*)* is caught too.
+    An inner single-character repeat followed by a character it cannot match,
+    e.g. [a-z]+ then \. in ([a-z]+\.)+, can only end in one place, so it is
+    safe.
+    """
+    sequence = _flatten(body)
+    inner = [
+        index for index, (op, arg) in enumerate(sequence)
+        if op in _BACKTRACKING_REPEATS and arg[1] == sre_constants.MAXREPEAT
+    ]
+    if not inner:
+        if any(_has_unbounded_repeat(item) for item in sequence):
+            return POLYNOMIAL, "nested unbounded quantifiers"
+        return None
+
+    for index in inner:
+        repeated = _repeat_chars(sequence[index])
+        # Walk on past the end of the body into the next repetition
+        for step in range(1, len(sequence) + 1):
+            position = (index + step) % len(sequence)
+            if position == index:
+                return EXPONENTIAL, "nested unbounded quantifiers"
+            op, arg = sequence[position]
+            if position in inner:
+                following = _repeat_chars(sequence[position])
+                if repeated is not None and following is not None and repeated & following:
+                    return EXPONENTIAL, "adjacent unbounded quantifiers over the same text"
+            if op not in _BACKTRACKING_REPEATS or arg[0] > 0:
+                break
+
+    for index in inner:
+        repeated = _repeat_chars(sequence[index])
+        # The last item is followed by the next repetition's first one
+        following = _first_chars(sequence[index + 1:index + 2] or sequence[:1])
+        if repeated is None or following is None or repeated & following:
+            return POLYNOMIAL, "nested unbounded quantifiers"
+    return None
+
+
+def _repeat_chars(item) -> Optional[FrozenSet[str]]:
+    """Characters a repeat of one single-character item matches, else None."""
+    chars = _fixed_chars(item[1][2])
+    return chars[0] if chars is not None and len(chars) == 1 else None
+
+
+def _alternatives_risk(alternatives) -> Optional[Tuple[str, str]]:
+    """Rate the alternatives of a branch under an unbounded quantifier."""
+    fixed = [_fixed_chars(alternative) for alternative in alternatives]
+    for index, chars in enumerate(fixed):
+        for other in fixed[index + 1:]:
+            if chars is not None and other is not None and len(chars) == len(other) and all(
+                a & b for a, b in zip(chars, other)
+            ):
+                return EXPONENTIAL, "alternatives matching the same text under a quantifier"
+
+    firsts = [_first_chars(alternative) for alternative in alternatives]
+    if None not in firsts and sum(map(len, firsts)) == len(frozenset().union(*firsts)):
+        return None
+    return POLYNOMIAL, "alternatives that may overlap under a quantifier"
+
+
+def _flatten(items) -> List:
+    """The items of a parsed sequence with groups expanded in place."""
+    flat = []
+    for op, arg in items:
+        if op is sre_constants.SUBPATTERN:
+            flat.extend(_flatten(arg[-1]))
+        else:
+            flat.append((op, arg))
+    return flat
+
+
+def _has_unbounded_repeat(item) -> bool:
+    """Whether a parsed item contains an unbounded quantifier at any depth."""
+    return any(
+        op in _BACKTRACKING_REPEATS and arg[1] == sre_constants.MAXREPEAT
+        for op, arg in _walk_items([item])
+    )
+
+
+def _walk_items(items):
+    """Yield every (op, arg) of a parsed pattern, including nested ones."""
+    for op, arg in items:
+        yield op, arg
+        for child in arg if isinstance(arg, (list, tuple)) else (arg,):
+            for item in child if isinstance(child, list) else (child,):
+                if isinstance(item, sre_parse.SubPattern):
+                    yield from _walk_items(item)
+
+
+def _char_set(op, arg) -> Optional[FrozenSet[str]]:
+    r"""
+    Lowercased characters a single-character item matches.
+
+    None when the item is not a single character, or the set is negated,
+    large or a category other than \d, \w and \s (counted as ASCII).
+    """
+    if op is sre_constants.LITERAL:
+        return frozenset(chr(arg).lower())
+    if op is not sre_constants.IN:
+        return None
+    chars: Set[str] = set()
+    for item_op, item_arg in arg:
+        if item_op is sre_constants.LITERAL:
+            chars.add(chr(item_arg).lower())
+        elif item_op is sre_constants.RANGE and item_arg[1] - item_arg[0] < 256:
+            chars.update(chr(code).lower() for code in range(item_arg[0], item_arg[1] + 1))
+        elif item_op is sre_constants.CATEGORY and item_arg in _CATEGORY_CHARS:
+            chars.update(_CATEGORY_CHARS[item_arg])
+        else:
+            return None
+    return frozenset(chars)
+
+
+def _fixed_chars(items) -> Optional[List[FrozenSet[str]]]:
+    """Character sets of a sequence made only of single characters, else None."""
+    sets = []
+    for op, arg in _flatten(items):
+        chars = _char_set(op, arg)
+        if chars is None:
+            return None
+        sets.append(chars)
+    return sets
+
+
+def _first_chars(items) -> Optional[FrozenSet[str]]:
+    """Characters any match of a parsed sequence starts with, or None if unknown."""
+    for op, arg in _flatten(items):
+        if op in _BACKTRACKING_REPEATS:
+            return _first_chars(arg[2]) if arg[0] > 0 else None
+        if op is sre_constants.BRANCH:
+            firsts = [_first_chars(alternative) for alternative in arg[1]]
+            return None if None in firsts else frozenset().union(*firsts)
+        return _char_set(op, arg)
+    return None
+
+
+class LiteralIndex:
+    """
+    Finds which of a fixed set of literals occur in a lowercased document.
+
+    Uses a single Aho-Corasick pass when pyahocorasick is installed,
+    otherwise one fast substring search per literal.
+    """
+
+    def __init__(self, literals: Iterable[str]):
+        self.literals = sorted(set(literals))
+        self._automaton = None
+
+        if ahocorasick is not None and self.literals:
+            self._automaton = ahocorasick.Automaton()
+            for literal in self.literals:
+                self._automaton.add_word(literal, literal)
+            self._automaton.make_automaton()
+
+    @property
+    def uses_aho_corasick(self) -> bool:
+        """Whether lookups run as a single Aho-Corasick pass."""
+        return self._automaton is not None
+
+    def find(self, text: str) -> Set[str]:
+        """Return the literals present in already-lowercased text."""
+        if self._automaton is not None:
+            return {literal for _, literal in self._automaton.iter(text)}
+        return {literal for literal in self.literals if literal in text}
+
+
+class CompiledPattern:
+    """
+    A compiled regex plus the literals any of its matches must contain.
+
+    `risk` is the pattern_risk level of HTML patterns that were flagged.
+    """
+
+    __slots__ = ("source", "literals", "risk", "_regex")
+
+    def __init__(
+        self,
+        source: str,
+        regex: Optional[Pattern],
+        literals: List[str],
+        risk: Optional[str] = None
+    ):
+        self.source = source
+        self.literals = literals
+        self.risk = risk
+        self._regex = regex
+
+    @property
+    def regex(self) -> Pattern:
+        """The compiled regex; patterns loaded from a bundle compile on first use."""
+        if self._regex is None:
+            self._regex = re.compile(self.source, re.IGNORECASE)
+        return self._regex
+
+
+class CompiledSignature:
+    """A technology signature with its HTML and header patterns compiled."""
+
+    __slots__ = ("name", "category", "patterns", "headers")
+
+    def __init__(
+        self,
+        name: str,
+        category: str,
+        patterns: List[CompiledPattern],
+        headers: List[CompiledPattern],
+    ):
+        self.name = name
+        self.category = category
+        self.patterns = patterns
+        self.headers = headers
+
+
+@lru_cache(maxsize=512)
+def _compile_alternation(groups: Tuple[Tuple[str, str], ...]) -> Pattern:
+    """Compile (group name, pattern) pairs into one zero-width alternation."""
+    # The lookahead keeps matches zero-width, so overlapping hits from
+    # different patterns are all seen in a single finditer pass
+    body = "|".join(f"(?P<{name}>{source})" for name, source in groups)
+    return re.compile(f"(?=(?:{body}))", re.IGNORECASE)
+
+
+@lru_cache(maxsize=4096)
+def fits_alternation(pattern: str) -> bool:
+    """
+    Whether a pattern keeps its meaning inside a combined alternation.
+
+    Inline global flags such as (?i) are only allowed at the very start of a
+    regex, and group references (backreferences, named groups, conditionals)
+    would point at other groups once patterns are wrapped and joined. Such
+    patterns are run one at a time instead.
+    """
+    try:
+        parsed = sre_parse.parse(pattern)
+    except re.error:
+        return False
+    if parsed.state.flags != _DEFAULT_FLAGS or parsed.state.groupdict:
+        return False
+    return not any(op in _GROUP_REFERENCES for op, _ in _walk_items(parsed))
+
+
+class CategoryAlternation:
+    """
+    All HTML patterns of one category combined into a single regex.
+
+    Each pattern gets a named group `s<signature index>_<pattern index>`,
+    so a match maps straight back to the signature and pattern that hit.
+    Patterns that do not fit an alternation (see fits_alternation) are
+    searched one at a time.
+    """
+
+    def __init__(self, category: str):
+        self.category = category
+        self.groups: Dict[str, CompiledPattern] = {}
+
+    def add(self, sig_index: int, pattern_index: int, pattern: CompiledPattern):
+        """Register a pattern under its signature and pattern index."""
+        self.groups[f"s{sig_index}_{pattern_index}"] = pattern
+
+    def find(
+        self,
+        html: str,
+        candidate: Optional[Callable[[CompiledPattern], bool]] = None,
+        deadline: Optional[float] = None
+    ) -> Tuple[Set[CompiledPattern], bool]:
+        """
+        Return the patterns of the category that match the document.
+
+        Only patterns `candidate` accepts are tried; scan passes the literal
+        prefilter, so the combined regex stays small and most categories
+        need no pass at all. At any one position only the first matching
+        alternative is reported, so patterns shadowed by another are picked
+        up in a follow-up pass over the patterns not yet found. The loop ends
+        when a pass finds nothing new, which proves none of the remaining
+        patterns can match.
+
+        Returns:
+            (matched patterns, complete); complete is False if the thread's
+            CPU time passed `deadline` before every pass had run
+        """
+        remaining = []
+        found: Set[CompiledPattern] = set()
+        for name, pattern in self.groups.items():
+            if candidate is not None and not candidate(pattern):
+                continue
+            if fits_alternation(pattern.source):
+                remaining.append(name)
+            elif pattern.regex.search(html):
+                found.add(pattern)
+
+        while remaining:
+            if deadline is not None and time.thread_time() > deadline:
+                return found, False
+            groups = tuple((name, self.groups[name].source) for name in remaining)
+            try:
+                regex = _compile_alternation(groups)
+            except re.error:
+                # Should fits_alternation miss a case, lose speed, not results
+                found.update(
+                    self.groups[name] for name in remaining
+                    if self.groups[name].regex.search(html)
+                )
+                break
+            new = {match.lastgroup for match in regex.finditer(html)}
+            if not new:
+                break
+            found.update(self.groups[name] for name in new)
+            remaining = [name for name in remaining if name not in new]
+
+        return found, True
+
+
+class HeaderIndex:
+    """
+    Header rules indexed by response header name.
+
+    Rules are classified once when the engine is built:
+        "name: value"  header `name` whose value starts with `value`
+        "prefix-"      any header whose name starts with `prefix-`
+        "name-with-dash"  header named exactly `name-with-dash`
+    Anything else (bare words like "fastly", or rules using regex syntax)
+    falls back to searching the joined "name: value" header string.
+    """
+
+    def __init__(self):
+        self.exact: Dict[str, List[Tuple[CompiledPattern, Optional[str]]]] = {}
+        self.prefixes: Dict[str, List[CompiledPattern]] = {}
+        self.prefix_lengths: List[int] = []
+        self.fallback: List[CompiledPattern] = []
+
+    def add(self, rule: CompiledPattern, text: Optional[str] = None, parsed: bool = False):
+        """
+        Index a single header rule.
+
+        Args:
+            rule: Compiled header rule
+            text: The rule's literal_text, when already known (with parsed=True)
+        """
+        if not parsed:
+            text = literal_text(rule.source)
+
+        if text is None:
+            self.fallback.append(rule)
+        elif ": " in text:
+            name, value = text.split(": ", 1)
+            self.exact.setdefault(name, []).append((rule, value))
+        elif text.endswith("-"):
+            self.prefixes.setdefault(text, []).append(rule)
+            self.prefix_lengths = sorted({len(p) for p in self.prefixes})
+        elif "-" in text:
+            self.exact.setdefault(text, []).append((rule, None))
+        else:
+            self.fallback.append(rule)
+
+    def match(self, headers_lower: Dict[str, str]) -> Set[CompiledPattern]:
+        """
+        Return the header rules matched by a response.
+
+        Args:
+            headers_lower: Response headers with names and values lowercased
+        """
+        matched = set()
+
+        for name, value in headers_lower.items():
+            for rule, expected in self.exact.get(name, ()):
+                if expected is None or value.startswith(expected):
+                    matched.add(rule)
+            for length in self.prefix_lengths:
+                matched.update(self.prefixes.get(name[:length], ()))
+
+        if self.fallback and headers_lower:
+            headers_str = " ".join(f"{k}: {v}" for k, v in headers_lower.items())
+            matched.update(
+                rule for rule in self.fallback if rule.regex.search(headers_str)
+            )
+
+        return matched
+
+
+def signature_version(signatures: List[Dict]) -> str:
+    """
+    Short content hash of a signature set.
+
+    Changes whenever a name, category or pattern changes, so anything cached
+    against one signature set is never served for another.
+    """
+    canonical = json.dumps(
+        [
+            [sig["name"], sig["category"], sig["patterns"], sig.get("headers", [])]
+            for sig in signatures
+        ],
+        sort_keys=True,
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:12]
+
+
+class SignatureEngine:
+    """
+    Holds compiled, validated signatures and matches documents against them.
+
+    Invalid patterns, and HTML patterns prone to exponential backtracking,
+    are rejected when the engine is built and recorded in `rejected`, so
+    matching never has to re-validate anything. Polynomial-risk patterns
+    are kept and listed in `risky`.
+
+    HTML patterns are run in `evaluation_order`: by category priority, with
+    risky patterns after all others, so a per-document budget (see scan)
+    drops the least important and most expensive work first.
+
+    Modes:
+        regex: run every compiled pattern over the document
+        prefilter: find required literals in one pass over the lowercased
+            document and only run patterns whose literals were all found
+        alternation: like prefilter, but run the remaining patterns of each
+            category as one combined regex and collect all pattern hits
+            from its matches
+
+    `subset` derives engines limited to some categories, for callers that
+    only need those; `categories` is None for the full set.
+    """
+
+    def __init__(
+        self,
+        signatures: List[Dict],
+        mode: str = "prefilter",
+        compiled: Optional[Dict] = None
+    ):
+        """
+        Args:
+            signatures: Signature dicts as in signatures.py
+            mode: Default matching mode, one of MODES
+            compiled: Output of to_bundle() for these signatures; skips
+                validation and literal extraction, and defers regex
+                compilation until each pattern is first used
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown matching mode: {mode}")
+
+        self.mode = mode
+        self.precompiled = compiled is not None
+        self.categories: Optional[Tuple[str, ...]] = None
+        self.signatures: List[CompiledSignature] = []
+        self.rejected: List[Dict] = []
+        self.risky: List[Dict] = []
+        self._subsets: Dict[Tuple[str, ...], "SignatureEngine"] = {}
+        self._subsets_lock = threading.Lock()
+        header_texts: List[Tuple[CompiledPattern, Optional[str]]] = []
+
+        if compiled is not None:
+            self.version = compiled["version"]
+            self.rejected = [dict(entry) for entry in compiled["rejected"]]
+            self.risky = [dict(entry) for entry in compiled["risky"]]
+            risks = {(entry["name"], entry["pattern"]): entry["risk"] for entry in self.risky}
+            for name, category, patterns, headers in compiled["signatures"]:
+                rules = []
+                for source, literals, text in headers:
+                    rule = CompiledPattern(source, None, list(literals))
+                    header_texts.append((rule, text))
+                    rules.append(rule)
+                self.signatures.append(CompiledSignature(
+                    name=name,
+                    category=category,
+                    patterns=[
+                        CompiledPattern(source, None, list(literals), risks.get((name, source)))
+                        for source, literals, _ in patterns
+                    ],
+                    headers=rules,
+                ))
+        else:
+            self.version = signature_version(signatures)
+            for sig in signatures:
+                self.signatures.append(CompiledSignature(
+                    name=sig["name"],
+                    category=sig["category"],
+                    patterns=self._compile_all(sig, sig["patterns"], "html"),
+                    headers=self._compile_all(sig, sig.get("headers", []), "header"),
+                ))
+
+        self._build_indexes(header_texts if compiled is not None else None)
+
+        for entry in self.rejected:
+            logger.warning(
+                "Rejected %s pattern %r for %s: %s",
+                entry["kind"], entry["pattern"], entry["name"], entry["error"],
+            )
+        for entry in self.risky:
+            logger.info(
+                "Pattern %r for %s risks slow backtracking (%s); it runs last",
+                entry["pattern"], entry["name"], entry["reason"],
+            )
+
+    def _build_indexes(
+        self,
+        header_texts: Optional[List[Tuple[CompiledPattern, Optional[str]]]] = None
+    ):
+        """
+        Build the literal, header, evaluation order and alternation indexes.
+
+        Args:
+            header_texts: (rule, literal_text) for every header rule when
+                already known, as stored in a bundle
+        """
+        self.literal_index = LiteralIndex(
+            literal
+            for sig in self.signatures
+            for pattern in sig.patterns
+            for literal in pattern.literals
+        )
+
+        self.header_index = HeaderIndex()
+        if header_texts is not None:
+            for rule, text in header_texts:
+                self.header_index.add(rule, text, parsed=True)
+        else:
+            for sig in self.signatures:
+                for rule in sig.headers:
+                    self.header_index.add(rule)
+
+        def priority(sig: CompiledSignature) -> int:
+            return CATEGORY_PRIORITY.get(sig.category, 99)
+
+        # Stable sorts keep signature order within a category
+        self.evaluation_order: List[Tuple[CompiledSignature, CompiledPattern]] = sorted(
+            ((sig, pattern) for sig in self.signatures for pattern in sig.patterns),
+            key=lambda item: (item[1].risk is not None, priority(item[0])),
+        )
+
+        self.alternations: Dict[str, CategoryAlternation] = {}
+        for sig_index, sig in sorted(enumerate(self.signatures), key=lambda x: priority(x[1])):
+            alternation = self.alternations.setdefault(
+                sig.category, CategoryAlternation(sig.category)
+            )
+            for pattern_index, pattern in enumerate(sig.patterns):
+                alternation.add(sig_index, pattern_index, pattern)
+
+    def subset(self, categories: Iterable[str]) -> "SignatureEngine":
+        """
+        Engine limited to the signatures of `categories`.
+
+        Subsets share this engine's compiled patterns, so building one
+        compiles nothing; they keep its version and are built once per
+        category set. The engine itself is returned when the set covers
+        every category.
+        """
+        key = tuple(sorted(set(categories)))
+        if self.categories is not None:
+            key = tuple(category for category in key if category in self.categories)
+        if set(key) >= {sig.category for sig in self.signatures}:
+            return self
+
+        with self._subsets_lock:
+            engine = self._subsets.get(key)
+            if engine is not None:
+                return engine
+
+            engine = SignatureEngine.__new__(SignatureEngine)
+            engine.mode = self.mode
+            engine.precompiled = self.precompiled
+            engine.version = self.version
+            engine.categories = key
+            engine.signatures = [sig for sig in self.signatures if sig.category in key]
+            names = {sig.name for sig in engine.signatures}
+            engine.rejected = [entry for entry in self.rejected if entry["name"] in names]
+            engine.risky = [entry for entry in self.risky if entry["name"] in names]
+            engine._subsets = {}
+            engine._subsets_lock = threading.Lock()
+            engine._build_indexes()
+
+            if len(self._subsets) >= MAX_SUBSETS:
+                self._subsets.pop(next(iter(self._subsets)))
+            self._subsets[key] = engine
+            return engine
+
+    @property
+    def cache_version(self) -> str:
+        """The version, plus the category filter of a subset, for cache keys."""
+        if self.categories is None:
+            return self.version
+        return f"{self.version}:{','.join(self.categories)}"
+
+    def _compile_all(
+        self,
+        sig: Dict,
+        patterns: List[str],
+        kind: str
+    ) -> List[CompiledPattern]:
+        """Compile a list of patterns, recording the ones that fail or are risky."""
+        compiled = []
+        for pattern in patterns:
+            try:
+                regex = re.compile(pattern, re.IGNORECASE)
+            except re.error as e:
+                self._reject(sig, kind, pattern, str(e))
+                continue
+
+            # Header rules only ever search the short joined header string
+            risk = pattern_risk(pattern) if kind == "html" else None
+            if risk is not None and risk[0] == EXPONENTIAL:
+                self._reject(sig, kind, pattern, f"catastrophic backtracking risk: {risk[1]}")
+                continue
+            if risk is not None:
+                self.risky.append({
+                    "name": sig["name"],
+                    "pattern": pattern,
+                    "risk": risk[0],
+                    "reason": risk[1],
+                })
+
+            compiled.append(CompiledPattern(
+                pattern,
+                regex,
+                extract_literals(pattern),
+                risk[0] if risk is not None else None,
+            ))
+        return compiled
+
+    def _reject(self, sig: Dict, kind: str, pattern: str, error: str):
+        self.rejected.append({
+            "name": sig["name"],
+            "kind": kind,
+            "pattern": pattern,
+            "error": error,
+        })
+
+    def to_bundle(self) -> Dict:
+        """
+        Export everything derived from the signatures at build time.
+
+        The result only holds plain strings, lists and dicts so it can be
+        serialized (see bundle.py) and passed back as `compiled`.
+        """
+        return {
+            "version": self.version,
+            "rejected": [dict(entry) for entry in self.rejected],
+            "risky": [dict(entry) for entry in self.risky],
+            "signatures": [
+                [
+                    sig.name,
+                    sig.category,
+                    [[p.source, list(p.literals), None] for p in sig.patterns],
+                    [[r.source, list(r.literals), literal_text(r.source)] for r in sig.headers],
+                ]
+                for sig in self.signatures
+            ],
+        }
+
+    def warm(self):
+        """Compile every pattern now rather than on its first match."""
+        for sig in self.signatures:
+            for pattern in sig.patterns + sig.headers:
+                pattern.regex
+
+    @property
+    def pattern_count(self) -> int:
+        """Number of compiled HTML and header patterns."""
+        return sum(len(s.patterns) + len(s.headers) for s in self.signatures)
+
+    def load_report(self) -> Dict:
+        """Summarize what was compiled and what was rejected at load."""
+        return {
+            "version": self.version,
+            "precompiled": self.precompiled,
+            "signatures": len(self.signatures),
+            "patterns": self.pattern_count,
+            "literals": len(self.literal_index.literals),
+            "aho_corasick": self.literal_index.uses_aho_corasick,
+            "header_fallback_rules": [r.source for r in self.header_index.fallback],
+            "rejected": list(self.rejected),
+            "risky": list(self.risky),
+        }
+
+    def scan(
+        self,
+        html: str,
+        headers: Optional[Dict[str, str]] = None,
+        mode: Optional[str] = None,
+        profile: Optional[Dict] = None,
+        budget: Optional[float] = None,
+        status: Optional[Dict] = None
+    ) -> List[Tuple[CompiledSignature, List[str]]]:
+        """
+        Match a document against every signature.
+
+        Args:
+            html: The HTML content of the page
+            headers: Optional dict of HTTP response headers
+            mode: Matching mode (defaults to the engine's mode)
+            profile: Dict from profiling.new_profile() to record pattern
+                runs, prefilter skips, hits and time into
+            budget: CPU seconds this thread may spend on HTML patterns. The
+                budget is checked before each pattern (each alternation pass
+                in alternation mode), so once it is spent the remaining, lower
+                priority patterns are skipped. None runs everything.
+            status: Dict to receive "partial" (True if the budget cut the
+                scan short) and "skipped_categories"
+
+        Returns:
+            List of (signature, matched patterns) for signatures that matched,
+            in signature order
+        """
+        mode = mode or self.mode
+        if mode not in MODES:
+            raise ValueError(f"Unknown matching mode: {mode}")
+
+        started = time.perf_counter()
+        deadline = time.thread_time() + budget if budget is not None else None
+        skipped: Set[str] = set()
+
+        prefilter = mode != "regex"
+        found = self.literal_index.find(html.lower()) if prefilter else set()
+
+        def has_literals(pattern: CompiledPattern) -> bool:
+            return all(lit in found for lit in pattern.literals)
+
+        candidate = has_literals if prefilter else None
+
+        if mode == "alternation":
+            matched = set()
+            for category, alternation in self.alternations.items():
+                if deadline is not None and time.thread_time() > deadline:
+                    skipped.add(category)
+                    continue
+                pass_started = time.perf_counter()
+                category_matched, complete = alternation.find(html, candidate, deadline)
+                matched |= category_matched
+                if not complete:
+                    skipped.add(category)
+                if profile is not None:
+                    elapsed = time.perf_counter() - pass_started
+                    profile["alternations"][category] = (
+                        profile["alternations"].get(category, 0.0) + elapsed
+                    )
+        else:
+            matched = self._match_patterns(html, candidate, deadline, skipped, profile)
+
+        hits = self._collect(matched.__contains__, headers, profile)
+        if status is not None:
+            status["partial"] = bool(skipped)
+            status["skipped_categories"] = sorted(
+                skipped, key=lambda category: CATEGORY_PRIORITY.get(category, 99)
+            )
+        if profile is not None:
+            profile["documents"] += 1
+            profile["seconds"] += time.perf_counter() - started
+        return hits
+
+    def _match_patterns(
+        self,
+        html: str,
+        candidate: Optional[Callable[[CompiledPattern], bool]],
+        deadline: Optional[float],
+        skipped: Set[str],
+        profile: Optional[Dict] = None
+    ) -> Set[CompiledPattern]:
+        """
+        Run the HTML patterns in evaluation_order and return those that match.
+
+        Patterns `candidate` rules out are not run (and count as skipped in
+        the profile). Once the thread's CPU time passes `deadline`, no more
+        patterns are started and their categories are added to `skipped`.
+        """
+        matched = set()
+        over_budget = False
+
+        for sig, pattern in self.evaluation_order:
+            if candidate is not None and not candidate(pattern):
+                if profile is not None:
+                    _pattern_stats(profile, sig.name, pattern.source)[SKIPS] += 1
+                continue
+            if deadline is not None and (over_budget or time.thread_time() > deadline):
+                over_budget = True
+                skipped.add(sig.category)
+                continue
+
+            if profile is None:
+                if pattern.regex.search(html):
+                    matched.add(pattern)
+                continue
+
+            stats = _pattern_stats(profile, sig.name, pattern.source)
+            started = time.perf_counter()
+            hit = pattern.regex.search(html) is not None
+            stats[SECONDS] += time.perf_counter() - started
+            stats[RUNS] += 1
+            if hit:
+                stats[HITS] += 1
+                matched.add(pattern)
+
+        return matched
+
+    def stream(
+        self,
+        headers: Optional[Dict[str, str]] = None,
+        overlap: int = 4096,
+        match: Optional[WindowMatcher] = None
+    ) -> "StreamScanner":
+        """
+        Start an incremental scan fed with chunks of decoded HTML.
+
+        `match` replaces match_window for each chunk, e.g. to run it in a
+        worker process (see executor.DetectionExecutor.window_matcher).
+        """
+        return StreamScanner(self, headers, overlap, match or self.match_window)
+
+    def match_window(self, window: str, pending: List[PatternKey]) -> List[PatternKey]:
+        """
+        Which of the `pending` HTML patterns match a window of a document.
+
+        Patterns are (signature index, pattern index) pairs, so an engine
+        with the same signatures in another process can do the work.
+        """
+        found = self.literal_index.find(window.lower())
+        matched = []
+        for sig_index, pattern_index in pending:
+            pattern = self.signatures[sig_index].patterns[pattern_index]
+            if all(lit in found for lit in pattern.literals) and pattern.regex.search(window):
+                matched.append((sig_index, pattern_index))
+        return matched
+
+    def _collect(
+        self,
+        html_match: Callable[[CompiledPattern], bool],
+        headers: Optional[Dict[str, str]],
+        profile: Optional[Dict] = None
+    ) -> List[Tuple[CompiledSignature, List[str]]]:
+        """
+        Assemble per-signature hits from an HTML predicate and headers.
+
+        With a `profile`, header rule runs and hits and signature hits are
+        recorded (HTML pattern stats are recorded by _match_patterns).
+        """
+        hits = []
+        seen = set()
+        headers = headers or {}
+
+        # Normalize headers to lowercase for matching
+        headers_lower = {k.lower(): v.lower() for k, v in headers.items()}
+        header_hits = self.header_index.match(headers_lower)
+
+        for sig in self.signatures:
+            if sig.name in seen:
+                continue
+
+            matched_patterns = [
+                pattern.source for pattern in sig.patterns if html_match(pattern)
+            ]
+            if header_hits and sig.headers:
+                matched_patterns.extend(
+                    f"header:{rule.source}" for rule in sig.headers
+                    if rule in header_hits
+                )
+            if profile is not None and headers_lower:
+                for rule in sig.headers:
+                    stats = _pattern_stats(profile, sig.name, f"header:{rule.source}")
+                    stats[RUNS] += 1
+                    stats[HITS] += rule in header_hits
+
+            if matched_patterns:
+                seen.add(sig.name)
+                hits.append((sig, matched_patterns))
+                if profile is not None:
+                    profile["signatures"][sig.name] = profile["signatures"].get(sig.name, 0) + 1
+
+        return hits
+
+
+def _pattern_stats(profile: Dict, name: str, source: str) -> List:
+    """The [runs, skips, hits, seconds] entry of a pattern in a profile."""
+    key = (name, source)
+    stats = profile["patterns"].get(key)
+    if stats is None:
+        stats = profile["patterns"][key] = [0, 0, 0, 0.0]
+    return stats
+
+
+class StreamScanner:
+    """
+    Incremental scan over a document that arrives in chunks.
+
+    Each chunk is searched together with the last `overlap` characters of the
+    previous one, so matches spanning a chunk boundary are still found as
+    long as they are shorter than the overlap. Patterns drop out once they
+    match; the scan is complete when every pattern has matched or a chunk
+    ends with the closing </html> tag, after which nothing can still match.
+    Searching at most one chunk plus the overlap also bounds what a risky
+    pattern can cost, so streamed scans are not given a budget.
+    """
+
+    def __init__(
+        self,
+        engine: SignatureEngine,
+        headers: Optional[Dict[str, str]],
+        overlap: int,
+        match: WindowMatcher
+    ):
+        self.engine = engine
+        self.headers = headers
+        self.overlap = overlap
+        self.match = match
+        self.chars_scanned = 0
+        self.done = False
+        self._tail = ""
+        self._matched: Set[PatternKey] = set()
+        self._pending: List[PatternKey] = [
+            (sig_index, pattern_index)
+            for sig_index, sig in enumerate(engine.signatures)
+            for pattern_index in range(len(sig.patterns))
+        ]
+
+    def feed(self, text: str) -> bool:
+        """
+        Scan the next chunk of the document.
+
+        Returns:
+            True once the scan is complete and no more input is needed
+        """
+        if self.done or not text:
+            return self.done
+
+        window = self._tail + text
+        self.chars_scanned += len(text)
+        matched = set(self.match(window, self._pending))
+        self._matched |= matched
+        self._pending = [key for key in self._pending if key not in matched]
+
+        self._tail = window[-self.overlap:]
+        self.done = not self._pending or window.rstrip()[-7:].lower() == "</html>"
+        return self.done
+
+    def finish(self) -> List[Tuple[CompiledSignature, List[str]]]:
+        """Return hits in the same form as SignatureEngine.scan."""
+        matched = {
+            self.engine.signatures[sig_index].patterns[pattern_index]
+            for sig_index, pattern_index in self._matched
+        }
+        return self.engine._collect(matched.__contains__, self.headers)
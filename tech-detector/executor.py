@@ -0,0 +1,367 @@
+"""
+Multi-process detection executor.
+Regex matching holds the GIL, so CPU-bound detection is run on a pool of
+worker processes that compile the signatures once at startup. The API,
+the spider and the bulk CLI all submit to it; a bounded number of pending
+documents gives callers backpressure instead of an unbounded queue.
+"""
+import asyncio
+import functools
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Tuple
+
+from detector import REGISTRY, detect_technologies, get_engine
+from engine import PatternKey, SignatureEngine, WindowMatcher
+from metrics import METRICS
+from profiling import PROFILER, new_profile
+
+# Worker processes per server process; 0 runs detection in-process. Every
+# gunicorn worker starts its own pool, so a host runs gunicorn workers times
+# DETECT_WORKERS detection processes; size the product to the CPU count.
+DETECT_WORKERS = int(os.environ.get("DETECT_WORKERS", 2))
+# Documents submitted but not yet finished before submitters have to wait
+DETECT_MAX_PENDING = int(os.environ.get("DETECT_MAX_PENDING", 64))
+# Seconds a submitter waits for a free slot before ExecutorBusy is raised
+DETECT_SUBMIT_TIMEOUT = float(os.environ.get("DETECT_SUBMIT_TIMEOUT", 10))
+# forkserver avoids forking the API process with its fetcher and reactor threads
+DETECT_START_METHOD = os.environ.get("DETECT_START_METHOD", "forkserver")
+
+
+class ExecutorBusy(Exception):
+    """Raised when no detection slot frees up within the submit timeout."""
+
+
+def _init_worker():
+    """
+    Compile the signatures when a worker starts rather than on its first document.
+
+    Workers only profile documents submitted with the profile flag, and send
+    those profiles back. Their own PROFILER is never read, so it is switched
+    off whatever SIGNATURE_PROFILING says.
+    """
+    PROFILER.enabled = False
+    get_engine()
+
+
+def detect_in_worker(
+    html: str,
+    headers: Optional[Dict[str, str]],
+    mode: Optional[str],
+    version: Optional[str],
+    profile: bool = False,
+    categories: Optional[Tuple[str, ...]] = None
+) -> Tuple[List[Dict], Optional[Dict], Dict]:
+    """
+    detect_technologies with the signature set the submitter used, reloading it if needed.
+
+    `categories` limits detection like SignatureEngine.subset; each worker
+    builds and keeps its own subsets.
+
+    Returns:
+        (technologies, profile, status); the profile is only recorded when
+        asked for and is merged into the submitting process's PROFILER
+    """
+    document_profile = new_profile() if profile else None
+    status: Dict = {}
+    technologies = detect_technologies(
+        html,
+        headers,
+        REGISTRY.ensure_version(version),
+        mode,
+        document_profile,
+        status,
+        categories=categories,
+    )
+    return technologies, document_profile, status
+
+
+def match_window_in_worker(
+    window: str,
+    pending: List[PatternKey],
+    version: Optional[str],
+    categories: Optional[Tuple[str, ...]] = None
+) -> List[PatternKey]:
+    """SignatureEngine.match_window with the signature set the submitter used."""
+    engine = REGISTRY.ensure_version(version)
+    if categories is not None:
+        engine = engine.subset(categories)
+    return engine.match_window(window, pending)
+
+
+def _unpack(
+    outcome: Tuple[List[Dict], Optional[Dict], Dict],
+    status: Optional[Dict]
+) -> List[Dict]:
+    """Merge a worker's profile and status into the caller's and return its technologies."""
+    technologies, profile, worker_status = outcome
+    if profile is not None:
+        PROFILER.merge(profile)
+    if status is not None:
+        status.update(worker_status)
+    return technologies
+
+
+class DetectionExecutor:
+    """
+    Process pool for detection with a cap on pending work.
+
+    `submit` blocks while `max_pending` documents are in flight and raises
+    ExecutorBusy if no slot frees up within the timeout.
+    """
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        max_pending: int = DETECT_MAX_PENDING,
+        start_method: str = DETECT_START_METHOD
+    ):
+        # Imported here: the process pool machinery is slow to import and
+        # only needed once detection is actually submitted
+        from concurrent.futures import ProcessPoolExecutor
+
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending
+        if start_method not in multiprocessing.get_all_start_methods():
+            start_method = "spawn"
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context(start_method),
+            initializer=_init_worker,
+        )
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def _release(self, _future: Future):
+        with self._lock:
+            self.pending -= 1
+            self.completed += 1
+        self._slots.release()
+
+    def submit(
+        self,
+        fn: Callable,
+        *args,
+        timeout: Optional[float] = DETECT_SUBMIT_TIMEOUT
+    ) -> Future:
+        """
+        Run fn(*args) in a worker process once a pending slot is free.
+
+        Args:
+            fn: Picklable module-level function
+            timeout: Seconds to wait for a slot; None waits indefinitely
+
+        Raises:
+            ExecutorBusy: if the pool stayed full for the whole timeout
+        """
+        if not self._slots.acquire(timeout=timeout):
+            with self._lock:
+                self.rejected += 1
+            raise ExecutorBusy(f"Detection queue full ({self.max_pending} pending)")
+
+        with self._lock:
+            self.pending += 1
+        try:
+            future = self._pool.submit(fn, *args)
+        except BaseException:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    def detect(
+        self,
+        html: str,
+        headers: Optional[Dict[str, str]] = None,
+        mode: Optional[str] = None,
+        version: Optional[str] = None,
+        status: Optional[Dict] = None,
+        categories: Optional[Tuple[str, ...]] = None
+    ) -> List[Dict]:
+        """
+        Detect technologies in a worker process and wait for the result.
+
+        Workers that are still on an older signature set than `version`
+        reload before detecting. `status` receives the detection status
+        and `categories` limits detection (see detect_technologies).
+        """
+        future = self.submit(
+            detect_in_worker, html, headers, mode, version, PROFILER.enabled, categories
+        )
+        return _unpack(future.result(), status)
+
+    async def detect_async(
+        self,
+        html: str,
+        headers: Optional[Dict[str, str]] = None,
+        mode: Optional[str] = None,
+        version: Optional[str] = None,
+        status: Optional[Dict] = None,
+        categories: Optional[Tuple[str, ...]] = None
+    ) -> List[Dict]:
+        """Awaitable `detect`; waiting for a slot happens off the event loop."""
+        loop = asyncio.get_running_loop()
+        future = await loop.run_in_executor(
+            None,
+            functools.partial(
+                self.submit,
+                detect_in_worker,
+                html,
+                headers,
+                mode,
+                version,
+                PROFILER.enabled,
+                categories,
+            ),
+        )
+        return _unpack(await asyncio.wrap_future(future), status)
+
+    def window_matcher(self, engine: SignatureEngine) -> WindowMatcher:
+        """
+        A StreamScanner `match` that searches each window in a worker process.
+
+        Workers use the signature set and category filter of `engine`. The
+        returned function blocks until the worker answers, so feed the
+        scanner off the event loop.
+        """
+        def match(window: str, pending: List[PatternKey]) -> List[PatternKey]:
+            return self.submit(
+                match_window_in_worker, window, pending, engine.version, engine.categories
+            ).result()
+
+        return match
+
+    def stats(self) -> Dict:
+        """Counters for monitoring."""
+        return {
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "pending": self.pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self):
+        """Stop the worker processes once pending work is done."""
+        self._pool.shutdown(wait=True)
+
+
+_executor: Optional[DetectionExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _register_pool_metrics():
+    """Expose the executor's stats, read at scrape time without starting the pool."""
+    def collect(field: str) -> Callable:
+        return lambda: _executor.stats()[field] if _executor is not None else None
+
+    for field, kind, documentation in (
+        ("workers", "gauge", "Detection worker processes"),
+        ("max_pending", "gauge", "Documents the detection pool accepts before submitters wait"),
+        ("pending", "gauge", "Documents queued or running in the detection pool"),
+        ("completed", "counter", "Documents the detection pool has finished"),
+        ("rejected", "counter", "Documents rejected because the detection pool stayed full"),
+    ):
+        suffix = f"{field}_total" if kind == "counter" else field
+        METRICS.collected(
+            f"tech_detector_detect_pool_{suffix}", documentation, kind, collect(field)
+        )
+
+
+_register_pool_metrics()
+PARTIAL_DETECTIONS = METRICS.counter(
+    "tech_detector_partial_detections_total",
+    "Documents whose detection budget ran out before every category was matched",
+)
+
+
+def get_executor() -> Optional[DetectionExecutor]:
+    """
+    Return the process-wide executor, or None when DETECT_WORKERS is 0.
+
+    Workers are started lazily, so pre-forking servers (gunicorn) get a pool
+    per worker process rather than sharing the parent's.
+    """
+    global _executor
+    if DETECT_WORKERS <= 0:
+        return None
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = DetectionExecutor(DETECT_WORKERS)
+    return _executor
+
+
+def pool_status() -> Dict:
+    """
+    The detection pool's state for health checks, without starting it.
+
+    "status" is "disabled" (DETECT_WORKERS=0), "not started" (workers start
+    on the first submission) or "running", with the pool's stats.
+    """
+    if DETECT_WORKERS <= 0:
+        return {"status": "disabled"}
+    executor = _executor
+    if executor is None:
+        return {"status": "not started", "workers": DETECT_WORKERS}
+    return {"status": "running", **executor.stats()}
+
+
+def run_detection(
+    html: str,
+    headers: Optional[Dict[str, str]] = None,
+    mode: Optional[str] = None,
+    engine: Optional[SignatureEngine] = None,
+    status: Optional[Dict] = None
+) -> List[Dict]:
+    """
+    detect_technologies on the shared pool, or in-process when it is disabled.
+
+    Pool workers match with the signature set of `engine` (defaults to the
+    active one), so results can be stamped with engine.version, and with
+    its category filter when it is a subset. `status` receives whether the
+    detection budget made the result partial.
+    """
+    engine = engine or get_engine()
+    status = {} if status is None else status
+    executor = get_executor()
+    if executor is None:
+        technologies = detect_technologies(html, headers, engine=engine, mode=mode, status=status)
+    else:
+        technologies = executor.detect(
+            html, headers, mode, engine.version, status, engine.categories
+        )
+    if status.get("partial"):
+        PARTIAL_DETECTIONS.inc()
+    return technologies
+
+
+async def run_detection_async(
+    html: str,
+    headers: Optional[Dict[str, str]] = None,
+    mode: Optional[str] = None,
+    engine: Optional[SignatureEngine] = None,
+    status: Optional[Dict] = None
+) -> List[Dict]:
+    """Awaitable run_detection; in-process detection runs on the loop's thread pool."""
+    engine = engine or get_engine()
+    status = {} if status is None else status
+    executor = get_executor()
+    if executor is None:
+        loop = asyncio.get_running_loop()
+        technologies = await loop.run_in_executor(
+            None,
+            functools.partial(detect_technologies, html, headers, engine, mode, status=status),
+        )
+    else:
+        technologies = await executor.detect_async(
+            html, headers, mode, engine.version, status, engine.categories
+        )
+    if status.get("partial"):
+        PARTIAL_DETECTIONS.inc()
+    return technologies
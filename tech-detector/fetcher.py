@@ -0,0 +1,607 @@
+"""
+Asynchronous page fetching for tech detection.
+One pooled httpx client per process, driven by a background event loop,
+so connections and TLS sessions are reused across requests and URLs.
+"""
+import asyncio
+import codecs
+import hashlib
+import importlib.util
+import os
+import queue
+import ssl
+import threading
+import time
+from datetime import datetime
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlparse
+
+import httpx
+
+from cache import CacheEntry, ResultCache, cache_key, register_cache_metrics
+from detector import (
+    analyze_tech_gaps,
+    filter_fields,
+    format_hits,
+    get_engine,
+    get_tech_summary,
+    partial_fields,
+)
+from engine import SignatureEngine
+from executor import get_executor, run_detection_async
+from metrics import METRICS
+
+# Streaming fetch: read bodies in chunks and stop at MAX_BODY_BYTES instead of
+# decoding the whole page into memory. Chunks are scanned as they arrive (in
+# a detection worker when there is a pool), stopping the download once
+# detection is complete; that takes every pattern matching or the closing
+# </html>, so it mostly saves what follows the markup.
+STREAM_FETCH = os.environ.get("STREAM_FETCH", "true").lower() == "true"
+MAX_BODY_BYTES = int(os.environ.get("MAX_BODY_BYTES", 5 * 1024 * 1024))
+STREAM_CHUNK_BYTES = 64 * 1024
+
+# Batch detection limits; the deadline stays under the Node client's 60s timeout
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", 10))
+BATCH_PER_HOST_CONCURRENCY = int(os.environ.get("BATCH_PER_HOST_CONCURRENCY", 2))
+BATCH_DEADLINE_SECONDS = float(os.environ.get("BATCH_DEADLINE_SECONDS", 50))
+
+# Streamed batches return results as they finish, so they can be larger and longer
+BATCH_STREAM_MAX_URLS = int(os.environ.get("BATCH_STREAM_MAX_URLS", 500))
+BATCH_STREAM_DEADLINE_SECONDS = float(os.environ.get("BATCH_STREAM_DEADLINE_SECONDS", 300))
+
+# Serve expired cache entries immediately and revalidate them in the background
+STALE_WHILE_REVALIDATE = os.environ.get("STALE_WHILE_REVALIDATE", "true").lower() == "true"
+
+# Connection pool sizing for the shared client
+FETCH_TIMEOUT_SECONDS = float(os.environ.get("FETCH_TIMEOUT_SECONDS", 15))
+FETCH_MAX_CONNECTIONS = int(os.environ.get("FETCH_MAX_CONNECTIONS", 100))
+FETCH_MAX_KEEPALIVE = int(os.environ.get("FETCH_MAX_KEEPALIVE", 20))
+FETCH_KEEPALIVE_EXPIRY = float(os.environ.get("FETCH_KEEPALIVE_EXPIRY", 30))
+
+# HTTP/2 needs the optional h2 package (pip install httpx[http2])
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+REQUEST_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.5",
+}
+
+INSECURE_REQUEST_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36",
+}
+
+FETCH_SECONDS = METRICS.histogram(
+    "tech_detector_fetch_seconds",
+    "Time spent fetching and reading pages, excluding detection",
+)
+FETCH_DETECT_SECONDS = METRICS.histogram(
+    "tech_detector_fetch_detect_seconds",
+    "Detection time of fetched pages, including any wait for the detection pool",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+FETCH_BYTES = METRICS.counter("tech_detector_fetch_bytes_total", "Response body bytes read")
+FETCHES = METRICS.counter(
+    "tech_detector_fetches_total",
+    "Page fetches by outcome (ok, timeout, ssl_error, error)",
+    ("outcome",),
+)
+SSL_FALLBACKS = METRICS.counter(
+    "tech_detector_ssl_fallbacks_total", "Fetches retried without TLS verification"
+)
+FETCHES_IN_FLIGHT = METRICS.gauge("tech_detector_fetches_in_flight", "Page fetches running")
+RESULTS = METRICS.counter(
+    "tech_detector_results_total",
+    "Fetched-URL results by cache outcome (hit, miss, revalidated, stale)",
+    ("cache",),
+)
+
+
+def normalize_url(url: str) -> str:
+    """Ensure URL has https scheme."""
+    if not url.startswith(("http://", "https://")):
+        url = f"https://{url}"
+    return url
+
+
+def failed_result(url: str, crawl_time: str, error: str) -> Dict:
+    """Build the result payload for a URL that could not be analyzed."""
+    return {
+        "success": False,
+        "url": url,
+        "final_url": None,
+        "status_code": None,
+        "technologies": [],
+        "tech_summary": {"total_detected": 0, "categories_found": 0, "by_category": {}},
+        "gap_analysis": analyze_tech_gaps([]),
+        "crawl_time": crawl_time,
+        "error": error,
+    }
+
+
+def conditional_headers(validators: Dict) -> Dict[str, str]:
+    """Build If-None-Match / If-Modified-Since headers from stored validators."""
+    headers = {}
+    if validators.get("etag"):
+        headers["If-None-Match"] = validators["etag"]
+    if validators.get("last_modified"):
+        headers["If-Modified-Since"] = validators["last_modified"]
+    return headers
+
+
+def is_current(result: Dict) -> bool:
+    """Whether a cached result was detected with the active signature set."""
+    return result.get("signature_version") == get_engine().version
+
+
+def _variant(categories: Optional[Tuple[str, ...]]) -> str:
+    """Result cache variant for a category filter ("" for full results)."""
+    return ",".join(categories) if categories is not None else ""
+
+
+def is_ssl_error(exc: BaseException) -> bool:
+    """Check whether a connection error was caused by TLS verification."""
+    while exc is not None:
+        if isinstance(exc, ssl.SSLError):
+            return True
+        exc = exc.__cause__ or exc.__context__
+    return False
+
+
+async def iter_body_text(
+    response: httpx.Response,
+    max_bytes: int,
+    digest=None
+) -> AsyncIterator[str]:
+    """
+    Yield decoded text chunks of a streamed response, up to max_bytes.
+
+    Args:
+        response: An httpx response opened with client.stream()
+        max_bytes: Maximum number of body bytes to read
+        digest: Optional hashlib object updated with every body byte read
+    """
+    try:
+        decoder = codecs.getincrementaldecoder(response.encoding or "utf-8")("replace")
+    except LookupError:
+        decoder = codecs.getincrementaldecoder("utf-8")("replace")
+
+    remaining = max_bytes
+    async for chunk in response.aiter_bytes(STREAM_CHUNK_BYTES):
+        chunk = chunk[:remaining]
+        remaining -= len(chunk)
+        FETCH_BYTES.inc(amount=len(chunk))
+        if digest is not None:
+            digest.update(chunk)
+        yield decoder.decode(chunk)
+        if remaining <= 0:
+            break
+
+    yield decoder.decode(b"", final=True)
+
+
+class AsyncFetcher:
+    """
+    Long-lived pooled HTTP client running on its own event loop thread.
+
+    Synchronous callers (Flask views, worker threads) hand coroutines to
+    `run`, which blocks until they finish on the shared loop.
+    """
+
+    def __init__(self):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever,
+            name="tech-detector-fetcher",
+            daemon=True,
+        )
+        self._thread.start()
+        self._clients: Dict[bool, httpx.AsyncClient] = {}
+        self._revalidating: Dict[str, asyncio.Future] = {}
+        self.cache = ResultCache()
+
+    def run(self, coro, timeout: Optional[float] = None):
+        """Run a coroutine on the fetcher loop and wait for its result."""
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result(timeout)
+
+    def iterate(self, agen: AsyncIterator) -> Iterator:
+        """
+        Drive an async iterator on the fetcher loop, yielding its items here.
+
+        Closing the returned generator early cancels the async iterator.
+        """
+        items: "queue.Queue" = queue.Queue()
+        done = object()
+
+        async def pump():
+            try:
+                async for item in agen:
+                    items.put(item)
+            except Exception as e:
+                items.put(e)
+            finally:
+                items.put(done)
+
+        future = asyncio.run_coroutine_threadsafe(pump(), self._loop)
+        try:
+            while True:
+                item = items.get()
+                if item is done:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            future.cancel()
+
+    def client(self, verify: bool = True) -> httpx.AsyncClient:
+        """Return the shared client, creating it on first use."""
+        if verify not in self._clients:
+            self._clients[verify] = httpx.AsyncClient(
+                http2=HTTP2_AVAILABLE,
+                verify=verify,
+                follow_redirects=True,
+                timeout=FETCH_TIMEOUT_SECONDS,
+                limits=httpx.Limits(
+                    max_connections=FETCH_MAX_CONNECTIONS,
+                    max_keepalive_connections=FETCH_MAX_KEEPALIVE,
+                    keepalive_expiry=FETCH_KEEPALIVE_EXPIRY,
+                ),
+            )
+        return self._clients[verify]
+
+    async def _detect(
+        self,
+        url: str,
+        verify: bool,
+        mode: Optional[str],
+        stream: bool,
+        engine: SignatureEngine,
+        previous: Optional[Dict] = None,
+        status: Optional[Dict] = None
+    ) -> Tuple[Optional[httpx.Response], List[Dict], Dict]:
+        """
+        Fetch a page and run detection, raising on network errors.
+
+        With a `previous` cache value the request is conditional, and its
+        detection is reused when the server answers 304 Not Modified (the
+        returned response is then None) or the body hash is unchanged.
+        `previous` must have been detected with the same signature set as
+        `engine`. Fetch and detection time are recorded separately, and
+        `status` receives the detection status (see detect_technologies).
+
+        Returns:
+            (response, technologies, validators)
+        """
+        loop = asyncio.get_running_loop()
+        client = self.client(verify)
+        headers = REQUEST_HEADERS if verify else INSECURE_REQUEST_HEADERS
+        old = previous["validators"] if previous else {}
+        if old:
+            headers = {**headers, **conditional_headers(old)}
+
+        started = time.perf_counter()
+        detect_seconds = 0.0
+        try:
+            async with client.stream("GET", url, headers=headers) as response:
+                response_headers = dict(response.headers)
+                validators = {
+                    "etag": response.headers.get("etag", old.get("etag")),
+                    "last_modified": response.headers.get(
+                        "last-modified", old.get("last_modified")
+                    ),
+                }
+
+                if previous and response.status_code == 304:
+                    validators["body_hash"] = old.get("body_hash")
+                    return None, previous["result"]["technologies"], validators
+
+                digest = hashlib.blake2b(digest_size=16)
+                if stream and not previous:
+                    executor = get_executor()
+                    scanner = engine.stream(
+                        response_headers,
+                        match=executor.window_matcher(engine) if executor else None,
+                    )
+                    async for text in iter_body_text(response, MAX_BODY_BYTES, digest):
+                        feed_started = time.perf_counter()
+                        complete = await loop.run_in_executor(None, scanner.feed, text)
+                        detect_seconds += time.perf_counter() - feed_started
+                        if complete:
+                            break
+                    validators["body_hash"] = digest.hexdigest()
+                    FETCH_DETECT_SECONDS.observe(detect_seconds)
+                    return response, format_hits(scanner.finish()), validators
+
+                # Read the whole (capped) body first so an unchanged one skips detection
+                if stream:
+                    html = "".join([
+                        text async for text in iter_body_text(response, MAX_BODY_BYTES, digest)
+                    ])
+                else:
+                    await response.aread()
+                    FETCH_BYTES.inc(amount=len(response.content))
+                    digest.update(response.content)
+                    html = response.text
+                validators["body_hash"] = digest.hexdigest()
+
+                if previous and validators["body_hash"] == old.get("body_hash"):
+                    return response, previous["result"]["technologies"], validators
+
+                detect_started = time.perf_counter()
+                technologies = await run_detection_async(
+                    html, response_headers, mode, engine, status
+                )
+                detect_seconds = time.perf_counter() - detect_started
+                FETCH_DETECT_SECONDS.observe(detect_seconds)
+        finally:
+            # Failed fetches count too: they held a connection and a batch slot
+            FETCH_SECONDS.observe(time.perf_counter() - started - detect_seconds)
+
+        return response, technologies, validators
+
+    async def fetch_and_detect(
+        self,
+        url: str,
+        mode: Optional[str] = None,
+        stream: Optional[bool] = None,
+        force_refresh: bool = False,
+        categories: Optional[Tuple[str, ...]] = None
+    ) -> Dict:
+        """
+        Detect a URL's technologies, serving from the result cache when fresh.
+
+        Expired entries are revalidated with a conditional request. With
+        STALE_WHILE_REVALIDATE the expired result is returned at once and
+        revalidated in the background instead.
+
+        The result carries "cache": "hit" (fresh cached result), "miss"
+        (fetched and detected now), "revalidated" (refetched, but the page
+        was unchanged so the cached detection was reused) or "stale"
+        (expired result served while or because refreshing failed).
+        Results detected with an older signature set are treated as expired.
+        Cached results report the requested `url`, even when they were stored
+        under another URL that shares the cache key (e.g. a redirect target).
+
+        Args:
+            url: URL to fetch
+            mode: Optional matching mode override (see engine.MODES); not used
+                when a streamed body is scanned incrementally (no detection pool)
+            stream: Read the body in size-capped chunks (defaults to STREAM_FETCH)
+            force_refresh: Ignore any cached result and fetch again
+            categories: Only detect these categories (see
+                detector.resolve_categories); cached separately from full results
+        """
+        cached = None if force_refresh else self.cache.lookup(url, _variant(categories))
+        if cached is not None:
+            if self.cache.is_fresh(cached) and is_current(cached.value["result"]):
+                RESULTS.inc("hit")
+                return {**cached.value["result"], "url": url, "cache": "hit"}
+            if STALE_WHILE_REVALIDATE:
+                self.revalidate_in_background(url, cached, mode, stream, categories)
+                RESULTS.inc("stale")
+                return {**cached.value["result"], "url": url, "cache": "stale"}
+
+        result = await self._refresh(url, cached, mode, stream, categories)
+        if not result["success"] and cached is not None:
+            RESULTS.inc("stale")
+            return {**cached.value["result"], "url": url, "cache": "stale"}
+        # Failed fetches have no cache field and count as misses
+        RESULTS.inc(result.get("cache", "miss"))
+        return result
+
+    def revalidate_in_background(
+        self,
+        url: str,
+        cached: CacheEntry,
+        mode: Optional[str],
+        stream: Optional[bool],
+        categories: Optional[Tuple[str, ...]] = None
+    ):
+        """Start refreshing an expired entry unless it is already being refreshed."""
+        key = cache_key(url, _variant(categories))
+        if key in self._revalidating:
+            return
+        task = asyncio.ensure_future(self._refresh(url, cached, mode, stream, categories))
+        self._revalidating[key] = task
+        task.add_done_callback(lambda _: self._revalidating.pop(key, None))
+
+    async def _refresh(
+        self,
+        url: str,
+        cached: Optional[CacheEntry],
+        mode: Optional[str],
+        stream: Optional[bool],
+        categories: Optional[Tuple[str, ...]] = None
+    ) -> Dict:
+        """Fetch a URL (conditionally if cached) and store a successful result."""
+        # A page is only worth revalidating if its detection would be reused
+        previous = cached.value if cached and is_current(cached.value["result"]) else None
+        result, validators = await self._fetch_and_detect(
+            url, mode, stream, previous, categories
+        )
+        if result["success"]:
+            self.cache.store(url, dict(result), validators, _variant(categories))
+        return result
+
+    async def _fetch_and_detect(
+        self,
+        url: str,
+        mode: Optional[str],
+        stream: Optional[bool],
+        previous: Optional[Dict] = None,
+        categories: Optional[Tuple[str, ...]] = None
+    ) -> Tuple[Dict, Dict]:
+        """Fetch a single URL and detect its technologies, bypassing the cache."""
+        normalized_url = normalize_url(url)
+        crawl_time = datetime.utcnow().isoformat()
+        stream = STREAM_FETCH if stream is None else stream
+        engine = get_engine()
+        if categories is not None:
+            engine = engine.subset(categories)
+        status: Dict = {}
+
+        FETCHES_IN_FLIGHT.inc()
+        try:
+            try:
+                response, technologies, validators = await self._detect(
+                    normalized_url, True, mode, stream, engine, previous, status
+                )
+            except httpx.ConnectError as e:
+                if not is_ssl_error(e):
+                    raise
+                # Retry without SSL verification
+                SSL_FALLBACKS.inc()
+                try:
+                    response, technologies, validators = await self._detect(
+                        normalized_url, False, mode, stream, engine, previous, status
+                    )
+                except Exception as retry_error:
+                    FETCHES.inc("ssl_error")
+                    return failed_result(url, crawl_time, f"SSL error: {str(retry_error)}"), {}
+        except httpx.TimeoutException:
+            FETCHES.inc("timeout")
+            return failed_result(url, crawl_time, "Request timeout"), {}
+        except Exception as e:
+            FETCHES.inc("error")
+            return failed_result(url, crawl_time, str(e)), {}
+        finally:
+            FETCHES_IN_FLIGHT.dec()
+        FETCHES.inc("ok")
+
+        reused = previous is not None and technologies is previous["result"]["technologies"]
+        if reused:
+            # A reused detection keeps its partial flag
+            status = previous["result"]
+        if response is None:
+            final_url = previous["result"]["final_url"]
+            status_code = previous["result"]["status_code"]
+        else:
+            final_url = str(response.url)
+            status_code = response.status_code
+
+        return {
+            "success": True,
+            "url": url,
+            "final_url": final_url,
+            "status_code": status_code,
+            "technologies": technologies,
+            "tech_summary": get_tech_summary(technologies),
+            "gap_analysis": analyze_tech_gaps(technologies, categories),
+            "crawl_time": crawl_time,
+            "error": None,
+            "signature_version": engine.version,
+            **filter_fields(categories),
+            **partial_fields(status),
+            "cache": "revalidated" if reused else "miss",
+        }, validators
+
+    async def iter_batch(
+        self,
+        urls: List[str],
+        concurrency: int = BATCH_CONCURRENCY,
+        per_host: int = BATCH_PER_HOST_CONCURRENCY,
+        deadline: float = BATCH_DEADLINE_SECONDS,
+        force_refresh: bool = False
+    ) -> AsyncIterator[Tuple[int, Dict]]:
+        """
+        Fetch and detect many URLs concurrently, yielding results as they finish.
+
+        At most `concurrency` URLs are in flight overall and at most `per_host`
+        per hostname. URLs still pending or running when the deadline passes
+        get a failed result instead of holding up the whole batch.
+
+        Args:
+            urls: URLs to analyze
+            concurrency: Global limit on concurrent fetches
+            per_host: Limit on concurrent fetches to the same host
+            deadline: Seconds allowed for the whole batch
+            force_refresh: Ignore cached results and fetch every URL again
+
+        Yields:
+            (input index, result) in completion order, each result with elapsed_ms
+        """
+        loop = asyncio.get_running_loop()
+        crawl_time = datetime.utcnow().isoformat()
+        ends_at = loop.time() + deadline
+        global_limit = asyncio.Semaphore(concurrency)
+        host_limits: Dict[str, asyncio.Semaphore] = {}
+
+        async def run_one(url: str) -> Dict:
+            host = urlparse(normalize_url(url)).hostname or url
+            host_limit = host_limits.setdefault(host, asyncio.Semaphore(per_host))
+            async with host_limit, global_limit:
+                started = time.monotonic()
+                result = await self.fetch_and_detect(url, force_refresh=force_refresh)
+                result["elapsed_ms"] = round((time.monotonic() - started) * 1000)
+                return result
+
+        indices = {asyncio.ensure_future(run_one(url)): index for index, url in enumerate(urls)}
+        pending = set(indices)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending,
+                    timeout=max(ends_at - loop.time(), 0),
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if not done:
+                    break
+                for task in done:
+                    yield indices[task], task.result()
+
+            for task in sorted(pending, key=indices.get):
+                task.cancel()
+                index = indices[task]
+                yield index, failed_result(urls[index], crawl_time, "Batch deadline exceeded")
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def run_batch(
+        self,
+        urls: List[str],
+        concurrency: int = BATCH_CONCURRENCY,
+        per_host: int = BATCH_PER_HOST_CONCURRENCY,
+        deadline: float = BATCH_DEADLINE_SECONDS,
+        force_refresh: bool = False
+    ) -> List[Dict]:
+        """
+        Fetch and detect many URLs concurrently (see iter_batch).
+
+        Returns:
+            One result per URL, in input order, each with elapsed_ms
+        """
+        results: List[Optional[Dict]] = [None] * len(urls)
+        async for index, result in self.iter_batch(
+            urls, concurrency, per_host, deadline, force_refresh
+        ):
+            results[index] = result
+        return results
+
+    def close(self):
+        """Close pooled connections and stop the loop."""
+        for client in self._clients.values():
+            self.run(client.aclose())
+        self._clients.clear()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+_fetcher: Optional[AsyncFetcher] = None
+_fetcher_lock = threading.Lock()
+register_cache_metrics("result", lambda: _fetcher.cache.lru if _fetcher is not None else None)
+
+
+def get_fetcher() -> AsyncFetcher:
+    """
+    Return the process-wide fetcher, starting it on first use.
+
+    Started lazily so pre-forking servers (gunicorn) get one loop and one
+    connection pool per worker process rather than a copy of the parent's.
+    """
+    global _fetcher
+    if _fetcher is None:
+        with _fetcher_lock:
+            if _fetcher is None:
+                _fetcher = AsyncFetcher()
+    return _fetcher
@@ -0,0 +1,456 @@
+"""
+Background detection jobs.
+Large URL lists are accepted as jobs, processed in chunks by worker threads
+and stored in a pluggable job store so callers can poll for progress.
+"""
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, List, Optional, Set
+
+try:
+    import redis
+except ImportError:  # Optional: only needed for JOB_STORE=redis
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+# "memory" keeps jobs in the process that accepted them, so with several
+# gunicorn workers a GET /jobs/<id> routed to another worker returns 404;
+# use "sqlite" (one host) or "redis" there
+JOB_STORE = os.environ.get("JOB_STORE", "memory")
+JOB_STORE_PATH = os.environ.get("JOB_STORE_PATH", "jobs.sqlite3")
+JOB_REDIS_URL = os.environ.get("JOB_REDIS_URL", "redis://localhost:6379/0")
+JOB_TTL_SECONDS = int(os.environ.get("JOB_TTL_SECONDS", 24 * 60 * 60))
+JOB_MAX_URLS = int(os.environ.get("JOB_MAX_URLS", 10000))
+JOB_CHUNK_SIZE = int(os.environ.get("JOB_CHUNK_SIZE", 50))
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 2))
+# Queued or running jobs not updated for this long were left behind by a
+# stopped process and are resumed by another (or the restarted) one. Live
+# processes refresh the jobs they hold every third of this interval.
+JOB_STALE_SECONDS = float(os.environ.get("JOB_STALE_SECONDS", 10 * 60))
+
+# Statuses of jobs that still have work to do
+UNFINISHED_STATUSES = ("queued", "running")
+
+
+class JobStore(ABC):
+    """
+    Interface for job persistence.
+
+    A job record is a dict with id, status, total, completed, failed,
+    created_at, updated_at and error. Results are stored per input index.
+    """
+
+    @abstractmethod
+    def create(self, job: Dict, urls: List[str]):
+        """Save a new job record and its URL list."""
+
+    @abstractmethod
+    def get(self, job_id: str) -> Optional[Dict]:
+        """Return the job record, or None if unknown or expired."""
+
+    @abstractmethod
+    def get_urls(self, job_id: str) -> List[str]:
+        """Return the URLs submitted with a job."""
+
+    @abstractmethod
+    def update(self, job_id: str, **fields):
+        """Update fields on a job record and bump updated_at."""
+
+    @abstractmethod
+    def add_results(self, job_id: str, start: int, results: List[Dict]):
+        """Store results for consecutive input indices starting at `start`."""
+
+    @abstractmethod
+    def get_results(self, job_id: str, offset: int, limit: int) -> List[Dict]:
+        """Return stored results with index in [offset, offset + limit)."""
+
+    @abstractmethod
+    def claim_stale(self, cutoff: float) -> List[str]:
+        """
+        Take over unfinished jobs last updated before `cutoff`.
+
+        Claimed jobs get a fresh updated_at, so no other process claims them
+        too. Returns the claimed job ids.
+        """
+
+
+class MemoryJobStore(JobStore):
+    """
+    In-process store; jobs are evicted once they are older than the TTL.
+
+    Jobs are only visible to the process that accepted them and are lost
+    when it stops, so this store only suits a single API process.
+    """
+
+    def __init__(self, ttl: int = JOB_TTL_SECONDS):
+        self.ttl = ttl
+        self._jobs: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def _evict_expired(self):
+        cutoff = time.time() - self.ttl
+        for job_id in [k for k, v in self._jobs.items() if v["job"]["updated_at"] < cutoff]:
+            del self._jobs[job_id]
+
+    def create(self, job: Dict, urls: List[str]):
+        with self._lock:
+            self._evict_expired()
+            self._jobs[job["id"]] = {"job": dict(job), "urls": list(urls), "results": {}}
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            self._evict_expired()
+            entry = self._jobs.get(job_id)
+            return dict(entry["job"]) if entry else None
+
+    def get_urls(self, job_id: str) -> List[str]:
+        with self._lock:
+            entry = self._jobs.get(job_id)
+            return list(entry["urls"]) if entry else []
+
+    def update(self, job_id: str, **fields):
+        with self._lock:
+            entry = self._jobs.get(job_id)
+            if entry:
+                entry["job"].update(fields, updated_at=time.time())
+
+    def add_results(self, job_id: str, start: int, results: List[Dict]):
+        with self._lock:
+            entry = self._jobs.get(job_id)
+            if entry:
+                for offset, result in enumerate(results):
+                    entry["results"][start + offset] = result
+
+    def get_results(self, job_id: str, offset: int, limit: int) -> List[Dict]:
+        with self._lock:
+            entry = self._jobs.get(job_id)
+            if not entry:
+                return []
+            return [
+                {"index": index, **entry["results"][index]}
+                for index in range(offset, offset + limit)
+                if index in entry["results"]
+            ]
+
+    def claim_stale(self, cutoff: float) -> List[str]:
+        # Jobs stop with the process that runs them; there is nobody to take over from
+        return []
+
+
+class SqliteJobStore(JobStore):
+    """On-disk store that survives restarts; expired jobs are purged on write."""
+
+    def __init__(self, path: str = JOB_STORE_PATH, ttl: int = JOB_TTL_SECONDS):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                urls TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS job_results (
+                job_id TEXT NOT NULL,
+                idx INTEGER NOT NULL,
+                result TEXT NOT NULL,
+                PRIMARY KEY (job_id, idx)
+            );
+        """)
+
+    def _evict_expired(self):
+        cutoff = time.time() - self.ttl
+        expired = [row[0] for row in self._conn.execute(
+            "SELECT id FROM jobs WHERE updated_at < ?", (cutoff,)
+        )]
+        for job_id in expired:
+            self._conn.execute("DELETE FROM job_results WHERE job_id = ?", (job_id,))
+            self._conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def create(self, job: Dict, urls: List[str]):
+        with self._lock, self._conn:
+            self._evict_expired()
+            self._conn.execute(
+                "INSERT INTO jobs (id, data, urls, updated_at) VALUES (?, ?, ?, ?)",
+                (job["id"], json.dumps(job), json.dumps(urls), job["updated_at"]),
+            )
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data, updated_at FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if not row or row[1] < time.time() - self.ttl:
+            return None
+        return json.loads(row[0])
+
+    def get_urls(self, job_id: str) -> List[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT urls FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else []
+
+    def update(self, job_id: str, **fields):
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT data FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if not row:
+                return
+            job = json.loads(row[0])
+            job.update(fields, updated_at=time.time())
+            self._conn.execute(
+                "UPDATE jobs SET data = ?, updated_at = ? WHERE id = ?",
+                (json.dumps(job), job["updated_at"], job_id),
+            )
+
+    def add_results(self, job_id: str, start: int, results: List[Dict]):
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO job_results (job_id, idx, result) VALUES (?, ?, ?)",
+                [(job_id, start + i, json.dumps(r)) for i, r in enumerate(results)],
+            )
+
+    def get_results(self, job_id: str, offset: int, limit: int) -> List[Dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT idx, result FROM job_results WHERE job_id = ? AND idx >= ? AND idx < ? "
+                "ORDER BY idx",
+                (job_id, offset, offset + limit),
+            ).fetchall()
+        return [{"index": idx, **json.loads(result)} for idx, result in rows]
+
+    def claim_stale(self, cutoff: float) -> List[str]:
+        claimed = []
+        with self._lock, self._conn:
+            rows = self._conn.execute(
+                "SELECT id, data, updated_at FROM jobs WHERE updated_at < ? AND updated_at >= ?",
+                (cutoff, time.time() - self.ttl),
+            ).fetchall()
+            for job_id, data, updated_at in rows:
+                job = json.loads(data)
+                if job["status"] not in UNFINISHED_STATUSES:
+                    continue
+                job["updated_at"] = time.time()
+                # Conditional on updated_at, so only one of several processes wins
+                cursor = self._conn.execute(
+                    "UPDATE jobs SET data = ?, updated_at = ? WHERE id = ? AND updated_at = ?",
+                    (json.dumps(job), job["updated_at"], job_id, updated_at),
+                )
+                if cursor.rowcount == 1:
+                    claimed.append(job_id)
+        return claimed
+
+
+class RedisJobStore(JobStore):
+    """Store for any Redis-protocol server; expiry is left to Redis key TTLs."""
+
+    def __init__(self, url: str = JOB_REDIS_URL, ttl: int = JOB_TTL_SECONDS):
+        if redis is None:
+            raise RuntimeError("JOB_STORE=redis requires the 'redis' package")
+        self.ttl = ttl
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+
+    def _keys(self, job_id: str):
+        prefix = f"tech-detector:job:{job_id}"
+        return f"{prefix}:meta", f"{prefix}:urls", f"{prefix}:results"
+
+    def create(self, job: Dict, urls: List[str]):
+        meta, urls_key, _ = self._keys(job["id"])
+        pipe = self._redis.pipeline()
+        pipe.set(meta, json.dumps(job), ex=self.ttl)
+        pipe.set(urls_key, json.dumps(urls), ex=self.ttl)
+        pipe.execute()
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        data = self._redis.get(self._keys(job_id)[0])
+        return json.loads(data) if data else None
+
+    def get_urls(self, job_id: str) -> List[str]:
+        data = self._redis.get(self._keys(job_id)[1])
+        return json.loads(data) if data else []
+
+    def update(self, job_id: str, **fields):
+        meta, urls_key, results_key = self._keys(job_id)
+        job = self.get(job_id)
+        if job is None:
+            return
+        job.update(fields, updated_at=time.time())
+        pipe = self._redis.pipeline()
+        pipe.set(meta, json.dumps(job), ex=self.ttl)
+        pipe.expire(urls_key, self.ttl)
+        pipe.expire(results_key, self.ttl)
+        pipe.execute()
+
+    def add_results(self, job_id: str, start: int, results: List[Dict]):
+        results_key = self._keys(job_id)[2]
+        pipe = self._redis.pipeline()
+        pipe.hset(results_key, mapping={
+            str(start + i): json.dumps(r) for i, r in enumerate(results)
+        })
+        pipe.expire(results_key, self.ttl)
+        pipe.execute()
+
+    def get_results(self, job_id: str, offset: int, limit: int) -> List[Dict]:
+        indices = [str(i) for i in range(offset, offset + limit)]
+        values = self._redis.hmget(self._keys(job_id)[2], indices) if indices else []
+        return [
+            {"index": int(idx), **json.loads(value)}
+            for idx, value in zip(indices, values)
+            if value is not None
+        ]
+
+    def claim_stale(self, cutoff: float) -> List[str]:
+        claimed = []
+        for meta in self._redis.scan_iter(match="tech-detector:job:*:meta"):
+            job_id = meta.split(":")[2]
+            job = self.get(job_id)
+            if job is None or job["status"] not in UNFINISHED_STATUSES:
+                continue
+            if job["updated_at"] >= cutoff:
+                continue
+            # Short-lived claim key, so only one of several processes wins
+            if self._redis.set(f"tech-detector:job:{job_id}:claim", "1", nx=True, ex=60):
+                self.update(job_id)
+                claimed.append(job_id)
+        return claimed
+
+
+def create_store(kind: str = JOB_STORE) -> JobStore:
+    """Build the job store selected by JOB_STORE."""
+    if kind == "memory":
+        return MemoryJobStore()
+    if kind == "sqlite":
+        return SqliteJobStore()
+    if kind == "redis":
+        return RedisJobStore()
+    raise ValueError(f"Unknown job store: {kind}")
+
+
+class JobManager:
+    """
+    Accepts detection jobs and processes them on background worker threads.
+
+    Each job's URLs are handed to `process_batch` JOB_CHUNK_SIZE at a time,
+    and results are written to the store as each chunk completes.
+
+    A watcher thread refreshes updated_at of the jobs this process holds
+    and, with a persistent store, resumes jobs that stopped being refreshed
+    (their process stopped, e.g. on a restart) after the last completed
+    chunk.
+    """
+
+    def __init__(
+        self,
+        store: JobStore,
+        process_batch: Callable[[List[str]], List[Dict]],
+        workers: int = JOB_WORKERS,
+        chunk_size: int = JOB_CHUNK_SIZE,
+        stale_after: float = JOB_STALE_SECONDS
+    ):
+        self.store = store
+        self.process_batch = process_batch
+        self.chunk_size = chunk_size
+        self.stale_after = stale_after
+        self._queue: "queue.Queue[str]" = queue.Queue()
+        # Jobs queued or running in this process
+        self._held: Set[str] = set()
+        self._held_lock = threading.Lock()
+        self._workers = [
+            threading.Thread(target=self._work, name=f"tech-detector-job-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+        threading.Thread(target=self._watch, name="tech-detector-job-watch", daemon=True).start()
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of jobs waiting for a worker."""
+        return self._queue.qsize()
+
+    def submit(self, urls: List[str]) -> Dict:
+        """Register a job and queue it for processing."""
+        now = time.time()
+        job = {
+            "id": uuid.uuid4().hex,
+            "status": "queued",
+            "total": len(urls),
+            "completed": 0,
+            "failed": 0,
+            "created_at": now,
+            "updated_at": now,
+            "error": None,
+        }
+        self.store.create(job, urls)
+        self._enqueue(job["id"])
+        return job
+
+    def recover(self) -> List[str]:
+        """
+        Refresh the jobs held by this process and resume abandoned ones.
+
+        Returns:
+            Ids of the jobs taken over from stopped processes
+        """
+        with self._held_lock:
+            held = list(self._held)
+        for job_id in held:
+            self.store.update(job_id)
+
+        resumed = [
+            job_id for job_id in self.store.claim_stale(time.time() - self.stale_after)
+            if job_id not in held
+        ]
+        for job_id in resumed:
+            self._enqueue(job_id)
+        return resumed
+
+    def _enqueue(self, job_id: str):
+        with self._held_lock:
+            self._held.add(job_id)
+        self._queue.put(job_id)
+
+    def _watch(self):
+        while True:
+            try:
+                self.recover()
+            except Exception:
+                logger.exception("Job recovery failed")
+            time.sleep(self.stale_after / 3)
+
+    def _work(self):
+        while True:
+            job_id = self._queue.get()
+            try:
+                self._run(job_id)
+            except Exception as e:
+                self.store.update(job_id, status="failed", error=str(e))
+            finally:
+                with self._held_lock:
+                    self._held.discard(job_id)
+                self._queue.task_done()
+
+    def _run(self, job_id: str):
+        job = self.store.get(job_id)
+        if job is None:
+            return
+        urls = self.store.get_urls(job_id)
+        self.store.update(job_id, status="running")
+
+        # A resumed job continues after its last completed chunk
+        completed, failed = job["completed"], job["failed"]
+        for start in range(completed, len(urls), self.chunk_size):
+            results = self.process_batch(urls[start:start + self.chunk_size])
+            self.store.add_results(job_id, start, results)
+            completed += len(results)
+            failed += sum(1 for r in results if not r.get("success"))
+            self.store.update(job_id, completed=completed, failed=failed)
+
+        self.store.update(job_id, status="completed")
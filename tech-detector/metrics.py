@@ -0,0 +1,280 @@
+"""
+Prometheus metrics for capacity planning.
+Counters and histograms are cheap enough to leave on under full load: each
+thread updates its own shard (a plain dict) without taking a lock, and the
+shards are only summed when /metrics is scraped. Values that already exist
+elsewhere (pool and cache stats, queue depths) are read at scrape time.
+
+Values are per process; with several gunicorn workers each one reports
+its own, so scrape them individually or aggregate per instance.
+"""
+import math
+import threading
+from bisect import bisect_left
+from typing import Callable, Dict, List, Sequence, Tuple
+
+# Prometheus text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Request and fetch latencies, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+Labels = Tuple[str, ...]
+
+
+class ThreadShards:
+    """
+    Per-thread value dicts, summed on read.
+
+    Only the owning thread writes to a shard, so updates need no lock. A
+    shard is registered once per thread, and shards of finished threads
+    are folded into one retired dict so thread-per-request servers do not
+    grow the list forever.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards: List[Tuple[threading.Thread, Dict]] = []
+        self._retired: Dict = {}
+        self._fold_at = 64
+
+    def local(self) -> Dict:
+        """This thread's shard."""
+        try:
+            return self._local.values
+        except AttributeError:
+            values = self._local.values = {}
+            with self._lock:
+                self._shards.append((threading.current_thread(), values))
+                if len(self._shards) >= self._fold_at:
+                    self._fold()
+                    self._fold_at = max(64, 2 * len(self._shards))
+            return values
+
+    def _fold(self):
+        live = []
+        for thread, values in self._shards:
+            if thread.is_alive():
+                live.append((thread, values))
+            else:
+                _add(self._retired, values)
+        self._shards = live
+
+    def total(self) -> Dict:
+        """Sum of all shards, keyed by label values."""
+        with self._lock:
+            self._fold()
+            totals: Dict = {}
+            _add(totals, self._retired)
+            for _, values in self._shards:
+                # dict() copies in one step, so a concurrent insert cannot break iteration
+                _add(totals, dict(values))
+        return totals
+
+
+def _add(target: Dict, values: Dict):
+    """Add counter values (numbers) or histogram values (lists) into `target`."""
+    for labels, value in values.items():
+        if isinstance(value, list):
+            totals = target.get(labels)
+            if totals is None:
+                target[labels] = list(value)
+            else:
+                for i, item in enumerate(value):
+                    totals[i] += item
+        else:
+            target[labels] = target.get(labels, 0) + value
+
+
+class Counter:
+    """Monotonic count, optionally split by label values."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._shards = ThreadShards()
+
+    def inc(self, *labels: str, amount: float = 1):
+        """Add `amount` to the series for the given label values (in labelnames order)."""
+        values = self._shards.local()
+        values[labels] = values.get(labels, 0) + amount
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        return [
+            (self.name, dict(zip(self.labelnames, labels)), value)
+            for labels, value in sorted(self._shards.total().items())
+        ]
+
+
+class Gauge(Counter):
+    """Value that goes up and down, e.g. work in flight."""
+
+    kind = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1):
+        """Subtract `amount`; shards may go negative, only their sum is meaningful."""
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram:
+    """
+    Distribution of observed values in fixed buckets.
+
+    Each series is stored as [count per bucket..., count above the last
+    bucket, sum]; buckets are made cumulative when rendered.
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._shards = ThreadShards()
+
+    def observe(self, value: float, *labels: str):
+        """Record one value for the given label values."""
+        values = self._shards.local()
+        series = values.get(labels)
+        if series is None:
+            series = values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        samples = []
+        for labels, series in sorted(self._shards.total().items()):
+            base = dict(zip(self.labelnames, labels))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), series):
+                cumulative += count
+                samples.append((f"{self.name}_bucket", {**base, "le": bound}, cumulative))
+            samples.append((f"{self.name}_sum", base, series[-1]))
+            samples.append((f"{self.name}_count", base, cumulative))
+        return samples
+
+
+class Collected:
+    """
+    Metric read from existing state when scraped.
+
+    `collect` returns {label values: value}, or a single number for a
+    metric without labels.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        kind: str,
+        collect: Callable,
+        labelnames: Sequence[str] = ()
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self.collect = collect
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        values = self.collect()
+        if values is None:
+            return []
+        if not isinstance(values, dict):
+            values = {(): values}
+        return [
+            (self.name, dict(zip(self.labelnames, labels)), value)
+            for labels, value in sorted(values.items())
+        ]
+
+
+class MetricSet:
+    """Named metrics of one process, rendered together for /metrics."""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already defined")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def collected(
+        self,
+        name: str,
+        documentation: str,
+        kind: str,
+        collect: Callable,
+        labelnames: Sequence[str] = ()
+    ) -> Collected:
+        return self._register(Collected(name, documentation, kind, collect, labelnames))
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {_escape(metric.documentation, help_text=True)}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str, help_text: bool = False) -> str:
+    value = value.replace("\\", "\\\\").replace("\n", "\\n")
+    return value if help_text else value.replace('"', '\\"')
+
+
+def _format_labels(labels: Dict) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(
+        f'{name}="{_escape(_format_value(value) if name == "le" else str(value))}"'
+        for name, value in labels.items()
+    )
+    return "{" + pairs + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+# Shared by every module that records metrics; rendered by the API's /metrics
+METRICS = MetricSet()
@@ -0,0 +1,152 @@
+"""
+Opt-in per-pattern and per-signature profiling for detection.
+With profiling on, every scan records how often each pattern ran, how often
+the prefilter skipped it, how often it matched and how long it took. Scans
+fill a plain dict (see new_profile) that is merged into the process-wide
+PROFILER, including profiles sent back by detection pool workers.
+"""
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+# Record pattern timings for every scan; can also be toggled at runtime
+SIGNATURE_PROFILING = os.environ.get("SIGNATURE_PROFILING", "false").lower() == "true"
+
+# Report sort keys, see SignatureProfiler.report
+SORT_KEYS = ("seconds", "mean_us", "runs", "skips", "hits", "hit_rate")
+
+# Indices into the per-pattern [runs, skips, hits, seconds] lists
+RUNS, SKIPS, HITS, SECONDS = range(4)
+
+
+def new_profile() -> Dict:
+    """
+    Empty profile for one or more scans.
+
+    Keys:
+        documents: Number of scans recorded
+        seconds: Total scan time
+        patterns: (signature name, pattern source) -> [runs, skips, hits, seconds];
+            header rules use "header:<rule>" as the source
+        signatures: signature name -> documents the signature matched
+        alternations: category -> seconds spent in alternation mode passes
+    """
+    return {"documents": 0, "seconds": 0.0, "patterns": {}, "signatures": {}, "alternations": {}}
+
+
+def merge_profile(target: Dict, profile: Dict):
+    """Add the counts and timings of `profile` to `target`."""
+    target["documents"] += profile["documents"]
+    target["seconds"] += profile["seconds"]
+    for key, stats in profile["patterns"].items():
+        totals = target["patterns"].get(key)
+        if totals is None:
+            target["patterns"][key] = list(stats)
+        else:
+            for i, value in enumerate(stats):
+                totals[i] += value
+    for name, hits in profile["signatures"].items():
+        target["signatures"][name] = target["signatures"].get(name, 0) + hits
+    for category, seconds in profile["alternations"].items():
+        target["alternations"][category] = target["alternations"].get(category, 0.0) + seconds
+
+
+class SignatureProfiler:
+    """
+    Process-wide profile, aggregated across threads and pool workers.
+
+    Scans record into their own dict without locking; only the merge of a
+    finished document takes the lock.
+    """
+
+    def __init__(self, enabled: bool = SIGNATURE_PROFILING):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Drop everything recorded so far."""
+        with self._lock:
+            self._profile = new_profile()
+            self.started_at = time.time()
+
+    def merge(self, profile: Dict):
+        """Add a finished scan's profile."""
+        with self._lock:
+            merge_profile(self._profile, profile)
+
+    def report(
+        self,
+        by: str = "pattern",
+        sort: str = "seconds",
+        ascending: bool = False,
+        limit: Optional[int] = 50
+    ) -> Dict:
+        """
+        Summarize the profile per pattern or per signature.
+
+        Args:
+            by: "pattern" or "signature"
+            sort: One of SORT_KEYS; hit_rate is hits per document for
+                signatures and hits per regex run for patterns
+            ascending: Sort lowest first, e.g. to find patterns that never hit
+            limit: Maximum number of rows (None for all)
+
+        Returns:
+            Dict with documents, seconds, sorted rows and alternation timings
+        """
+        with self._lock:
+            documents = self._profile["documents"]
+            seconds = self._profile["seconds"]
+            patterns = {key: list(stats) for key, stats in self._profile["patterns"].items()}
+            signature_hits = dict(self._profile["signatures"])
+            alternations = dict(self._profile["alternations"])
+
+        if by == "signature":
+            totals: Dict[str, List] = {}
+            for (name, _source), stats in patterns.items():
+                row = totals.setdefault(name, [0, 0, 0, 0.0])
+                for i, value in enumerate(stats):
+                    row[i] += value
+            rows = [
+                _row({"signature": name}, stats, signature_hits.get(name, 0), documents)
+                for name, stats in totals.items()
+            ]
+        else:
+            rows = [
+                _row({"signature": name, "pattern": source}, stats, stats[HITS], stats[RUNS])
+                for (name, source), stats in patterns.items()
+            ]
+
+        rows.sort(key=lambda row: row[sort], reverse=not ascending)
+        return {
+            "enabled": self.enabled,
+            "since": self.started_at,
+            "documents": documents,
+            "seconds": round(seconds, 6),
+            "by": by,
+            "sort": sort,
+            "rows": rows[:limit] if limit is not None else rows,
+            "alternations": {
+                category: round(value, 6) for category, value in alternations.items()
+            },
+        }
+
+
+def _row(row: Dict, stats: List, hits: int, attempts: int) -> Dict:
+    """Report row for one pattern or signature."""
+    runs, skips, _, seconds = stats
+    row.update({
+        "runs": runs,
+        "skips": skips,
+        "hits": hits,
+        "hit_rate": round(hits / attempts, 4) if attempts else 0.0,
+        "seconds": round(seconds, 6),
+        "mean_us": round(seconds / runs * 1e6, 2) if runs else 0.0,
+    })
+    return row
+
+
+# Shared by the API, the spider and the detection pool (see executor.detect_in_worker)
+PROFILER = SignatureProfiler()
@@ -0,0 +1,223 @@
+"""
+Hot-reloadable signature sets.
+The built-in set from signatures.py can be extended or overridden by JSON
+files under SIGNATURES_PATH. A watcher thread polls those files, builds the
+new engine off the request path and swaps it in with a single assignment,
+so adding a technology does not need a redeploy of the API workers.
+"""
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from bundle import load_engine
+from engine import SignatureEngine
+from signatures import TECH_SIGNATURES
+
+logger = logging.getLogger(__name__)
+
+# JSON file, or directory of *.json files, merged over the built-in signatures
+SIGNATURES_PATH = os.environ.get("SIGNATURES_PATH", "")
+# Seconds between checks for changed signature files; 0 only reloads on request
+SIGNATURES_RELOAD_INTERVAL = float(os.environ.get("SIGNATURES_RELOAD_INTERVAL", 30))
+
+
+def signature_files(path: str) -> List[str]:
+    """The JSON files a SIGNATURES_PATH value refers to, in load order."""
+    if not path:
+        return []
+    if os.path.isdir(path):
+        return sorted(glob.glob(os.path.join(path, "*.json")))
+    return [path]
+
+
+def source_fingerprint(path: str) -> Tuple:
+    """Names, sizes and mtimes of the signature files, to notice edits without reading them."""
+    fingerprint = []
+    for name in signature_files(path):
+        try:
+            stat = os.stat(name)
+        except FileNotFoundError:
+            continue
+        fingerprint.append((name, stat.st_mtime_ns, stat.st_size))
+    return tuple(fingerprint)
+
+
+def validate_signature(sig, source: str) -> Dict:
+    """
+    Check that a signature read from a file has the shape of signatures.py entries.
+
+    Raises:
+        ValueError: naming the file and signature at fault
+    """
+    if not isinstance(sig, dict) or not isinstance(sig.get("name"), str):
+        raise ValueError(f"{source}: every signature needs a string 'name'")
+    if not isinstance(sig.get("category"), str):
+        raise ValueError(f"{source}: {sig['name']} needs a string 'category'")
+    for field in ("patterns", "headers"):
+        patterns = sig.get(field, [])
+        if not isinstance(patterns, list) or not all(isinstance(p, str) for p in patterns):
+            raise ValueError(f"{source}: {sig['name']} '{field}' must be a list of strings")
+    return {
+        "name": sig["name"],
+        "category": sig["category"],
+        "patterns": sig.get("patterns", []),
+        "headers": sig.get("headers", []),
+    }
+
+
+def read_signatures(path: str) -> List[Dict]:
+    """
+    Built-in signatures merged with the ones in the files under `path`.
+
+    Each file holds a JSON list of signature dicts (or {"signatures": [...]}).
+    Files are applied in name order, and a signature replaces any earlier
+    one with the same name.
+
+    Raises:
+        OSError, ValueError: if a file cannot be read or is malformed
+    """
+    merged = {sig["name"]: sig for sig in TECH_SIGNATURES}
+    for name in signature_files(path):
+        with open(name, encoding="utf-8") as handle:
+            try:
+                data = json.load(handle)
+            except ValueError as e:
+                raise ValueError(f"{name}: {e}") from e
+        if isinstance(data, dict):
+            data = data.get("signatures")
+        if not isinstance(data, list):
+            raise ValueError(f"{name}: expected a list of signatures")
+        for sig in data:
+            sig = validate_signature(sig, name)
+            merged[sig["name"]] = sig
+    return list(merged.values())
+
+
+class SignatureRegistry:
+    """
+    Owns the active SignatureEngine and replaces it when the signature files change.
+
+    `engine` always refers to a fully built engine. Callers should read it
+    once per document, so a reload in the middle of a scan cannot mix two
+    signature sets. A set that fails to load is reported in `last_error`
+    and the previous engine stays active.
+    """
+
+    def __init__(
+        self,
+        path: str = SIGNATURES_PATH,
+        mode: str = "prefilter",
+        interval: float = SIGNATURES_RELOAD_INTERVAL
+    ):
+        self.path = path
+        self.mode = mode
+        self.interval = interval
+        self.reloads = 0
+        self.last_error: Optional[str] = None
+        self._lock = threading.Lock()
+        self._watcher_pid: Optional[int] = None
+        self._fingerprint = source_fingerprint(path)
+
+        try:
+            signatures = read_signatures(path)
+        except (OSError, ValueError) as e:
+            logger.error("Could not load signatures from %s, using built-ins: %s", path, e)
+            self.last_error = str(e)
+            signatures = TECH_SIGNATURES
+        self.engine: SignatureEngine = load_engine(signatures, mode=mode)
+        self.loaded_at = time.time()
+
+    def reload(self, force: bool = False) -> bool:
+        """
+        Rebuild the engine if the signature files changed (or always, with `force`).
+
+        The new engine is built and warmed in the calling thread while
+        requests keep using the current one.
+
+        Returns:
+            True if a different signature set is now active
+        """
+        with self._lock:
+            fingerprint = source_fingerprint(self.path)
+            if not force and fingerprint == self._fingerprint:
+                return False
+            # Remembered even on failure, so a broken file is retried once it is edited
+            self._fingerprint = fingerprint
+
+            try:
+                engine = load_engine(read_signatures(self.path), mode=self.mode)
+            except (OSError, ValueError) as e:
+                logger.error("Keeping signature set %s: %s", self.engine.version, e)
+                self.last_error = str(e)
+                return False
+
+            self.last_error = None
+            if engine.version == self.engine.version:
+                return False
+
+            previous, self.engine = self.engine, engine
+            self.loaded_at = time.time()
+            self.reloads += 1
+            logger.info(
+                "Signature set %s replaced %s (%d signatures)",
+                engine.version, previous.version, len(engine.signatures),
+            )
+            return True
+
+    def ensure_version(self, version: Optional[str]) -> SignatureEngine:
+        """
+        Return the engine, reloading first if it is not at `version`.
+
+        Pool workers use this to follow the set the submitting process has
+        already switched to, without running a watcher of their own.
+        """
+        engine = self.engine
+        if version is not None and engine.version != version:
+            self.reload()
+            engine = self.engine
+        return engine
+
+    def watch(self):
+        """
+        Start polling the signature files in a daemon thread.
+
+        Safe to call repeatedly (e.g. per request): a thread is started once
+        per process, so forked servers get their own watcher.
+        """
+        if not self.path or self.interval <= 0 or self._watcher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._watcher_pid == os.getpid():
+                return
+            self._watcher_pid = os.getpid()
+        threading.Thread(
+            target=self._watch_loop,
+            name="tech-detector-signatures",
+            daemon=True,
+        ).start()
+
+    def _watch_loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.reload()
+            except Exception:
+                logger.exception("Signature reload failed")
+
+    def status(self) -> Dict:
+        """Active version and reload state for monitoring."""
+        return {
+            "version": self.engine.version,
+            "source": self.path or "signatures.py",
+            "files": len(self._fingerprint),
+            "loaded_at": datetime.utcfromtimestamp(self.loaded_at).isoformat(),
+            "reloads": self.reloads,
+            "watching": self._watcher_pid == os.getpid(),
+            "reload_interval": self.interval,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,155 @@
+"""
+Response encoding for the API.
+Field projection (?fields=), MessagePack content negotiation and gzip/brotli
+compression, so batch callers only pay for the parts of a result they use.
+"""
+import gzip
+import json
+import os
+import zlib
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+from flask import Response, request
+
+try:
+    import msgpack
+except ImportError:  # Optional: without it every response is JSON
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:  # Optional: without it compression is gzip only
+    brotli = None
+
+# Responses smaller than this are not worth compressing
+RESPONSE_COMPRESS_MIN_BYTES = int(os.environ.get("RESPONSE_COMPRESS_MIN_BYTES", 1024))
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 4
+
+MSGPACK_MIMETYPES = ("application/msgpack", "application/x-msgpack")
+COMPRESSIBLE_MIMETYPES = ("application/json", "application/x-ndjson") + MSGPACK_MIMETYPES
+
+
+def parse_fields(spec: Optional[str]) -> Optional[Dict]:
+    """
+    Parse a projection like "url,technologies.name" into a nested dict.
+
+    Returns:
+        {"url": None, "technologies": {"name": None}}, or None for no projection
+    """
+    if not spec:
+        return None
+    tree: Dict = {}
+    for path in spec.split(","):
+        node = tree
+        parts = [p for p in path.strip().split(".") if p]
+        for i, part in enumerate(parts):
+            if i == len(parts) - 1:
+                node[part] = None
+            else:
+                child = node.get(part)
+                if child is None:
+                    child = node[part] = {}
+                node = child
+    return tree or None
+
+
+def project(value: Any, fields: Optional[Dict]) -> Any:
+    """Keep only the projected fields of a value; lists are projected per item."""
+    if fields is None:
+        return value
+    if isinstance(value, list):
+        return [project(item, fields) for item in value]
+    if isinstance(value, dict):
+        return {key: project(value[key], sub) for key, sub in fields.items() if key in value}
+    return value
+
+
+def request_fields() -> Optional[Dict]:
+    """Projection requested with the `fields` query parameter."""
+    return parse_fields(request.args.get("fields"))
+
+
+def wants_msgpack() -> bool:
+    """Whether the client prefers MessagePack over JSON (and we can produce it)."""
+    if msgpack is None:
+        return False
+    best = request.accept_mimetypes.best_match(("application/json",) + MSGPACK_MIMETYPES)
+    return best in MSGPACK_MIMETYPES
+
+
+def render(payload: Any, status: int = 200) -> Response:
+    """Serialize a payload as MessagePack or JSON, following the Accept header."""
+    if wants_msgpack():
+        return Response(msgpack.packb(payload), status=status, mimetype="application/msgpack")
+    return Response(
+        json.dumps(payload, separators=(",", ":")),
+        status=status,
+        mimetype="application/json",
+    )
+
+
+def render_stream(items: Iterable[Any]) -> Response:
+    """Stream items as NDJSON lines, or as concatenated MessagePack objects."""
+    if wants_msgpack():
+        body = (msgpack.packb(item) for item in items)
+        return Response(body, mimetype="application/msgpack")
+    body = ((json.dumps(item, separators=(",", ":")) + "\n").encode("utf-8") for item in items)
+    return Response(body, mimetype="application/x-ndjson")
+
+
+def _stream_compressed(chunks: Iterable[bytes], encoding: str) -> Iterator[bytes]:
+    """Compress a streamed body, flushing after every chunk so lines arrive promptly."""
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        for chunk in chunks:
+            out = compressor.process(chunk) + compressor.flush()
+            if out:
+                yield out
+        yield compressor.finish()
+    else:
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        for chunk in chunks:
+            out = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            if out:
+                yield out
+        yield compressor.flush()
+
+
+def compress_response(response: Response) -> Response:
+    """
+    Compress JSON, NDJSON and MessagePack responses per Accept-Encoding.
+
+    Registered as an after_request hook. Brotli is preferred when the
+    client accepts it and the brotli package is installed.
+    """
+    if (
+        response.mimetype not in COMPRESSIBLE_MIMETYPES
+        or response.status_code < 200
+        or response.status_code in (204, 304)
+        or "Content-Encoding" in response.headers
+    ):
+        return response
+
+    offered = ("br", "gzip") if brotli is not None else ("gzip",)
+    encoding = request.accept_encodings.best_match(offered)
+    response.vary.add("Accept-Encoding")
+    response.vary.add("Accept")
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = _stream_compressed(response.response, encoding)
+        response.headers.pop("Content-Length", None)
+    else:
+        body = response.get_data()
+        if len(body) < RESPONSE_COMPRESS_MIN_BYTES:
+            return response
+        if encoding == "br":
+            body = brotli.compress(body, quality=BROTLI_QUALITY)
+        else:
+            body = gzip.compress(body, compresslevel=GZIP_LEVEL)
+        response.set_data(body)
+
+    response.headers["Content-Encoding"] = encoding
+    return response
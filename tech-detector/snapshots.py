@@ -0,0 +1,213 @@
+"""
+Persistent detection snapshots per domain.
+Every successful scan is compared with the domain's previous snapshot and
+stored in SQLite together with what changed, so consumers can pull small
+diffs (technologies added/removed, gap score delta) instead of full results.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+from cache import cache_key
+
+SNAPSHOTS_ENABLED = os.environ.get("SNAPSHOTS_ENABLED", "true").lower() == "true"
+SNAPSHOT_STORE_PATH = os.environ.get("SNAPSHOT_STORE_PATH", "snapshots.sqlite3")
+
+
+def diff_technologies(old: List[Dict], new: List[Dict]) -> Dict:
+    """
+    Compare two technology lists by name.
+
+    Returns:
+        Dict with "added" and "removed" lists of {"name", "category"}
+    """
+    old_names = {t["name"] for t in old}
+    new_names = {t["name"] for t in new}
+    return {
+        "added": [t for t in new if t["name"] not in old_names],
+        "removed": [t for t in old if t["name"] not in new_names],
+    }
+
+
+class SnapshotStore:
+    """
+    SQLite-backed history of detection results per domain.
+
+    A scan that finds the same technologies as the latest snapshot only
+    bumps that snapshot's last_seen_at, so rows are only written when
+    something actually changed.
+    """
+
+    def __init__(self, path: str = SNAPSHOT_STORE_PATH):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS snapshots (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                domain TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_seen_at REAL NOT NULL,
+                technologies TEXT NOT NULL,
+                gap_score INTEGER NOT NULL,
+                signature_version TEXT,
+                added TEXT NOT NULL,
+                removed TEXT NOT NULL,
+                gap_score_delta INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS snapshots_domain ON snapshots (domain, id);
+            CREATE INDEX IF NOT EXISTS snapshots_created ON snapshots (created_at);
+        """)
+
+    @staticmethod
+    def _row_to_snapshot(row) -> Dict:
+        return {
+            "id": row[0],
+            "domain": row[1],
+            "created_at": row[2],
+            "last_seen_at": row[3],
+            "technologies": json.loads(row[4]),
+            "gap_score": row[5],
+            "signature_version": row[6],
+            "added": json.loads(row[7]),
+            "removed": json.loads(row[8]),
+            "gap_score_delta": row[9],
+        }
+
+    def _latest(self, domain: str, before: Optional[float] = None) -> Optional[Dict]:
+        query = "SELECT * FROM snapshots WHERE domain = ?"
+        params = [domain]
+        if before is not None:
+            query += " AND created_at <= ?"
+            params.append(before)
+        row = self._conn.execute(query + " ORDER BY id DESC LIMIT 1", params).fetchone()
+        return self._row_to_snapshot(row) if row else None
+
+    def record(
+        self,
+        url: str,
+        result: Dict,
+        signature_version: Optional[str] = None
+    ) -> Optional[Dict]:
+        """
+        Store a successful detection result as the domain's newest snapshot.
+
+        Args:
+            url: URL the result was requested for
+            result: Detection result as returned by the API
+            signature_version: Version of the signature set that produced it
+
+        Returns:
+            The new or refreshed snapshot, or None for failed results
+        """
+        if not result.get("success"):
+            return None
+
+        domain = cache_key(url)
+        technologies = [
+            {"name": t["name"], "category": t["category"]}
+            for t in result.get("technologies", [])
+        ]
+        gap_score = result["gap_analysis"]["gap_score"]
+        now = time.time()
+
+        with self._lock, self._conn:
+            previous = self._latest(domain)
+            changes = diff_technologies(previous["technologies"] if previous else [], technologies)
+
+            if previous and not changes["added"] and not changes["removed"]:
+                self._conn.execute(
+                    "UPDATE snapshots SET last_seen_at = ? WHERE id = ?", (now, previous["id"])
+                )
+                return {**previous, "last_seen_at": now}
+
+            gap_score_delta = gap_score - previous["gap_score"] if previous else 0
+            self._conn.execute(
+                "INSERT INTO snapshots (domain, created_at, last_seen_at, technologies, gap_score, "
+                "signature_version, added, removed, gap_score_delta) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    domain, now, now, json.dumps(technologies), gap_score, signature_version,
+                    json.dumps(changes["added"]), json.dumps(changes["removed"]), gap_score_delta,
+                ),
+            )
+            return self._latest(domain)
+
+    def history(self, url: str, limit: int = 20) -> List[Dict]:
+        """Return a domain's snapshots, newest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM snapshots WHERE domain = ? ORDER BY id DESC LIMIT ?",
+                (cache_key(url), limit),
+            ).fetchall()
+        return [self._row_to_snapshot(row) for row in rows]
+
+    def diff(self, url: str, since: Optional[float] = None) -> Optional[Dict]:
+        """
+        Compare a domain's latest snapshot with an earlier one.
+
+        Args:
+            url: Domain or URL to look up
+            since: Compare against the snapshot current at this epoch time
+                (defaults to the snapshot before the latest)
+
+        Returns:
+            Diff dict, or None if the domain has never been scanned
+        """
+        domain = cache_key(url)
+        with self._lock:
+            latest = self._latest(domain)
+            if latest is None:
+                return None
+            if since is None:
+                row = self._conn.execute(
+                    "SELECT * FROM snapshots WHERE domain = ? AND id < ? ORDER BY id DESC LIMIT 1",
+                    (domain, latest["id"]),
+                ).fetchone()
+                base = self._row_to_snapshot(row) if row else None
+            else:
+                base = self._latest(domain, before=since)
+
+        changes = diff_technologies(base["technologies"] if base else [], latest["technologies"])
+        return {
+            "domain": domain,
+            "from_snapshot": base["id"] if base else None,
+            "to_snapshot": latest["id"],
+            "changed": bool(changes["added"] or changes["removed"]),
+            "added": changes["added"],
+            "removed": changes["removed"],
+            "gap_score": latest["gap_score"],
+            "gap_score_delta": latest["gap_score"] - base["gap_score"] if base else 0,
+            "signature_version": latest["signature_version"],
+            "last_seen_at": latest["last_seen_at"],
+        }
+
+    def changes(self, since: float, limit: int = 100) -> List[Dict]:
+        """
+        Return snapshots that changed something, recorded after `since`, oldest first.
+
+        Each snapshot carries its own added/removed/gap_score_delta against
+        the one before it, so this is a feed of incremental updates.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM snapshots WHERE created_at > ? ORDER BY created_at, id LIMIT ?",
+                (since, limit),
+            ).fetchall()
+        return [self._row_to_snapshot(row) for row in rows]
+
+
+_store: Optional[SnapshotStore] = None
+_store_lock = threading.Lock()
+
+
+def get_snapshot_store() -> SnapshotStore:
+    """Return the process-wide snapshot store, opening it on first use."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = SnapshotStore()
+    return _store
@@ -15,4 +15,8 @@ class TechDetectionItem(scrapy.Item):
     gap_analysis = scrapy.Field()
     response_headers = scrapy.Field()
     crawl_time = scrapy.Field()
+    signature_version = scrapy.Field()  # Signature set that produced `technologies`
+    partial = scrapy.Field()  # Detection budget ran out (see skipped_categories)
+    skipped_categories = scrapy.Field()
+    elapsed_ms = scrapy.Field()  # From scheduling the request to the item, like batch results
     error = scrapy.Field()
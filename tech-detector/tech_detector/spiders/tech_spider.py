@@ -3,6 +3,7 @@ Scrapy spider for detecting website technology stacks.
 """
 import sys
 import os
+import time
 from datetime import datetime
 from urllib.parse import urlparse
 
@@ -13,7 +14,8 @@ from scrapy.http import Response
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
-from detector import detect_technologies, analyze_tech_gaps, get_tech_summary
+from detector import analyze_tech_gaps, get_engine, get_tech_summary, partial_fields
+from executor import run_detection_async
 from tech_detector.items import TechDetectionItem
 
 
@@ -31,15 +33,18 @@ class TechSpider(scrapy.Spider):
         Initialize spider with URLs to crawl.
 
         Args:
-            urls: Comma-separated list of URLs or single URL
+            urls: Comma-separated list of URLs, single URL, or list of URLs
         """
         super().__init__(*args, **kwargs)
-        self.results = []
+        self.processed = 0
+
+        if isinstance(urls, str):
+            urls = urls.split(",")
 
         if urls:
             self.start_urls = [
                 self.normalize_url(url.strip())
-                for url in urls.split(",")
+                for url in urls
                 if url.strip()
             ]
         else:
@@ -54,7 +59,12 @@ class TechSpider(scrapy.Spider):
 
     def spider_closed(self, spider):
         """Called when spider finishes."""
-        self.logger.info(f"Spider closed. Processed {len(self.results)} URLs.")
+        self.logger.info(f"Spider closed. Processed {self.processed} URLs.")
+
+    @staticmethod
+    def elapsed_ms(meta: dict) -> int:
+        """Milliseconds since a URL's request was first scheduled, across redirects and retries."""
+        return round((time.monotonic() - meta["started_at"]) * 1000)
 
     @staticmethod
     def normalize_url(url: str) -> str:
@@ -63,6 +73,11 @@ class TechSpider(scrapy.Spider):
             url = f"https://{url}"
         return url
 
+    async def start(self):
+        """Entry point for Scrapy >= 2.13, which no longer calls start_requests."""
+        for request in self.start_requests():
+            yield request
+
     def start_requests(self):
         """Generate initial requests for all URLs."""
         for url in self.start_urls:
@@ -72,14 +87,17 @@ class TechSpider(scrapy.Spider):
                 errback=self.handle_error,
                 meta={
                     "original_url": url,
+                    # Redirected and retried requests keep the meta, so this is per URL
+                    "started_at": time.monotonic(),
                     "dont_redirect": False,
-                    "handle_httpstatus_list": [301, 302, 303, 307, 308, 403, 404, 500],
+                    # Redirects are left to RedirectMiddleware so we analyze the final page
+                    "handle_httpstatus_list": [403, 404, 500],
                 },
             )
 
-    def parse(self, response: Response):
+    async def parse(self, response: Response):
         """
-        Parse response and detect technologies.
+        Parse response and detect technologies on the shared detection pool.
 
         Args:
             response: Scrapy Response object
@@ -99,7 +117,9 @@ class TechSpider(scrapy.Spider):
         html = response.text if hasattr(response, "text") else ""
 
         # Detect technologies
-        technologies = detect_technologies(html, headers)
+        engine = get_engine()
+        status = {}
+        technologies = await run_detection_async(html, headers, engine=engine, status=status)
 
         # Analyze gaps
         gap_analysis = analyze_tech_gaps(technologies)
@@ -116,10 +136,13 @@ class TechSpider(scrapy.Spider):
             gap_analysis=gap_analysis,
             response_headers=headers,
             crawl_time=crawl_time,
+            signature_version=engine.version,
+            **partial_fields(status),
+            elapsed_ms=self.elapsed_ms(response.meta),
             error=None,
         )
 
-        self.results.append(dict(item))
+        self.processed += 1
         yield item
 
     def handle_error(self, failure):
@@ -142,8 +165,10 @@ class TechSpider(scrapy.Spider):
             },
             response_headers={},
             crawl_time=datetime.utcnow().isoformat(),
+            signature_version=None,
+            elapsed_ms=self.elapsed_ms(request.meta),
             error=str(failure.value),
         )
 
-        self.results.append(dict(item))
+        self.processed += 1
         yield item
@@ -0,0 +1,40 @@
+"""
+Tests for the benchmark's baseline comparison.
+"""
+import copy
+
+import pytest
+
+from benchmark import compare, regressed, run
+
+
+@pytest.fixture(scope="module")
+def reports():
+    return [run([], ["small"], ["prefilter"], repeat=5) for _ in range(2)]
+
+
+def test_compare_with_identical_run_finds_no_regressions(reports):
+    report, baseline = reports
+    assert compare(report, baseline, 0.25) == []
+
+
+def test_compare_flags_a_slower_signature(reports):
+    report, baseline = reports
+    baseline = copy.deepcopy(baseline)
+    slowest = baseline["signatures"][0]
+    slowest["ms"] = slowest["ms"] / 10
+    slowest["spread_ms"] = 0.0
+    report = copy.deepcopy(report)
+    for cost in report["signatures"]:
+        if cost["name"] == slowest["name"]:
+            cost["ms"] = max(cost["ms"], 1.0)
+            cost["spread_ms"] = 0.0
+
+    regressions = compare(report, baseline, 0.25)
+    assert [r for r in regressions if r.startswith(f"signature {slowest['name']}:")]
+
+
+def test_regressed_requires_more_than_noise():
+    assert regressed(20.0, 10.0, 0.25)
+    assert not regressed(20.0, 10.0, 0.25, noise=12.0)
+    assert not regressed(10.4, 10.0, 0.25)
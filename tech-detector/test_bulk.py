@@ -0,0 +1,26 @@
+"""
+Tests for reading stored pages in bulk.
+"""
+import json
+
+from bulk import iter_records
+
+
+def test_iter_jsonl_skips_and_counts_malformed_lines(tmp_path):
+    path = tmp_path / "pages.jsonl"
+    path.write_bytes(b"\n".join([
+        json.dumps({"url": "https://a.example", "html": "<html>jquery</html>"}).encode(),
+        b'{"url": "https://broken.example", "html": "<ht',
+        b"",
+        b"[1, 2]",
+        b"\xff\xfe",
+        json.dumps({"url": "https://b.example", "html": "", "status_code": 404}).encode(),
+    ]))
+
+    counts = {}
+    records = list(iter_records(str(path), counts))
+    assert [(url, status) for url, _, _, status, _ in records] == [
+        ("https://a.example", None),
+        ("https://b.example", 404),
+    ]
+    assert counts == {"malformed": 3}
@@ -0,0 +1,41 @@
+"""
+Tests for result and analysis cache keys.
+"""
+import pytest
+
+from cache import cache_key, document_key
+
+
+@pytest.mark.parametrize("url", [
+    "example.com",
+    "Example.COM",
+    "https://www.example.com/",
+    "http://example.com",
+    "https://example.com:443/",
+    "http://example.com:80",
+    "https://example.com/?utm_source=x#top",
+])
+def test_cache_key_normalizes_to_the_domain(url):
+    assert cache_key(url) == "example.com"
+
+
+def test_cache_key_keeps_what_names_another_resource():
+    assert cache_key("https://example.com:8443/") == "example.com:8443"
+    assert cache_key("http://example.com:443") == "example.com:443"
+    assert cache_key("https://example.com/shop/") == "example.com/shop"
+    assert cache_key("https://example.com:bad/") == "example.com"
+    assert cache_key("example.com", variant="CRM,Chat") == "example.com#CRM,Chat"
+
+
+def test_document_key_ignores_header_case_and_order():
+    html = "<html>jquery</html>"
+    key = document_key(html, {"Server": "Cloudflare", "X-Powered-By": "PHP"}, "v1")
+    assert document_key(html, {"x-powered-by": "php", "SERVER": "cloudflare"}, "v1") == key
+    assert document_key(html, {"Server": "nginx", "X-Powered-By": "PHP"}, "v1") != key
+    assert document_key(html, {"Server": "Cloudflare", "X-Powered-By": "PHP"}, "v2") != key
+    assert document_key(html + " ", {"Server": "Cloudflare", "X-Powered-By": "PHP"}, "v1") != key
+
+
+def test_document_key_separates_headers_from_html():
+    assert document_key("b", {"a": ""}, "v1") != document_key("", {"a": "b"}, "v1")
+    assert document_key("", None, "v1") == document_key("", {}, "v1")
@@ -0,0 +1,98 @@
+"""
+Tests that every matching mode agrees with plain per-pattern matching.
+"""
+import random
+import re
+
+import pytest
+
+from detector import detect_technologies
+from engine import MODES, SignatureEngine
+from signatures import CATEGORY_PRIORITY, TECH_SIGNATURES
+
+HEADER_SETS = (
+    {},
+    {"Server": "cloudflare", "CF-RAY": "8a1b2c3d4e5f-AMS"},
+    {"Via": "1.1 fastly", "X-Served-By": "cache-ams21"},
+    {"X-Powered-By": "WordPress"},
+    {"X-Drupal-Cache": "HIT", "X-Generator": "Drupal 10"},
+    {"X-Magento-Tags": "cat_p"},
+)
+
+FILLER = (
+    "<div>", "</div>", '<span class="price">', "$19.99", "<script>", "</script>",
+    "function(e){return e&&e.t}", "https://", "var a=b||{};", "\n", " ", ".",
+)
+
+
+def reference_detect(html, headers):
+    """What detect_technologies returned before the compiled engine: every pattern, in order."""
+    headers_str = " ".join(f"{k.lower()}: {v.lower()}" for k, v in (headers or {}).items())
+    detected = []
+    for sig in TECH_SIGNATURES:
+        matched = [p for p in sig["patterns"] if re.search(p, html, re.IGNORECASE)]
+        matched += [
+            f"header:{p}" for p in sig.get("headers", [])
+            if re.search(p, headers_str, re.IGNORECASE)
+        ]
+        if not matched:
+            continue
+        count = len(matched)
+        score = 0.95 if count >= 3 else 0.85 if count >= 2 else 0.70
+        detected.append({
+            "name": sig["name"],
+            "category": sig["category"],
+            "confidence": "high" if count >= 2 else "medium",
+            "confidence_score": score,
+            "match_count": count,
+            "patterns_matched": matched[:3],
+        })
+    detected.sort(key=lambda t: (CATEGORY_PRIORITY.get(t["category"], 99), -t["confidence_score"]))
+    return detected
+
+
+def sample_text(pattern):
+    """Rough text a pattern matches, so pages hit (and nearly hit) real signatures."""
+    text = re.sub(r"\\d(\{[\d,]+\}|[+*])?", "7", pattern)
+    text = re.sub(r"\[[^\]]*\](\{[\d,]+\}|[+*?])?", "x", text)
+    text = text.replace(r"\s*", " ").replace(r"\s+", " ").replace(".*", " xx ")
+    return re.sub(r"\\(.)", r"\1", text)
+
+
+def make_pages(count=12, size=8000, seed=1):
+    rnd = random.Random(seed)
+    samples = [sample_text(p) for sig in TECH_SIGNATURES for p in sig["patterns"]]
+    pages = []
+    for _ in range(count):
+        parts = []
+        while sum(map(len, parts)) < size:
+            if rnd.random() < 0.03:
+                sample = rnd.choice(samples)
+                parts.append(sample.upper() if rnd.random() < 0.5 else sample)
+            else:
+                parts.append(rnd.choice(FILLER))
+        pages.append(("".join(parts), dict(rnd.choice(HEADER_SETS))))
+    pages.append((" ".join(samples), {"Server": "cloudflare"}))
+    pages.append((" ".join(samples).upper(), {"X-Powered-By": "WordPress"}))
+    pages.append(("", {}))
+    return pages
+
+
+PAGES = make_pages()
+
+
+@pytest.fixture(scope="module")
+def engine():
+    return SignatureEngine(TECH_SIGNATURES)
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_modes_agree_with_per_pattern_matching(engine, mode):
+    for html, headers in PAGES:
+        expected = reference_detect(html, headers)
+        assert detect_technologies(html, headers, engine=engine, mode=mode) == expected
+
+
+def test_pages_cover_most_signatures():
+    detected = {t["name"] for html, headers in PAGES for t in reference_detect(html, headers)}
+    assert len(detected) > 0.8 * len(TECH_SIGNATURES)
@@ -0,0 +1,61 @@
+"""
+Tests for the compiled signature engine.
+"""
+import time
+
+import pytest
+
+from engine import EXPONENTIAL, POLYNOMIAL, SignatureEngine, pattern_risk
+
+
+@pytest.mark.parametrize("pattern", [
+    r"(a+)+",
+    r"(?:a*)*",
+    r"(a*b*)*",
+    r"(x+x+)+y",
+    r"(\w+\s?)+$",
+    r"((ab)+)+",
+    r"^(a|a)*$",
+    r"^(ab|[a-z]b)*$",
+])
+def test_pattern_risk_rejects_exponential_patterns(pattern):
+    assert pattern_risk(pattern)[0] == EXPONENTIAL
+
+
+@pytest.mark.parametrize("pattern", [
+    r"(a+b+)+",
+    r"([a-z0-9-]+\.)+myshopify\.com",
+    r"(\.[a-z]+)+",
+    r"(?:\d|x)+",
+    r"(a|[ab])+",
+    r"js\.hs-scripts\.com",
+])
+def test_pattern_risk_keeps_unambiguous_repeats(pattern):
+    assert pattern_risk(pattern) is None
+
+
+@pytest.mark.parametrize("pattern", [
+    r"(a+ab)+",
+    r"cdn\.jsdelivr\.net.*bootstrap",
+])
+def test_pattern_risk_rates_possible_backtracking_polynomial(pattern):
+    assert pattern_risk(pattern)[0] == POLYNOMIAL
+
+
+def test_exponential_patterns_are_rejected_before_matching():
+    signatures = [
+        {"name": "Bad", "category": "Analytics", "patterns": [r"(x+x+)+y", r"(a*b*)*z"]},
+        {"name": "Good", "category": "Analytics", "patterns": [r"x{3}"]},
+    ]
+    engine = SignatureEngine(signatures, mode="regex")
+    assert [(r["name"], r["pattern"]) for r in engine.rejected] == [
+        ("Bad", r"(x+x+)+y"),
+        ("Bad", r"(a*b*)*z"),
+    ]
+
+    started = time.perf_counter()
+    status = {}
+    matched = engine.scan("x" * 24 + "a" * 24, budget=0.05, status=status)
+    assert time.perf_counter() - started < 1
+    assert [sig.name for sig, _ in matched] == ["Good"]
+    assert not status["partial"]
@@ -0,0 +1,64 @@
+"""
+Tests for job persistence, stale-job claims and resuming.
+"""
+import time
+
+import pytest
+
+from jobs import JobManager, SqliteJobStore
+
+
+def make_job(job_id, status, age, total=5, completed=0):
+    updated_at = time.time() - age
+    return {
+        "id": job_id,
+        "status": status,
+        "total": total,
+        "completed": completed,
+        "failed": 0,
+        "created_at": updated_at,
+        "updated_at": updated_at,
+        "error": None,
+    }
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "jobs.sqlite3")
+
+
+def test_claim_stale_takes_only_abandoned_unfinished_jobs(path):
+    store = SqliteJobStore(path)
+    store.create(make_job("abandoned", "running", age=3600), ["https://a.example"])
+    store.create(make_job("queued", "queued", age=3600), ["https://b.example"])
+    store.create(make_job("live", "running", age=1), ["https://c.example"])
+    store.create(make_job("done", "completed", age=3600), ["https://d.example"])
+
+    cutoff = time.time() - 600
+    assert sorted(store.claim_stale(cutoff)) == ["abandoned", "queued"]
+    # Claimed jobs were refreshed, so another process finds nothing left
+    assert SqliteJobStore(path).claim_stale(cutoff) == []
+
+
+def test_manager_resumes_a_stale_job_after_its_last_chunk(path):
+    urls = [f"https://{i}.example" for i in range(5)]
+    store = SqliteJobStore(path)
+    store.create(make_job("job", "running", age=3600, completed=2), urls)
+    store.add_results("job", 0, [{"url": url, "success": True} for url in urls[:2]])
+
+    batches = []
+
+    def process_batch(chunk):
+        batches.append(chunk)
+        return [{"url": url, "success": url != urls[4]} for url in chunk]
+
+    JobManager(SqliteJobStore(path), process_batch, workers=1, chunk_size=2, stale_after=600)
+    deadline = time.time() + 10
+    while store.get("job")["status"] != "completed" and time.time() < deadline:
+        time.sleep(0.05)
+
+    job = store.get("job")
+    assert job["status"] == "completed"
+    assert (job["completed"], job["failed"]) == (5, 1)
+    assert batches == [urls[2:4], urls[4:]]
+    assert [r["index"] for r in store.get_results("job", 0, 10)] == list(range(5))